@@ -1,31 +1,88 @@
 import argparse
-import subprocess
+import math
 import os
 import sys
 from pathlib import Path
 from datetime import datetime
 
-def add_music(input_dir, music_dir, output_dir):
+import media_catalog
+from build_manifest import BuildManifest
+from combinations import add_selection_arguments, select_combinations, selection_from_args
+from parallel_jobs import FFmpegJob, run_ffmpeg_jobs
+from stage_error import StageError
+
+# Loudness targets for normalized mixes: the voice at VOICE_LUFS, the music bed MUSIC_BED_LU below it
+VOICE_LUFS = -16.0
+MUSIC_BED_LU = 14.0
+TRUE_PEAK = -1.5
+# Ducking: the music is compressed while the voice (sidechain) is above about -30 dBFS
+DUCK_FILTER = "sidechaincompress=threshold=0.03:ratio=4:attack=20:release=350"
+
+def normalize_gain(loudness, target):
+    """
+    Linear gain (dB) that brings a track measured at `loudness` (see media_catalog.loudness)
+    to `target` LUFS, capped so its true peak stays under TRUE_PEAK. Silence gets no gain.
+    """
+    if not math.isfinite(loudness["integrated"]):
+        return 0.0
+    return min(target - loudness["integrated"], TRUE_PEAK - loudness["true_peak"])
+
+def music_mix_filter(voice="[0:a]", music="[1:a]", out="[aout]", voice_loudness=None, music_loudness=None, duck=False):
+    """
+    Mixes the voice track with music; output length follows the voice track.
+    Without measurements the music is mixed at reduced volume (20%). Given both tracks' cached
+    loudness, each gets one linear gain instead (the voice to VOICE_LUFS, the music MUSIC_BED_LU
+    below it), so every combination comes out at the same level without a second analysis pass.
+    With duck=True the music is also compressed while the voice is speaking.
+    """
+    name = out.strip("[]")
+    chains = []
+    weights = "1 0.2"
+    if voice_loudness and music_loudness:
+        chains.append(f"{voice}volume={normalize_gain(voice_loudness, VOICE_LUFS):.2f}dB[{name}_voice]")
+        chains.append(f"{music}volume={normalize_gain(music_loudness, VOICE_LUFS - MUSIC_BED_LU):.2f}dB[{name}_music]")
+        voice, music = f"[{name}_voice]", f"[{name}_music]"
+        weights = "1 1:normalize=0"
+    if duck:
+        chains.append(f"{voice}asplit=2[{name}_mix][{name}_key]")
+        chains.append(f"{music}[{name}_key]{DUCK_FILTER}[{name}_ducked]")
+        voice, music = f"[{name}_mix]", f"[{name}_ducked]"
+    chains.append(f"{voice}{music}amix=inputs=2:duration=first:weights={weights}{out}")
+    return ";".join(chains)
+
+def add_music(input_dir, music_dir, output_dir, jobs=1, voiceover=None, incremental=False, selection=None, normalize=False, duck=False):
     """
     Adds music to videos, generating ALL combinations (Cartesian product).
     Saves to a timestamped subfolder in output_dir.
+    Runs up to `jobs` ffmpeg processes concurrently.
+    If `voiceover` is given (the videos' audio is that voiceover, as produced by apply_voiceover),
+    each distinct (voiceover, music, duration) mix is rendered once and stream-copied into every video.
+    With incremental=True outputs go straight into output_dir and only combinations whose
+    inputs or settings changed since the last run are rendered (see build_manifest).
+    `selection` narrows down the combinations (see combinations.select_combinations).
+    With normalize=True voice and music are levelled from their loudness, measured once per
+    distinct file and cached in the media catalog; duck=True lowers the music under the voice.
     """
     input_path = Path(input_dir)
     music_path = Path(music_dir)
     base_output_path = Path(output_dir)
 
     if not input_path.exists():
-        print(f"Error: Input directory '{input_dir}' does not exist.")
-        sys.exit(1)
+        raise StageError(f"Input directory '{input_dir}' does not exist.")
 
     if not music_path.exists():
-        print(f"Error: Music directory '{music_dir}' does not exist.")
-        sys.exit(1)
-
-    # Create timestamped output directory
-    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    final_output_path = base_output_path / timestamp
-    final_output_path.mkdir(parents=True, exist_ok=True)
+        raise StageError(f"Music directory '{music_dir}' does not exist.")
+
+    if incremental:
+        # Stable output directory; the build manifest decides what is up to date
+        final_output_path = base_output_path
+        manifest = BuildManifest(final_output_path)
+    else:
+        # Create timestamped output directory
+        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        final_output_path = base_output_path / timestamp
+        final_output_path.mkdir(parents=True, exist_ok=True)
+        manifest = None
     print(f"Output directory: {final_output_path}")
 
     # Supported extensions
@@ -43,47 +100,98 @@ def add_music(input_dir, music_dir, output_dir):
         print(f"No music files found in '{music_dir}'.")
         return
 
+    total = len(video_files) * len(music_files)
     print(f"Found {len(video_files)} videos and {len(music_files)} music tracks.")
-    print(f"Generating {len(video_files) * len(music_files)} total videos.")
-
-    for video_path in video_files:
-        for music_path in music_files:
-            # Construct filename: video_stem + music_stem
-            output_filename = f"{video_path.stem}_{music_path.stem}.mp4"
-            output_file_path = final_output_path / output_filename
-
-            print(f"Processing: {video_path.name} + {music_path.name} -> {output_filename}")
-
-            # Mix video audio with music at reduced volume (20%) to preserve voiceover
-            filter_complex = "[0:a][1:a]amix=inputs=2:duration=first:weights=1 0.2[aout]"
-
-            cmd = [
-                'ffmpeg',
-                '-y',
-                '-i', str(video_path),
-                '-i', str(music_path),
-                '-filter_complex', filter_complex,
-                '-map', '0:v',
-                '-map', '[aout]',
-                '-c:v', 'copy',
-                '-c:a', 'aac',    # Force AAC encoding for compatibility
-                '-b:a', '192k',   # High quality audio
-                str(output_file_path)
-            ]
-
-            try:
-                subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                print("  Done.")
-            except subprocess.CalledProcessError as e:
-                print(f"  Error processing {video_path.name}: {e}")
-                print(f"  FFmpeg Error Log:\n{e.stderr.decode()}") # Print explicit error
+    print(f"Generating {total} total videos.")
+    combinations = select_combinations((video_files, music_files), **(selection or {}))
+
+    if voiceover:
+        if not Path(voiceover).exists():
+            raise StageError(f"Voiceover file '{voiceover}' does not exist.")
+
+        # Imported here: audio_stems reuses music_mix_filter from this module
+        from audio_stems import ensure_stems, mux_command
+
+        combinations = list(combinations)
+        infos = media_catalog.probe_many({v for v, _ in combinations})
+        stems = ensure_stems(
+            {(voiceover, m, infos[v]["duration"]) for v, m in combinations if v in infos},
+            jobs=jobs, normalize=normalize, duck=duck
+        )
+    elif normalize:
+        # The voice is each video's own audio; every file is analysed once, then mixes use the cached values
+        combinations = list(combinations)
+        levels = media_catalog.loudness_many({f for combo in combinations for f in combo})
+
+    ffmpeg_jobs = []
+    up_to_date = 0
+    for video_path, music_path in combinations:
+        # Construct filename: video_stem + music_stem
+        output_filename = f"{video_path.stem}_{music_path.stem}.mp4"
+        output_file_path = final_output_path / output_filename
+
+        if voiceover:
+            stem = stems.get((voiceover, music_path, infos.get(video_path, {}).get("duration")))
+            if not stem:
+                print(f"Skipping {output_filename}: audio stem unavailable.")
+                continue
+            cmd = mux_command(video_path, stem, output_file_path)
+            if manifest and not manifest.plan(cmd):
+                up_to_date += 1
+                continue
+            ffmpeg_jobs.append(FFmpegJob(f"Muxing: {video_path.name} + {stem.name} -> {output_filename}", cmd))
+            continue
+
+        # Mix video audio with music at reduced (or normalized) volume to preserve voiceover
+        if normalize:
+            filter_complex = music_mix_filter(voice_loudness=levels.get(video_path), music_loudness=levels.get(music_path), duck=duck)
+        else:
+            filter_complex = music_mix_filter(duck=duck)
+
+        cmd = [
+            'ffmpeg',
+            '-y',
+            '-i', str(video_path),
+            '-i', str(music_path),
+            '-filter_complex', filter_complex,
+            '-map', '0:v',
+            '-map', '[aout]',
+            '-c:v', 'copy',
+            '-c:a', 'aac',    # Force AAC encoding for compatibility
+            '-b:a', '192k',   # High quality audio
+            str(output_file_path)
+        ]
+
+        if manifest and not manifest.plan(cmd):
+            up_to_date += 1
+            continue
+
+        ffmpeg_jobs.append(FFmpegJob(f"Processing: {video_path.name} + {music_path.name} -> {output_filename}", cmd))
+
+    if len(ffmpeg_jobs) + up_to_date < total:
+        print(f"Selected {len(ffmpeg_jobs) + up_to_date} of {total} combinations.")
+    if manifest:
+        print(f"{up_to_date} outputs up to date, {len(ffmpeg_jobs)} to render.")
+    run_ffmpeg_jobs(ffmpeg_jobs, jobs, on_done=manifest.on_done if manifest else None)
+    return final_output_path
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Add music to videos (Combinatorial).")
     parser.add_argument("--input", required=True, help="Input folder containing videos")
     parser.add_argument("--music_dir", required=True, help="Folder containing music files")
     parser.add_argument("--output", required=True, help="Base output folder")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of concurrent ffmpeg processes (default 1)")
+    parser.add_argument("--voiceover", help="Voiceover the videos already carry; renders each audio mix once and muxes it with stream copy")
+    parser.add_argument("--incremental", action="store_true", help="Write into --output directly and skip outputs that are already up to date")
+    parser.add_argument("--normalize", action="store_true", help="Level voice and music from their cached loudness (EBU R128) instead of mixing music at a fixed 20%%")
+    parser.add_argument("--duck", action="store_true", help="Lower the music while the voice is speaking (sidechain compression)")
+
+    add_selection_arguments(parser)
 
     args = parser.parse_args()
 
-    add_music(args.input, args.music_dir, args.output)
+    try:
+        add_music(args.input, args.music_dir, args.output, args.jobs, args.voiceover, args.incremental, selection_from_args(args), args.normalize, args.duck)
+    except StageError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
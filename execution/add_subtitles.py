@@ -1,25 +1,40 @@
 import argparse
-import subprocess
 import os
 import sys
 from pathlib import Path
 
-def add_subtitles(input_path_str, subtitle_file, output_dir, style_name='clean_white'):
+import media_catalog
+from parallel_jobs import FFmpegJob, run_ffmpeg_jobs
+from stage_error import StageError
+from subtitle_overlay import ensure_overlays, overlay_filter
+
+# Style Definitions
+# ASS/SSA formatting tags:
+# Fontname, Fontsize, PrimaryColour (BBGGRR), SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut,
+# ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
+STYLES = {
+    'clean_white': "Fontsize=24,PrimaryColour=&H00FFFFFF,OutlineColour=&H00000000,BorderStyle=1,Outline=1,Shadow=1,MarginV=30",
+    'highlight_yellow': "Fontname=Arial,Fontsize=26,PrimaryColour=&H0000FFFF,BackColour=&H80000000,BorderStyle=3,Outline=0,Shadow=0,MarginV=50,Bold=1",
+    'bold_red': "Fontname=Impact,Fontsize=15,PrimaryColour=&H000000FF,OutlineColour=&H00FFFFFF,BorderStyle=1,Outline=2,Shadow=0,Alignment=5"
+}
+
+def add_subtitles(input_path_str, subtitle_file, output_dir, style_name='clean_white', jobs=1, prerender=False):
     """
     Burns subtitles into videos.
     Applies the SAME subtitle file to all videos in input_path (file or directory).
+    Runs up to `jobs` ffmpeg processes concurrently.
+    With prerender, captions are rasterized once per resolution (subtitle_overlay)
+    and composited onto each video instead of being re-rendered by libass.
     """
     input_item = Path(input_path_str)
     sub_path = Path(subtitle_file)
     output_path = Path(output_dir)
 
     if not input_item.exists():
-        print(f"Error: Input '{input_path_str}' does not exist.")
-        sys.exit(1)
+        raise StageError(f"Input '{input_path_str}' does not exist.")
 
     if not sub_path.exists():
-        print(f"Error: Subtitle file '{subtitle_file}' does not exist.")
-        sys.exit(1)
+        raise StageError(f"Subtitle file '{subtitle_file}' does not exist.")
 
     output_path.mkdir(parents=True, exist_ok=True)
 
@@ -42,12 +57,26 @@ def add_subtitles(input_path_str, subtitle_file, output_dir, style_name='clean_w
 
     print(f"Found {len(files)} videos. Applying subtitles from '{sub_path.name}'.")
 
+    selected_style = STYLES.get(style_name)
+    if not selected_style:
+         print(f"Warning: Style '{style_name}' not found. Using 'clean_white'.")
+         selected_style = STYLES['clean_white']
+
+    requests = {}
+    overlays = {}
+    if prerender:
+        infos = media_catalog.probe_many(files)
+        requests = {
+            f: (str(sub_path), selected_style, i["width"], i["height"], i["fps"] or 30, i["duration"])
+            for f, i in infos.items() if i["has_video"]
+        }
+        overlays = ensure_overlays(set(requests.values()), jobs=jobs)
+
+    ffmpeg_jobs = []
     for file_path in files:
         output_filename = f"{file_path.stem}_subbed{file_path.suffix}"
         output_file_path = output_path / output_filename
 
-        print(f"Processing: {file_path.name} -> {output_filename}")
-
         # FFmpeg filter for subtitles
         # Note: escape path for FFmpeg filter if needed, though simple paths usually work.
         # Best practice is to use relative path or escape special chars.
@@ -59,39 +88,36 @@ def add_subtitles(input_path_str, subtitle_file, output_dir, style_name='clean_w
         # But for Mac (Unix), just ensuring it's a string is usually enough unless it has : inside the path (rare in normal paths compared to Windows drive letters)
         escaped_sub_path = str(sub_path).replace(":", "\\:")
 
-        # Style Definitions
-        # ASS/SSA formatting tags:
-        # Fontname, Fontsize, PrimaryColour (BBGGRR), SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut,
-        # ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
+        overlay = overlays.get(requests.get(file_path))
+        if overlay:
+            # Captions were rasterized once; compositing them is a plain overlay
+            cmd = [
+                'ffmpeg',
+                '-y',
+                '-i', str(file_path),
+                '-i', str(overlay.path),
+                '-filter_complex', overlay_filter(out="[v]", x=overlay.x, y=overlay.y),
+                '-map', '[v]',
+                '-map', '0:a?',
+                '-c:a', 'copy',
+                str(output_file_path)
+            ]
+        else:
+            filter_complex = f"subtitles='{escaped_sub_path}':force_style='{selected_style}'"
 
-        styles = {
-            'clean_white': "Fontsize=24,PrimaryColour=&H00FFFFFF,OutlineColour=&H00000000,BorderStyle=1,Outline=1,Shadow=1,MarginV=30",
-            'highlight_yellow': "Fontname=Arial,Fontsize=26,PrimaryColour=&H0000FFFF,BackColour=&H80000000,BorderStyle=3,Outline=0,Shadow=0,MarginV=50,Bold=1",
-            'bold_red': "Fontname=Impact,Fontsize=15,PrimaryColour=&H000000FF,OutlineColour=&H00FFFFFF,BorderStyle=1,Outline=2,Shadow=0,Alignment=5"
-        }
+            cmd = [
+                'ffmpeg',
+                '-y',
+                '-i', str(file_path),
+                '-vf', filter_complex,
+                '-c:a', 'copy',
+                str(output_file_path)
+            ]
 
-        selected_style = styles.get(style_name)
-        if not selected_style:
-             print(f"Warning: Style '{style_name}' not found. Using 'clean_white'.")
-             selected_style = styles['clean_white']
-
-        filter_complex = f"subtitles='{escaped_sub_path}':force_style='{selected_style}'"
-
-        cmd = [
-            'ffmpeg',
-            '-y',
-            '-i', str(file_path),
-            '-vf', filter_complex,
-            '-c:a', 'copy',
-            str(output_file_path)
-        ]
-
-        try:
-            subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            print("  Done.")
-        except subprocess.CalledProcessError as e:
-            print(f"  Error processing {file_path.name}: {e}")
-            print(f"  FFmpeg Error: {e.stderr.decode()}")
+        ffmpeg_jobs.append(FFmpegJob(f"Processing: {file_path.name} -> {output_filename}", cmd))
+
+    run_ffmpeg_jobs(ffmpeg_jobs, jobs)
+    return output_path
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Burn subtitles into videos.")
@@ -100,7 +126,13 @@ if __name__ == "__main__":
     parser.add_argument("--output", required=True, help="Output folder")
 
     parser.add_argument("--style", default="clean_white", help="Caption style: clean_white (default), highlight_yellow, bold_red")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of concurrent ffmpeg processes (default 1)")
+    parser.add_argument("--prerender", action="store_true", help="Rasterize the captions once per resolution and overlay them on every video")
 
     args = parser.parse_args()
 
-    add_subtitles(args.input, args.subtitles, args.output, args.style)
+    try:
+        add_subtitles(args.input, args.subtitles, args.output, args.style, args.jobs, args.prerender)
+    except StageError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
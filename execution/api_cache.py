@@ -0,0 +1,118 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+from pathlib import Path
+
+# Override with API_CACHE_DIR / API_CACHE_MAX_MB
+DEFAULT_CACHE_DIR = os.environ.get("API_CACHE_DIR", ".tmp/api_cache")
+DEFAULT_MAX_BYTES = int(os.environ.get("API_CACHE_MAX_MB", "2048")) * 1024 * 1024
+
+
+def cache_key(**fields):
+    """Content address for an API request: SHA-256 of its canonical JSON fields."""
+    return hashlib.sha256(json.dumps(fields, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class ApiCache:
+    """
+    On-disk cache of ElevenLabs results: <cache_dir>/<kind>/<key>/<files>.
+    Entries are written to a temp folder and renamed into place, so a crash never
+    leaves a half-written hit. When the cache grows past max_bytes the least
+    recently used entries are evicted.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def _entry(self, kind, key):
+        return self.cache_dir / kind / key
+
+    def get(self, kind, key):
+        """Returns the entry folder on a hit (and marks it as recently used), else None."""
+        entry = self._entry(kind, key)
+        if not entry.is_dir():
+            return None
+        os.utime(entry)
+        return entry
+
+    def put(self, kind, key, files):
+        """
+        Stores {filename: bytes or source path} under (kind, key). Returns the entry folder.
+        """
+        entry = self._entry(kind, key)
+        tmp = entry.parent / f".{key}.{uuid.uuid4().hex}.tmp"
+        tmp.mkdir(parents=True, exist_ok=True)
+        for name, content in files.items():
+            if isinstance(content, (bytes, bytearray)):
+                (tmp / name).write_bytes(content)
+            else:
+                shutil.copyfile(content, tmp / name)
+
+        with self._lock:
+            if entry.exists():
+                shutil.rmtree(entry)
+            os.replace(tmp, entry)
+        self.evict()
+        return entry
+
+    def restore(self, kind, key, targets):
+        """
+        Copies cached files to their destinations: targets is {filename: destination path}.
+        Files missing from the entry are skipped. Returns the list of restored destinations, or None on a miss.
+        """
+        entry = self.get(kind, key)
+        if not entry:
+            return None
+        restored = []
+        for name, dest in targets.items():
+            if (entry / name).exists():
+                shutil.copyfile(entry / name, dest)
+                restored.append(str(dest))
+        return restored
+
+    def evict(self):
+        """Removes least recently used entries until the cache fits in max_bytes."""
+        with self._lock:
+            entries = []
+            total = 0
+            for kind_dir in self.cache_dir.glob("*"):
+                for entry in kind_dir.iterdir() if kind_dir.is_dir() else []:
+                    if entry.name.startswith(".") or not entry.is_dir():
+                        continue
+                    size = sum(f.stat().st_size for f in entry.iterdir() if f.is_file())
+                    entries.append((entry.stat().st_mtime, size, entry))
+                    total += size
+
+            for _, size, entry in sorted(entries, key=lambda e: e[0]):
+                if total <= self.max_bytes:
+                    break
+                shutil.rmtree(entry, ignore_errors=True)
+                total -= size
+        return total
+
+    def clear(self, kind=None):
+        target = self.cache_dir / kind if kind else self.cache_dir
+        shutil.rmtree(target, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or prune the local ElevenLabs response cache.")
+    parser.add_argument("--dir", default=DEFAULT_CACHE_DIR, help=f"Cache folder (default {DEFAULT_CACHE_DIR})")
+    parser.add_argument("--max_mb", type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024), help="Size limit to enforce")
+    parser.add_argument("--clear", nargs="?", const="all", help="Remove all entries, or only one kind (tts, dubbing)")
+
+    args = parser.parse_args()
+
+    cache = ApiCache(args.dir, args.max_mb * 1024 * 1024)
+    if args.clear:
+        cache.clear(None if args.clear == "all" else args.clear)
+        print(f"Cleared {args.clear} entries in '{args.dir}'.")
+    else:
+        total = cache.evict()
+        print(f"Cache '{args.dir}': {total / (1024 * 1024):.1f} MB after eviction.")
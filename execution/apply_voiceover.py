@@ -1,13 +1,32 @@
 import argparse
-import subprocess
+import json
 import os
 import sys
 from pathlib import Path
 
-def apply_voiceover(video_file, audio_file, subtitle_file, output_file):
+import media_catalog
+from chunked_encode import CHUNK_SECONDS, chunked_encode
+from encoder_profiles import add_profile_argument, video_codec_args
+from parallel_jobs import FFmpegJob, run_ffmpeg_jobs
+from stage_error import StageError
+
+# Default caption style (can be enhanced to match add_subtitles logic)
+SUBTITLE_STYLE = "Fontsize=24,PrimaryColour=&H00FFFFFF,OutlineColour=&H00000000,BorderStyle=1,Outline=1,Shadow=1,MarginV=30"
+
+def subtitle_filter(subtitle_file, style=SUBTITLE_STYLE):
+    """Returns the libass burn-in filter for subtitle_file."""
+    escaped_sub_path = str(subtitle_file).replace(":", "\\:")
+    return f"subtitles='{escaped_sub_path}':force_style='{style}'"
+
+def apply_voiceover(video_file, audio_file, subtitle_file, output_file, prerender=False, profile=None, chunked=False, jobs=None, chunk_seconds=CHUNK_SECONDS):
     """
     Combines video with voiceover audio and burns in subtitles.
-    Replaces original audio with voiceover.
+    Replaces original audio with voiceover. Returns the output path; raises StageError on failure.
+    With prerender, the captions come from a cached overlay (subtitle_overlay) that is
+    rasterized once per (SRT, style, resolution) and reused across videos and runs.
+    `profile` selects the encoder settings (see encoder_profiles).
+    With chunked, the video is split at keyframes and encoded by `jobs` processes
+    (see chunked_encode); captions are then burned with libass in every chunk.
     """
     video_path = Path(video_file)
     audio_path = Path(audio_file)
@@ -15,21 +34,49 @@ def apply_voiceover(video_file, audio_file, subtitle_file, output_file):
     output_path = Path(output_file)
 
     if not video_path.exists():
-        print(f"Error: Video file '{video_file}' does not exist.")
-        sys.exit(1)
+        raise StageError(f"Video file '{video_file}' does not exist.")
 
     if not audio_path.exists():
-        print(f"Error: Audio file '{audio_file}' does not exist.")
-        sys.exit(1)
+        raise StageError(f"Audio file '{audio_file}' does not exist.")
 
     if sub_path and not sub_path.exists():
-        print(f"Error: Subtitle file '{subtitle_file}' does not exist.")
-        sys.exit(1)
+        raise StageError(f"Subtitle file '{subtitle_file}' does not exist.")
 
     output_path.parent.mkdir(parents=True, exist_ok=True)
 
     print(f"Applying voiceover and subtitles to '{video_path.name}'...")
 
+    if chunked:
+        if prerender:
+            print("Note: --prerender is not used with --chunked; captions are burned with libass.")
+        video_filter = f"[in]{subtitle_filter(sub_path)}[out]" if sub_path else None
+        error = chunked_encode(video_path, output_path, video_filter, audio_path, profile, jobs, chunk_seconds)
+        if error:
+            raise StageError(str(error))
+        print(f"Success! Output saved to: {output_path}")
+        return str(output_path)
+
+    overlay = None
+    if sub_path and prerender:
+        # Imported here: subtitle_overlay builds on this module's subtitle_filter
+        from subtitle_overlay import ensure_overlays, overlay_request
+        req = overlay_request(video_path, sub_path)
+        overlay = ensure_overlays({req}).get(req)
+
+    cmd = voiceover_command(video_path, audio_path, sub_path, output_path, overlay, profile)
+
+    # As a one-job batch, so it runs on the render farm when RENDER_FARM is set
+    [(_, error)] = run_ffmpeg_jobs([FFmpegJob(f"Voiceover: {video_path.name}", cmd)])
+    if error:
+        raise StageError(f"ffmpeg failed for '{video_path.name}'.")
+    print(f"Success! Output saved to: {output_path}")
+    return str(output_path)
+
+def voiceover_command(video_path, audio_path, sub_path, output_path, overlay=None, profile=None):
+    """
+    ffmpeg command for one apply_voiceover output. Captions are burned from `sub_path` with libass,
+    or composited from `overlay` (a pre-rendered subtitle_overlay Overlay) when given.
+    """
     # Build FFmpeg command
     cmd = [
         'ffmpeg',
@@ -40,40 +87,221 @@ def apply_voiceover(video_file, audio_file, subtitle_file, output_file):
 
     # Filter complex for subtitles
     filter_complex = ""
-    if sub_path:
-        escaped_sub_path = str(sub_path).replace(":", "\\:")
-        # Default style (can be enhanced to match add_subtitles logic)
-        style = "Fontsize=24,PrimaryColour=&H00FFFFFF,OutlineColour=&H00000000,BorderStyle=1,Outline=1,Shadow=1,MarginV=30"
-        filter_complex = f"subtitles='{escaped_sub_path}':force_style='{style}'"
-        cmd.extend(['-vf', filter_complex])
+    video_map = '0:v'
+    audio_pad = 'apad'
+    length_args = ['-shortest']  # Now -shortest stops at video end (audio is padded infinitely)
+    if overlay:
+        from subtitle_overlay import overlay_filter
+        cmd.extend(['-i', str(overlay.path)])
+        filter_complex = overlay_filter("[0:v]", "[2:v]", "[v]", overlay.x, overlay.y) + ";"
+        # -shortest cannot stop an endless apad that shares a graph with the video; pad/trim to the video length
+        duration = media_catalog.probe(video_path)['duration']
+        audio_pad = f"apad=whole_dur={duration},atrim=0:{duration}"
+        length_args = []
+        video_map = '[v]'
+    elif sub_path:
+        cmd.extend(['-vf', subtitle_filter(sub_path)])
 
     # Mapping: Use Video from 0, Audio from 1 (Voiceover)
     # Pad audio to match video duration so full video plays
     # Use filter_complex to extend voiceover with silence to match video length
     cmd.extend([
-        '-filter_complex', '[1:a]apad[a]',
-        '-map', '0:v',
+        '-filter_complex', filter_complex + f'[1:a]{audio_pad}[a]',
+        '-map', video_map,
         '-map', '[a]',
-        '-c:v', 'libx264',
+        *video_codec_args(profile),
         '-c:a', 'aac',
-        '-shortest',  # Now -shortest stops at video end (audio is padded infinitely)
+        *length_args,
         str(output_path)
     ])
 
-    try:
-        subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return cmd
+
+def voiceover_multi_command(video_file, tracks, overlays=None, profile=None):
+    """
+    One ffmpeg command that decodes video_file once and writes one output per track.
+    `tracks` is a list of (audio_file, subtitle_file_or_None, output_file); `overlays`
+    optionally maps a subtitle file to its pre-rendered Overlay (subtitle_overlay).
+    The decoded video is split into one branch per track, each burning its own captions;
+    each voiceover is padded/trimmed to the video length.
+    """
+    overlays = overlays or {}
+    duration = media_catalog.probe(video_file)["duration"]
+    cmd = ['ffmpeg', '-y', '-i', str(video_file)]
+    for audio_file, _, _ in tracks:
+        cmd.extend(['-i', str(audio_file)])
+
+    overlay_inputs = {}
+    for _, subtitle_file, _ in tracks:
+        overlay = overlays.get(subtitle_file)
+        if overlay and subtitle_file not in overlay_inputs:
+            overlay_inputs[subtitle_file] = len(tracks) + 1 + len(overlay_inputs)
+            cmd.extend(['-i', str(overlay.path)])
+
+    filters = []
+    if len(tracks) > 1:
+        filters.append("[0:v]split=" + str(len(tracks)) + "".join(f"[src{i}]" for i in range(len(tracks))))
+    for i, (_, subtitle_file, _) in enumerate(tracks):
+        src = f"[src{i}]" if len(tracks) > 1 else "[0:v]"
+        if subtitle_file in overlay_inputs:
+            # Imported here: subtitle_overlay builds on this module's subtitle_filter
+            from subtitle_overlay import overlay_filter
+            overlay = overlays[subtitle_file]
+            filters.append(overlay_filter(src, f"[{overlay_inputs[subtitle_file]}:v]", f"[v{i}]", overlay.x, overlay.y))
+        elif subtitle_file:
+            filters.append(f"{src}{subtitle_filter(subtitle_file)}[v{i}]")
+        else:
+            filters.append(f"{src}null[v{i}]")
+        filters.append(f"[{i + 1}:a]apad=whole_dur={duration},atrim=0:{duration}[a{i}]")
+
+    cmd.extend(['-filter_complex', ";".join(filters)])
+    for i, (_, _, output_file) in enumerate(tracks):
+        cmd.extend(['-map', f"[v{i}]", '-map', f"[a{i}]", *video_codec_args(profile), '-c:a', 'aac', str(output_file)])
+    return cmd
+
+def apply_voiceover_multi(video_file, tracks, prerender=False, profile=None):
+    """
+    Multi-language apply_voiceover: `tracks` is a list of (audio_file, subtitle_file_or_None, output_file).
+    The video is decoded once and every language is written by the same ffmpeg process.
+    Returns the list of output paths.
+    """
+    video_path = Path(video_file)
+    if not video_path.exists():
+        raise StageError(f"Video file '{video_file}' does not exist.")
+
+    tracks = [(Path(a), Path(s) if s else None, Path(o)) for a, s, o in tracks]
+    for audio_path, sub_path, output_path in tracks:
+        for label, p in [("Audio file", audio_path), ("Subtitle file", sub_path)]:
+            if p and not p.exists():
+                raise StageError(f"{label} '{p}' does not exist.")
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    overlays = {}
+    if prerender:
+        from subtitle_overlay import ensure_overlays, overlay_request
+        requests = {s: overlay_request(video_path, s) for _, s, _ in tracks if s}
+        rendered = ensure_overlays(set(requests.values()))
+        overlays = {s: rendered[req] for s, req in requests.items() if req in rendered}
+
+    print(f"Applying {len(tracks)} voiceover/subtitle tracks to '{video_path.name}' in one pass...")
+
+    cmd = voiceover_multi_command(video_path, tracks, overlays, profile)
+    [(_, error)] = run_ffmpeg_jobs([FFmpegJob(f"Voiceover: {video_path.name}", cmd)])
+    if error:
+        raise StageError(f"ffmpeg failed for '{video_path.name}'.")
+
+    for _, _, output_path in tracks:
         print(f"Success! Output saved to: {output_path}")
-    except subprocess.CalledProcessError as e:
-        print(f"Error processing video: {e}")
-        print(f"FFmpeg Error: {e.stderr.decode()}")
-        sys.exit(1)
+    return [str(o) for _, _, o in tracks]
+
+def load_batch(source, audio_file=None, subtitle_file=None, output_dir=None):
+    """
+    Reads apply_voiceover_batch entries: (video, audio, subtitles_or_None, output) tuples.
+    `source` is a folder of videos, which all get `audio_file` and `subtitle_file` and keep their
+    names in output_dir, or a JSONL manifest with one {"video", "audio", "subtitles", "output"}
+    object per line ('#' comments allowed), where missing fields fall back to the same arguments.
+    """
+    source = Path(source)
+    if not source.exists():
+        raise StageError(f"Batch source '{source}' does not exist.")
+
+    if source.is_dir():
+        video_exts = {'.mp4', '.mov', '.avi', '.mkv'}
+        rows = [{"video": str(f)} for f in sorted(source.iterdir()) if f.suffix.lower() in video_exts]
+    else:
+        rows = []
+        for n, line in enumerate(source.read_text(encoding='utf-8').splitlines(), 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                rows.append(json.loads(line))
+            except ValueError as e:
+                raise StageError(f"{source}:{n}: invalid manifest line: {e}")
+
+    entries = []
+    for row in rows:
+        video, audio = row.get("video"), row.get("audio", audio_file)
+        subtitles = row.get("subtitles", subtitle_file)
+        output = row.get("output") or (Path(output_dir) / Path(video).name if video and output_dir else None)
+        if not (video and audio and output):
+            raise StageError(f"Batch entry {row} needs a video, an audio file and an output (or an output folder).")
+        entries.append((Path(video), Path(audio), Path(subtitles) if subtitles else None, Path(output)))
+    return entries
+
+def apply_voiceover_batch(entries, prerender=False, profile=None, jobs=1):
+    """
+    apply_voiceover for many videos from one process: `entries` are (video, audio, subtitles_or_None,
+    output) tuples (see load_batch), rendered by up to `jobs` concurrent ffmpeg processes.
+    An entry with missing inputs is reported and skipped instead of stopping the batch.
+    Returns [(entry, error)] in entry order, with error None on success.
+    """
+    errors = {}
+    runnable = []
+    for i, entry in enumerate(entries):
+        missing = [str(p) for p in entry[:3] if p and not Path(p).exists()]
+        if missing:
+            errors[i] = StageError(f"Missing input: {', '.join(missing)}")
+            print(f"Skipping {Path(entry[3]).name}: {errors[i]}")
+        else:
+            runnable.append(i)
+
+    overlays = {}
+    if prerender:
+        from subtitle_overlay import ensure_overlays, overlay_request
+        media_catalog.probe_many({entries[i][0] for i in runnable})
+        requests = {i: overlay_request(entries[i][0], entries[i][2]) for i in runnable if entries[i][2]}
+        rendered = ensure_overlays(set(requests.values()), jobs=jobs)
+        overlays = {i: rendered.get(req) for i, req in requests.items()}
+
+    ffmpeg_jobs = []
+    for i in runnable:
+        video, audio, subtitles, output = entries[i]
+        Path(output).parent.mkdir(parents=True, exist_ok=True)
+        cmd = voiceover_command(Path(video), Path(audio), Path(subtitles) if subtitles else None, Path(output), overlays.get(i), profile)
+        ffmpeg_jobs.append(FFmpegJob(f"Voiceover: {Path(video).name} -> {Path(output).name}", cmd))
+
+    print(f"Applying voiceover to {len(ffmpeg_jobs)} videos ({len(errors)} skipped).")
+    for i, (_, error) in zip(runnable, run_ffmpeg_jobs(ffmpeg_jobs, jobs)):
+        if error is not None:
+            errors[i] = error
+    return [(entry, errors.get(i)) for i, entry in enumerate(entries)]
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Add voiceover and subtitles to video.")
-    parser.add_argument("--video", required=True, help="Input video file")
-    parser.add_argument("--audio", required=True, help="Input voiceover audio file")
-    parser.add_argument("--subtitles", help="Input SRT file (optional)")
-    parser.add_argument("--output", required=True, help="Output video file")
+    parser.add_argument("--video", help="Input video file")
+    parser.add_argument("--audio", help="Input voiceover audio file (the default for every video with --batch)")
+    parser.add_argument("--subtitles", help="Input SRT file (optional; the default for every video with --batch)")
+    parser.add_argument("--output", help="Output video file (output folder with --batch)")
+    parser.add_argument("--track", nargs=3, action="append", metavar=("AUDIO", "SRT", "OUTPUT"),
+                        help="Multi-language mode: one voiceover/subtitle/output triple per language (repeatable, SRT may be '-'). The video is decoded once for all tracks.")
+    parser.add_argument("--batch", metavar="SOURCE",
+                        help="Batch mode: a folder of videos, or a JSONL manifest of {video, audio, subtitles, output} lines, all rendered by this one process")
+    parser.add_argument("--prerender", action="store_true", help="Overlay captions from the cached pre-render instead of running libass on this video")
+    add_profile_argument(parser)
+    parser.add_argument("--chunked", action="store_true", help="Encode as keyframe-aligned chunks in parallel processes, for long videos (single --audio/--output only)")
+    parser.add_argument("--jobs", type=int, help="Concurrent ffmpeg processes: videos with --batch (default 1), chunk encodes with --chunked (default: CPU count)")
+    parser.add_argument("--chunk_seconds", type=float, default=CHUNK_SECONDS, help=f"Target chunk length with --chunked (default {CHUNK_SECONDS})")
 
     args = parser.parse_args()
-    apply_voiceover(args.video, args.audio, args.subtitles, args.output)
+    if not args.video and not args.batch:
+        parser.error("either --video or --batch is required")
+    try:
+        if args.batch:
+            results = apply_voiceover_batch(load_batch(args.batch, args.audio, args.subtitles, args.output),
+                                            args.prerender, args.profile, args.jobs or 1)
+            failed = [entry for entry, error in results if error is not None]
+            if failed:
+                print(f"Failed: {len(failed)} of {len(results)} videos.")
+                sys.exit(1)
+        elif args.track:
+            tracks = [(a, None if s == "-" else s, o) for a, s, o in args.track]
+            apply_voiceover_multi(args.video, tracks, args.prerender, args.profile)
+        elif args.audio and args.output:
+            apply_voiceover(args.video, args.audio, args.subtitles, args.output, args.prerender, args.profile,
+                            args.chunked, args.jobs, args.chunk_seconds)
+        else:
+            parser.error("either --audio and --output, or one or more --track is required")
+    except StageError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
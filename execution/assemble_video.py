@@ -1,47 +1,147 @@
 import argparse
-import subprocess
 import os
 import sys
-import json
 from pathlib import Path
 from datetime import datetime
 
+import media_catalog
+from normalize_clips import mezzanine_video_args, normalize_clips, DEFAULT_MEZZANINE_DIR
+from build_manifest import BuildManifest
+from combinations import add_selection_arguments, select_combinations, selection_from_args
+from encoder_profiles import add_profile_argument, video_codec_args
+from parallel_jobs import FFmpegJob, run_ffmpeg_jobs
+from smart_render import DEFAULT_TRANSITION_DIR, compatible, ensure_transitions, smart_command
+from stage_error import StageError
+
 def get_video_info(file_path):
-    """Returns duration, width, height, and has_audio using ffprobe."""
-    cmd = [
-        'ffprobe',
-        '-v', 'error',
-        '-show_entries', 'stream=width,height,codec_type',
-        '-show_entries', 'format=duration',
-        '-of', 'json',
-        str(file_path)
-    ]
+    """
+    Returns duration, width, height, and has_audio from the shared media catalog (ffprobe on first sight).
+    The duration is that of the video stream: the concat filter joins the clips' video back to back,
+    so the xfade offset must not include the extra length AAC audio gives the container.
+    """
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        data = json.loads(result.stdout)
-        duration = float(data.get('format', {}).get('duration', 0))
-
-        width = 1080
-        height = 1080
-        has_audio = False
-
-        for stream in data.get('streams', []):
-            if stream.get('codec_type') == 'video' and 'width' in stream:
-                width = int(stream['width'])
-                height = int(stream['height'])
-            if stream.get('codec_type') == 'audio':
-                has_audio = True
-
-        return duration, width, height, has_audio
+        info = media_catalog.probe(file_path)
+        duration = media_catalog.video_end(file_path) if info["has_video"] else info["duration"]
+        return duration, info["width"] or 1080, info["height"] or 1080, info["has_audio"]
     except Exception as e:
         print(f"Error getting info for {file_path}: {e}")
         return 0.0, 1080, 1080, False
 
-def assemble_videos(hook_dir, body_dir, packshot_dir, output_dir):
+def assembly_filter(durations, has_audio, norm_filters=None, video=True):
+    """
+    Filter graph for one Hook -> Body -> Packshot combination (inputs 0, 1, 2), labelled [v] and [a].
+    durations/has_audio are per input; a missing audio stream is replaced by silence.
+    norm_filters (if given) is applied to every video input first.
+    With video=False only the audio ([a]) is built.
+    """
+    hook_dur, body_dur, p_dur = durations
+    hook_has_audio, body_has_audio, pack_has_audio = has_audio
+
+    # Offset for xfade = (Hook + Body) - 0.5s overlap
+    offset = hook_dur + body_dur - 0.5
+
+    # Audio handling: use stream if exists, else generate silence.
+    # Hook and body audio are trimmed to their video: the concat filter starts the next clip after
+    # the longest stream, and AAC padding would push the body's video off the frame grid.
+
+    # Hook Audio
+    a0 = "[a0]"
+    if hook_has_audio:
+        filt_a0 = f"[0:a]atrim=0:{hook_dur}[a0];"
+    else:
+        filt_a0 = f"anullsrc=channel_layout=stereo:sample_rate=44100:d={hook_dur}[a0];"
+
+    # Body Audio
+    a1 = "[a1]"
+    if body_has_audio:
+        filt_a1 = f"[1:a]atrim=0:{body_dur}[a1];"
+    else:
+        filt_a1 = f"anullsrc=channel_layout=stereo:sample_rate=44100:d={body_dur}[a1];"
+
+    # Packshot Audio
+    if pack_has_audio:
+        a2 = "[2:a]"
+        filt_a2 = ""
+    else:
+        a2 = "[a2]"
+        filt_a2 = f"anullsrc=channel_layout=stereo:sample_rate=44100:d={p_dur}[a2];"
+
+    # Video inputs: normalize per combination, or use mezzanines as-is
+    if norm_filters:
+        v0, v1, v2 = "[v0]", "[v1]", "[v2]"
+        filt_v = (
+            f"[0:v]{norm_filters}[v0];"
+            f"[1:v]{norm_filters}[v1];"
+            f"[2:v]{norm_filters}[v2];"
+        )
+    else:
+        v0, v1, v2 = "[0:v]", "[1:v]", "[2:v]"
+        filt_v = ""
+
+    if not video:
+        return f"{filt_a0}{filt_a1}{filt_a2}{a0}{a1}concat=n=2:v=0:a=1[hb_a];[hb_a]{a2}acrossfade=d=0.5[a]"
+
+    # Filter Complex Construction
+    return (
+        f"{filt_a0}{filt_a1}{filt_a2}"
+        f"{filt_v}"
+        f"{v0}{a0}{v1}{a1}concat=n=2:v=1:a=1[hb_v][hb_a];"
+        f"[hb_v]settb=AVTB[hb_v_tb];"
+        f"{v2}settb=AVTB[v2_tb];"
+        f"[hb_v_tb][v2_tb]xfade=transition=fade:duration=0.5:offset={offset}[v];"
+        f"[hb_a]{a2}acrossfade=d=0.5[a]"
+    )
+
+def prepare_sources(hooks, bodies, packshots, mezzanine=False, mezzanine_dir=DEFAULT_MEZZANINE_DIR, jobs=1):
+    """
+    Probes every clip and picks what each combination reads.
+    Returns (sources, infos, norm_filters): {clip: file to read}, {clip: get_video_info()}
+    and the per-input normalization filter (None for mezzanines, which are already normalized).
+    Clips that failed to normalize are missing from sources.
+    """
+    # Probe every clip once up front (in parallel, cached across runs);
+    # the combination loops only read from the catalog.
+    media_catalog.probe_many(hooks + bodies + packshots)
+    infos = {f: get_video_info(f) for f in hooks + bodies + packshots}
+
+    # Get reference dimensions
+    _, ref_w, ref_h, _ = infos[hooks[0]]
+    print(f"Standardizing to resolution: {ref_w}x{ref_h}")
+
+    # Input normalization filters
+    # We standardize all video inputs to match the first hook's resolution and pixel format.
+    norm_filters = f"scale={ref_w}:{ref_h}:force_original_aspect_ratio=decrease,pad={ref_w}:{ref_h}:(ow-iw)/2:(oh-ih)/2,setsar=1,format=yuv420p"
+    sources = {f: f for f in hooks + bodies + packshots}
+
+    if mezzanine:
+        # Normalize N+M+P clips once instead of N*M*P times; mezzanines share
+        # resolution, frame rate, pixel format and audio layout, so no per-input filters are needed.
+        ref_fps = media_catalog.probe(hooks[0])["fps"] or 30
+        print(f"Normalizing clips to mezzanines ({ref_w}x{ref_h} @ {ref_fps:g}fps) in '{mezzanine_dir}'...")
+        sources = normalize_clips(hooks + bodies + packshots, mezzanine_dir, ref_w, ref_h, ref_fps, jobs=jobs)
+        media_catalog.probe_many(sources.values())
+        infos = {f: get_video_info(m) for f, m in sources.items()}
+        norm_filters = None
+    return sources, infos, norm_filters
+
+def assemble_videos(hook_dir, body_dir, packshot_dir, output_dir, mezzanine=False, mezzanine_dir=DEFAULT_MEZZANINE_DIR, jobs=1, incremental=False, profile=None, smart=False, transition_dir=DEFAULT_TRANSITION_DIR, selection=None):
     """
     Assembles videos: Hook -> Body -> Packshot.
     Packshot overlaps Body by 0.5s.
     Generates all combinations.
+    With mezzanine=True every clip is normalized once up front and the
+    combinations are built from the cached mezzanines (no per-combination rescale).
+    Runs up to `jobs` ffmpeg processes concurrently.
+    With incremental=True outputs go straight into output_dir and only combinations whose
+    inputs or settings changed since the last run are rendered (see build_manifest).
+    `profile` selects the encoder settings (see encoder_profiles).
+    With smart=True, combinations whose clips share codec parameters are smart-rendered:
+    the video is stream-copied except for the GOP-aligned crossfade window, which is
+    encoded once per (body, packshot) into transition_dir (see smart_render).
+    smart implies mezzanine: only the mezzanines' encoder settings reproduce the clips'
+    H.264 parameter sets in the crossfade window, so arbitrary sources would never qualify.
+    `selection` narrows down the combinations (select_combinations keyword arguments:
+    include/exclude, sample, seed, shard, limit); they are enumerated lazily either way.
     """
     hook_path = Path(hook_dir)
     body_path = Path(body_dir)
@@ -50,13 +150,18 @@ def assemble_videos(hook_dir, body_dir, packshot_dir, output_dir):
     # Validate inputs
     for p in [hook_path, body_path, packshot_path]:
         if not p.exists():
-            print(f"Error: Directory '{p}' does not exist.")
-            sys.exit(1)
+            raise StageError(f"Directory '{p}' does not exist.")
 
-    # Create timestamped output directory
-    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    final_output_path = Path(output_dir) / timestamp
-    final_output_path.mkdir(parents=True, exist_ok=True)
+    if incremental:
+        # Stable output directory; the build manifest decides what is up to date
+        final_output_path = Path(output_dir)
+        manifest = BuildManifest(final_output_path)
+    else:
+        # Create timestamped output directory
+        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        final_output_path = Path(output_dir) / timestamp
+        final_output_path.mkdir(parents=True, exist_ok=True)
+        manifest = None
     print(f"Output directory: {final_output_path}")
 
     # Supported extensions
@@ -72,103 +177,97 @@ def assemble_videos(hook_dir, body_dir, packshot_dir, output_dir):
 
     print(f"Found {len(hooks)} hooks, {len(bodies)} bodies, {len(packshots)} packshots.")
 
-    # Get reference dimensions
-    _, ref_w, ref_h, _ = get_video_info(hooks[0])
-    print(f"Standardizing to resolution: {ref_w}x{ref_h}")
+    if smart and not mezzanine:
+        print("Smart render reads normalized mezzanines; enabling --mezzanine.")
+        mezzanine = True
+
+    sources, infos, norm_filters = prepare_sources(hooks, bodies, packshots, mezzanine, mezzanine_dir, jobs)
+    hooks = [f for f in hooks if f in sources]
+    bodies = [f for f in bodies if f in sources]
+    packshots = [f for f in packshots if f in sources]
+
+    # A clip without a usable duration can't be part of any combination
+    for clip in hooks + bodies:
+        if infos[clip][0] <= 0:
+            print(f"Skipping {clip.name}: Invalid duration ({infos[clip][0]})")
+    hooks = [f for f in hooks if infos[f][0] > 0]
+    bodies = [f for f in bodies if infos[f][0] > 0]
+    if not hooks or not bodies or not packshots:
+        raise StageError("No usable hook, body or packshot left after probing and normalization.")
+
+    combinations = select_combinations((hooks, bodies, packshots), **(selection or {}))
+
+    transitions = {}
+    if smart:
+        combinations = list(combinations)
+        # The crossfade window must come out with the mezzanines' own H.264 parameter sets
+        encoder_args = mezzanine_video_args(media_catalog.probe(sources[hooks[0]])["fps"] or 30)
+        transitions = ensure_transitions(
+            {(sources[b], sources[p]) for _, b, p in combinations}, encoder_args, transition_dir, jobs
+        )
+
+    ffmpeg_jobs = []
+    up_to_date = 0
+    smart_rendered = 0
+    for hook, body, packshot in combinations:
+        hook_dur, _, _, hook_has_audio = infos[hook]
+        body_dur, _, _, body_has_audio = infos[body]
+        # Packshot might not have audio, so we check.
+        p_dur, _, _, pack_has_audio = infos[packshot]
 
-    count = 0
-    for hook in hooks:
-        hook_dur, _, _, hook_has_audio = get_video_info(hook)
-        if hook_dur <= 0:
-            print(f"Skipping {hook.name}: Invalid duration ({hook_dur})")
+        output_filename = f"{hook.stem}_{body.stem}_{packshot.stem}.mp4"
+        output_file_path = final_output_path / output_filename
+
+        # Offset for xfade = (Hook + Body) - 0.5s overlap
+        offset = hook_dur + body_dur - 0.5
+
+        if offset < 0:
+             print(f"  Error: Combined length of Hook+Body ({hook_dur + body_dur}s) < 0.5s overlap. Skipping.")
+             continue
+
+        filter_complex = assembly_filter(
+            (hook_dur, body_dur, p_dur), (hook_has_audio, body_has_audio, pack_has_audio), norm_filters
+        )
+
+        cmd = [
+            'ffmpeg',
+            '-y',
+            '-i', str(sources[hook]),
+            '-i', str(sources[body]),
+            '-i', str(sources[packshot]),
+            '-filter_complex', filter_complex,
+            '-map', '[v]',
+            '-map', '[a]',
+            *video_codec_args(profile),
+            '-c:a', 'aac',
+            str(output_file_path)
+        ]
+
+        transition = transitions.get((sources[body], sources[packshot]))
+        if transition and compatible(sources[hook], sources[body]):
+            audio_filter = assembly_filter(
+                (hook_dur, body_dur, p_dur), (hook_has_audio, body_has_audio, pack_has_audio), video=False
+            )
+            cmd = smart_command(sources[hook], sources[body], sources[packshot], transition,
+                                audio_filter, output_file_path, transition_dir)
+            smart_rendered += 1
+
+        if manifest and not manifest.plan(cmd):
+            up_to_date += 1
             continue
 
-        for body in bodies:
-            body_dur, _, _, body_has_audio = get_video_info(body)
-            if body_dur <= 0:
-                print(f"Skipping {body.name}: Invalid duration ({body_dur})")
-                continue
-
-            for packshot in packshots:
-                # Packshot check
-                # Note: Packshot might not have audio, so we check.
-                p_dur, _, _, pack_has_audio = get_video_info(packshot)
-
-                count += 1
-                output_filename = f"{hook.stem}_{body.stem}_{packshot.stem}.mp4"
-                output_file_path = final_output_path / output_filename
-
-                print(f"[{count}] Assembling: {output_filename}")
-
-                # Offset for xfade = (Hook + Body) - 0.5s overlap
-                offset = hook_dur + body_dur - 0.5
-
-                if offset < 0:
-                     print(f"  Error: Combined length of Hook+Body ({hook_dur + body_dur}s) < 0.5s overlap. Skipping.")
-                     continue
-
-                # Input normalization filters
-                # We standardize all video inputs to match the first hook's resolution and pixel format.
-                norm_filters = f"scale={ref_w}:{ref_h}:force_original_aspect_ratio=decrease,pad={ref_w}:{ref_h}:(ow-iw)/2:(oh-ih)/2,setsar=1,format=yuv420p"
-
-                # Audio handling: use stream if exists, else generate silence
-
-                # Hook Audio
-                if hook_has_audio:
-                    a0 = "[0:a]"
-                    filt_a0 = ""
-                else:
-                    a0 = "[a0]"
-                    filt_a0 = f"anullsrc=channel_layout=stereo:sample_rate=44100:d={hook_dur}[a0];"
-
-                # Body Audio
-                if body_has_audio:
-                    a1 = "[1:a]"
-                    filt_a1 = ""
-                else:
-                    a1 = "[a1]"
-                    filt_a1 = f"anullsrc=channel_layout=stereo:sample_rate=44100:d={body_dur}[a1];"
-
-                # Packshot Audio
-                if pack_has_audio:
-                    a2 = "[2:a]"
-                    filt_a2 = ""
-                else:
-                    a2 = "[a2]"
-                    filt_a2 = f"anullsrc=channel_layout=stereo:sample_rate=44100:d={p_dur}[a2];"
-
-                # Filter Complex Construction
-                filter_complex = (
-                    f"{filt_a0}{filt_a1}{filt_a2}"
-                    f"[0:v]{norm_filters}[v0];"
-                    f"[1:v]{norm_filters}[v1];"
-                    f"[2:v]{norm_filters}[v2];"
-                    f"[v0]{a0}[v1]{a1}concat=n=2:v=1:a=1[hb_v][hb_a];"
-                    f"[hb_v]settb=AVTB[hb_v_tb];"
-                    f"[v2]settb=AVTB[v2_tb];"
-                    f"[hb_v_tb][v2_tb]xfade=transition=fade:duration=0.5:offset={offset}[v];"
-                    f"[hb_a]{a2}acrossfade=d=0.5[a]"
-                )
-
-                cmd = [
-                    'ffmpeg',
-                    '-y',
-                    '-i', str(hook),
-                    '-i', str(body),
-                    '-i', str(packshot),
-                    '-filter_complex', filter_complex,
-                    '-map', '[v]',
-                    '-map', '[a]',
-                    '-c:v', 'libx264',
-                    '-c:a', 'aac',
-                    str(output_file_path)
-                ]
-
-                try:
-                    subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                except subprocess.CalledProcessError as e:
-                    print(f"Error processing {output_filename}: {e}")
-                    print(f"FFmpeg Error: {e.stderr.decode()}")
+        ffmpeg_jobs.append(FFmpegJob(f"Assembling: {output_filename}", cmd))
+
+    if smart:
+        print(f"{smart_rendered} combinations smart-rendered (video copied around the crossfade), "
+              f"the rest fully re-encoded.")
+    total = len(hooks) * len(bodies) * len(packshots)
+    if len(ffmpeg_jobs) + up_to_date < total:
+        print(f"Selected {len(ffmpeg_jobs) + up_to_date} of {total} combinations.")
+    if manifest:
+        print(f"{up_to_date} outputs up to date, {len(ffmpeg_jobs)} to render.")
+    run_ffmpeg_jobs(ffmpeg_jobs, jobs, on_done=manifest.on_done if manifest else None)
+    return final_output_path
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Assemble videos (Hook -> Body -> Packshot) with overlap.")
@@ -176,7 +275,20 @@ if __name__ == "__main__":
     parser.add_argument("--body_dir", required=True, help="Folder containing bodies")
     parser.add_argument("--packshot_dir", required=True, help="Folder containing packshots")
     parser.add_argument("--output", required=True, help="Output folder")
+    parser.add_argument("--mezzanine", action="store_true", help="Normalize each clip once and assemble from cached mezzanines")
+    parser.add_argument("--mezzanine_dir", default=DEFAULT_MEZZANINE_DIR, help=f"Mezzanine cache folder (default {DEFAULT_MEZZANINE_DIR})")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of concurrent ffmpeg processes (default 1)")
+    parser.add_argument("--incremental", action="store_true", help="Write into --output directly and skip outputs that are already up to date")
+    add_profile_argument(parser)
+    parser.add_argument("--smart", action="store_true", help="Stream-copy the video and encode only the crossfade window (implies --mezzanine)")
+    parser.add_argument("--transition_dir", default=DEFAULT_TRANSITION_DIR, help=f"Crossfade segment cache folder (default {DEFAULT_TRANSITION_DIR})")
+
+    add_selection_arguments(parser)
 
     args = parser.parse_args()
 
-    assemble_videos(args.hook_dir, args.body_dir, args.packshot_dir, args.output)
+    try:
+        assemble_videos(args.hook_dir, args.body_dir, args.packshot_dir, args.output, args.mezzanine, args.mezzanine_dir, args.jobs, args.incremental, args.profile, args.smart, args.transition_dir, selection_from_args(args))
+    except StageError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
@@ -0,0 +1,153 @@
+import argparse
+import hashlib
+import math
+import os
+import sys
+from pathlib import Path
+
+import media_catalog
+from add_music import MUSIC_BED_LU, VOICE_LUFS, music_mix_filter
+from parallel_jobs import FFmpegJob, run_ffmpeg_jobs
+
+DEFAULT_STEM_DIR = ".tmp/audio_stems"
+
+
+def stem_duration(duration):
+    """Stems are rendered in 0.1s steps (rounded up) so near-identical video lengths share one mix."""
+    return math.ceil(round(duration * 10, 3)) / 10
+
+
+def stem_path(voiceover, music, duration, cache_dir=DEFAULT_STEM_DIR, normalize=False, duck=False):
+    """Cache location for the final mix of (voiceover, music, duration) with the given mix options."""
+    parts = []
+    for p in (voiceover, music):
+        if p is None:
+            parts.append("-")
+            continue
+        st = Path(p).stat()
+        parts.append(f"{Path(p).resolve()}|{st.st_size}|{st.st_mtime_ns}")
+    parts.append(f"{stem_duration(duration):.1f}")
+    if music and normalize:
+        parts.append(f"normalize={VOICE_LUFS},{MUSIC_BED_LU}")
+    if music and duck:
+        parts.append("duck")
+    digest = hashlib.sha1("|".join(parts).encode('utf-8')).hexdigest()[:16]
+    name = Path(voiceover).stem + (f"_{Path(music).stem}" if music else "")
+    return Path(cache_dir) / f"{name}_{digest}.m4a"
+
+
+def stem_command(voiceover, music, duration, output_file, levels=None, duck=False):
+    """
+    ffmpeg command for one stem: voiceover padded/trimmed to `duration`,
+    mixed with music exactly like add_music (length follows the voice; see music_mix_filter).
+    `levels` is the (voiceover, music) loudness for a normalized mix; None mixes at the fixed level.
+    """
+    duration = stem_duration(duration)
+    cmd = ['ffmpeg', '-y', '-i', str(voiceover)]
+    filter_complex = f"[0:a]apad=whole_dur={duration},atrim=0:{duration}[vo]"
+    out_label = "[vo]"
+    if music:
+        cmd.extend(['-i', str(music)])
+        filter_complex += ";" + music_mix_filter("[vo]", "[1:a]", "[aout]", *(levels or (None, None)), duck=duck)
+        out_label = "[aout]"
+    cmd.extend([
+        '-filter_complex', filter_complex,
+        '-map', out_label,
+        '-c:a', 'aac',
+        '-b:a', '192k',
+        str(output_file)
+    ])
+    return cmd
+
+
+def ensure_stems(requests, cache_dir=DEFAULT_STEM_DIR, jobs=1, normalize=False, duck=False):
+    """
+    Renders each distinct (voiceover, music, duration) mix once.
+    `requests` is an iterable of (voiceover, music_or_None, duration) tuples;
+    `normalize` and `duck` are the add_music mix options.
+    Returns {request: stem Path}; requests whose stem failed to render are omitted.
+    With normalize, a mix whose voiceover or music could not be measured (reported by
+    loudness_many) uses the fixed level, as in add_music, and is cached as such.
+    """
+    Path(cache_dir).mkdir(parents=True, exist_ok=True)
+    requests = set(requests)
+
+    levels = {}
+    if normalize:
+        # Every voiceover and track is analysed once, in parallel, and cached in the media catalog
+        levels = media_catalog.loudness_many({f for voiceover, music, _ in requests if music for f in (voiceover, music)})
+
+    stems = {}
+    missing = {}
+    for req in requests:
+        voiceover, music, _ = req
+        mix_levels = (levels.get(Path(voiceover)), levels.get(Path(music))) if music and levels else None
+        measured = bool(mix_levels and all(mix_levels))
+        path = stem_path(*req, cache_dir, measured, duck)
+        stems[req] = path
+        if not path.exists() and path not in missing:
+            missing[path] = (req, mix_levels if measured else None)
+
+    if missing:
+        print(f"Rendering {len(missing)} audio stems ({len(stems) - len(missing)} cached).")
+        ffmpeg_jobs = []
+        for path, ((voiceover, music, duration), mix_levels) in missing.items():
+            tmp_out = path.with_name(f".{path.stem}.{os.getpid()}.tmp.m4a")
+            label = f"Stem: {Path(voiceover).name} + {Path(music).name if music else '(no music)'} @ {stem_duration(duration):.1f}s"
+            ffmpeg_jobs.append((path, tmp_out, FFmpegJob(label, stem_command(voiceover, music, duration, tmp_out, mix_levels, duck))))
+
+        results = run_ffmpeg_jobs([job for _, _, job in ffmpeg_jobs], jobs)
+        for (path, tmp_out, _), (_, error) in zip(ffmpeg_jobs, results):
+            if error is None:
+                os.replace(tmp_out, path)
+            else:
+                Path(tmp_out).unlink(missing_ok=True)
+
+    return {req: path for req, path in stems.items() if path.exists()}
+
+
+def mux_command(video_file, stem_file, output_file):
+    """
+    Muxes a rendered stem into a video without re-encoding either stream.
+    Stems are rendered in 0.1s steps, so the output is cut at the video's duration.
+    """
+    return [
+        'ffmpeg',
+        '-y',
+        '-i', str(video_file),
+        '-i', str(stem_file),
+        '-map', '0:v',
+        '-map', '1:a',
+        '-c:v', 'copy',
+        '-c:a', 'copy',
+        '-t', str(media_catalog.probe(video_file)["duration"]),
+        str(output_file)
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-render final audio stems (voiceover + music) for a set of videos.")
+    parser.add_argument("--input", required=True, help="Folder containing videos (durations are read from them)")
+    parser.add_argument("--audio", required=True, help="Voiceover audio file")
+    parser.add_argument("--music_dir", help="Folder containing music tracks")
+    parser.add_argument("--output", default=DEFAULT_STEM_DIR, help=f"Stem cache folder (default {DEFAULT_STEM_DIR})")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of concurrent ffmpeg processes (default 1)")
+    parser.add_argument("--normalize", action="store_true", help="Level voice and music from their cached loudness (EBU R128), as add_music --normalize")
+    parser.add_argument("--duck", action="store_true", help="Lower the music while the voice is speaking, as add_music --duck")
+
+    args = parser.parse_args()
+
+    for p in [args.input, args.audio, args.music_dir]:
+        if p and not Path(p).exists():
+            print(f"Error: '{p}' does not exist.")
+            sys.exit(1)
+
+    video_exts = {'.mp4', '.mov', '.avi', '.mkv'}
+    audio_exts = {'.mp3', '.wav', '.aac', '.m4a'}
+    videos = sorted(f for f in Path(args.input).iterdir() if f.suffix.lower() in video_exts)
+    music_files = sorted(f for f in Path(args.music_dir).iterdir() if f.suffix.lower() in audio_exts) if args.music_dir else [None]
+
+    infos = media_catalog.probe_many(videos)
+    requests = {(args.audio, m, infos[v]["duration"]) for v in videos if v in infos for m in music_files}
+    stems = ensure_stems(requests, args.output, args.jobs, args.normalize, args.duck)
+    print(f"{len(set(stems.values()))} stems available in '{args.output}'.")
@@ -0,0 +1,229 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import media_catalog
+from transcribe_audio import alignment_cues, synthetic_alignment, write_srt
+
+EXECUTION_DIR = Path(__file__).resolve().parent
+DEFAULT_BENCH_DIR = ".tmp/benchmarks"
+DEFAULT_RESOLUTIONS = ("540x960", "1080x1920")
+DEFAULT_CLIP_COUNTS = (1, 2)
+
+
+def _ffmpeg(args):
+    subprocess.run(['ffmpeg', '-y', '-v', 'error'] + args, check=True)
+
+
+def generate_fixtures(root, resolution="1080x1920", clips=2, duration=4, fps=30):
+    """
+    Deterministic synthetic inputs for one (resolution, clip count), cached under root:
+    hook/, body/, packshot/ with `clips` testsrc2+sine clips each, music/ tracks,
+    and a voiceover with its alignment JSON sidecar and SRT.
+    Returns the fixture folder.
+    """
+    folder = Path(root) / f"{resolution}_{clips}clips_{duration}s"
+    done = folder / ".complete"
+    if done.exists():
+        return folder
+
+    shutil.rmtree(folder, ignore_errors=True)
+    for i, part in enumerate(["hook", "body", "packshot"]):
+        (folder / part).mkdir(parents=True)
+        for n in range(clips):
+            # Different pattern offsets and tones per clip, identical on every run
+            _ffmpeg([
+                '-f', 'lavfi', '-i', f"testsrc2=s={resolution}:r={fps}:d={duration}",
+                '-f', 'lavfi', '-i', f"sine=f={220 + 110 * (i * clips + n)}:d={duration}:sample_rate=44100",
+                '-vf', f"hue=h={60 * n}",
+                '-c:v', 'libx264', '-preset', 'veryfast', '-g', str(fps), '-pix_fmt', 'yuv420p',
+                '-c:a', 'aac', '-shortest',
+                str(folder / part / f"{part}_{n + 1}.mp4")
+            ])
+
+    (folder / "music").mkdir()
+    for n in range(clips):
+        _ffmpeg(['-f', 'lavfi', '-i', f"sine=f={440 + 40 * n}:d={duration * 3}", str(folder / "music" / f"music_{n + 1}.mp3")])
+
+    voice_seconds = duration * 2
+    _ffmpeg(['-f', 'lavfi', '-i', f"sine=f=300:d={voice_seconds}", str(folder / "voiceover.mp3")])
+    alignment = synthetic_alignment(voice_seconds / 60)
+    (folder / "voiceover.json").write_text(json.dumps(alignment), encoding='utf-8')
+    write_srt(alignment_cues(alignment), folder / "voiceover.srt")
+
+    done.touch()
+    return folder
+
+
+def scenarios(fixtures, output_dir):
+    """{name: argv} for every execution script benchmarked on one fixture set."""
+    py = sys.executable
+    script = lambda name: str(EXECUTION_DIR / name)
+    return {
+        "assemble_videos": [py, script("assemble_video.py"),
+                            "--hook_dir", str(fixtures / "hook"), "--body_dir", str(fixtures / "body"),
+                            "--packshot_dir", str(fixtures / "packshot"), "--output", str(output_dir / "assemble")],
+        "add_music": [py, script("add_music.py"), "--input", str(fixtures / "body"),
+                      "--music_dir", str(fixtures / "music"), "--output", str(output_dir / "add_music")],
+        "add_subtitles": [py, script("add_subtitles.py"), "--input", str(fixtures / "body"),
+                          "--subtitles", str(fixtures / "voiceover.srt"), "--output", str(output_dir / "add_subtitles")],
+        "apply_voiceover": [py, script("apply_voiceover.py"), "--video", str(fixtures / "body" / "body_1.mp4"),
+                            "--audio", str(fixtures / "voiceover.mp3"), "--subtitles", str(fixtures / "voiceover.srt"),
+                            "--output", str(output_dir / "apply_voiceover" / "body_1.mp4")],
+        "process_videos": [py, script("resize_video_1x1.py"), "--input", str(fixtures / "body"),
+                           "--output", str(output_dir / "process_videos")],
+    }
+
+
+def measure(cmd):
+    """
+    Runs cmd and returns its wall time plus the CPU time and peak RSS of the process tree.
+    Called in a fresh interpreter (see --measure) so RUSAGE_CHILDREN covers this command only.
+    """
+    start = time.perf_counter()
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    wall = time.perf_counter() - start
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss_kb = usage.ru_maxrss // 1024 if sys.platform == "darwin" else usage.ru_maxrss
+    return {
+        "returncode": result.returncode,
+        "wall_seconds": round(wall, 3),
+        "cpu_user_seconds": round(usage.ru_utime, 3),
+        "cpu_system_seconds": round(usage.ru_stime, 3),
+        "peak_rss_kb": rss_kb,
+        "log_tail": result.stdout.decode('utf-8', 'replace')[-2000:] if result.returncode else "",
+    }
+
+
+def _output_frames(folder):
+    """Total frames written under folder (duration x fps of every output video)."""
+    frames = 0
+    for f in Path(folder).rglob("*.mp4"):
+        try:
+            info = media_catalog.run_ffprobe(f)
+            frames += info["duration"] * (info["fps"] or 0)
+        except Exception:
+            pass
+    return frames
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=EXECUTION_DIR, check=True,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE).stdout.decode().strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=EXECUTION_DIR,
+                                    stdout=subprocess.PIPE, stderr=subprocess.PIPE).stdout.strip())
+        return commit, dirty
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return None, None
+
+
+def run_suite(resolutions=DEFAULT_RESOLUTIONS, clip_counts=DEFAULT_CLIP_COUNTS, only=None,
+              bench_dir=DEFAULT_BENCH_DIR, duration=4):
+    """Runs every scenario on every fixture set. Returns the JSON-serializable report."""
+    bench_dir = Path(bench_dir)
+    commit, dirty = git_revision()
+    ffmpeg_version = subprocess.run(['ffmpeg', '-version'], stdout=subprocess.PIPE).stdout.decode().splitlines()[0]
+    report = {
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "host": {"platform": platform.platform(), "cpu_count": os.cpu_count(), "ffmpeg": ffmpeg_version},
+        "results": [],
+    }
+
+    for resolution in resolutions:
+        for clips in clip_counts:
+            print(f"Preparing fixtures: {resolution}, {clips} clips...")
+            fixtures = generate_fixtures(bench_dir / "fixtures", resolution, clips, duration)
+            output_dir = bench_dir / "work"
+            for name, cmd in scenarios(fixtures, output_dir).items():
+                if only and name not in only:
+                    continue
+                shutil.rmtree(output_dir, ignore_errors=True)
+                output_dir.mkdir(parents=True)
+
+                print(f"  {name} ({resolution}, {clips} clips)...", end=" ", flush=True)
+                measured = subprocess.run(
+                    [sys.executable, __file__, "--measure", "--"] + cmd,
+                    check=True, stdout=subprocess.PIPE
+                )
+                metrics = json.loads(measured.stdout.decode().strip().splitlines()[-1])
+                frames = _output_frames(output_dir)
+                metrics.update({
+                    "scenario": name,
+                    "resolution": resolution,
+                    "clips": clips,
+                    "output_frames": round(frames),
+                    "fps": round(frames / metrics["wall_seconds"], 1) if metrics["wall_seconds"] else None,
+                })
+                report["results"].append(metrics)
+                status = "ok" if metrics["returncode"] == 0 else f"FAILED ({metrics['returncode']})"
+                print(f"{metrics['wall_seconds']:.2f}s, {metrics['fps']} fps, "
+                      f"{metrics['peak_rss_kb'] // 1024} MB peak - {status}")
+
+    shutil.rmtree(bench_dir / "work", ignore_errors=True)
+    return report
+
+
+def compare(baseline_file, candidate_file):
+    """Prints wall time and fps of two reports side by side."""
+    load = lambda f: json.loads(Path(f).read_text(encoding='utf-8'))
+    base, cand = load(baseline_file), load(candidate_file)
+    key = lambda r: (r["scenario"], r["resolution"], r["clips"])
+    base_results = {key(r): r for r in base["results"]}
+
+    print(f"Baseline {str(base['commit'])[:10]} vs candidate {str(cand['commit'])[:10]}")
+    print(f"  {'scenario':18s} {'res':>10s} {'clips':>5s} {'base s':>8s} {'cand s':>8s} {'change':>8s}")
+    for r in cand["results"]:
+        b = base_results.get(key(r))
+        if not b:
+            continue
+        change = (r["wall_seconds"] / b["wall_seconds"] - 1) * 100 if b["wall_seconds"] else 0
+        print(f"  {r['scenario']:18s} {r['resolution']:>10s} {r['clips']:5d} "
+              f"{b['wall_seconds']:8.2f} {r['wall_seconds']:8.2f} {change:+7.1f}%")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "--measure" and sys.argv[2] == "--":
+        # Internal: run one scenario in this fresh process and report its resource usage
+        print(json.dumps(measure(sys.argv[3:])))
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description="Benchmark every execution script on synthetic media.")
+    parser.add_argument("--resolutions", default=",".join(DEFAULT_RESOLUTIONS), help=f"Comma-separated WxH list (default {','.join(DEFAULT_RESOLUTIONS)})")
+    parser.add_argument("--clips", default=",".join(map(str, DEFAULT_CLIP_COUNTS)), help="Comma-separated clip counts per folder (default 1,2)")
+    parser.add_argument("--duration", type=float, default=4, help="Seconds per synthetic clip (default 4)")
+    parser.add_argument("--only", help="Comma-separated scenarios to run (assemble_videos, add_music, add_subtitles, apply_voiceover, process_videos)")
+    parser.add_argument("--dir", default=DEFAULT_BENCH_DIR, help=f"Fixtures and results folder (default {DEFAULT_BENCH_DIR})")
+    parser.add_argument("--output", help="Results JSON path (default <dir>/<timestamp>_<commit>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CANDIDATE"), help="Compare two results files instead of running")
+
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        sys.exit(0)
+
+    report = run_suite(
+        [r.strip() for r in args.resolutions.split(",") if r.strip()],
+        [int(c) for c in args.clips.split(",") if c.strip()],
+        set(s.strip() for s in args.only.split(",")) if args.only else None,
+        args.dir,
+        args.duration,
+    )
+
+    output = Path(args.output) if args.output else Path(args.dir) / f"{datetime.now():%Y-%m-%d_%H-%M-%S}_{str(report['commit'])[:10]}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2), encoding='utf-8')
+    print(f"Results saved to: {output}")
+    sys.exit(0 if all(r["returncode"] == 0 for r in report["results"]) else 1)
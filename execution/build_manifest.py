@@ -0,0 +1,104 @@
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+import media_catalog
+
+MANIFEST_NAME = ".build_manifest.jsonl"
+
+
+def output_key(cmd, extra_inputs=()):
+    """
+    Content address of an ffmpeg output: hash of the input files' bytes,
+    the filter graph and the encoder settings. Input paths are replaced by their
+    content hashes and the output path is dropped, so renames and moves don't
+    invalidate outputs while any change to inputs or settings does.
+    `extra_inputs` are files referenced inside filter strings (e.g. an SRT).
+    """
+    parts = []
+    args = cmd[:-1]
+    for i, arg in enumerate(args):
+        if i > 0 and args[i - 1] == '-i' and Path(arg).is_file():
+            parts.append("@" + media_catalog.content_hash(arg))
+        else:
+            parts.append(arg)
+    for extra in extra_inputs:
+        if extra:
+            parts.append("@" + media_catalog.content_hash(extra))
+    return hashlib.sha256("\0".join(parts).encode('utf-8')).hexdigest()
+
+
+class BuildManifest:
+    """
+    Append-only journal of completed outputs in a build directory.
+    Each finished output is recorded (name, key, size) as soon as its ffmpeg job succeeds,
+    so an interrupted batch resumes from where it stopped; partially written files
+    are never recorded and get re-rendered.
+    """
+
+    def __init__(self, output_dir):
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.path = self.output_dir / MANIFEST_NAME
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._pending = {}
+        lines = 0
+        if self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # Torn last line from a crash
+                    self._entries[entry["name"]] = entry
+                    lines += 1
+            if lines > 2 * len(self._entries) + 100:
+                self._compact()
+
+    def _compact(self):
+        """Rewrites the journal with one line per output."""
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for entry in self._entries.values():
+                f.write(json.dumps(entry) + "\n")
+        os.replace(tmp, self.path)
+
+    def is_up_to_date(self, output_file, key):
+        entry = self._entries.get(Path(output_file).name)
+        if not entry or entry["key"] != key:
+            return False
+        try:
+            return Path(output_file).stat().st_size == entry["size"]
+        except FileNotFoundError:
+            return False
+
+    def plan(self, cmd, extra_inputs=()):
+        """
+        Returns True if the command's output (cmd[-1]) must be rendered.
+        The key is remembered so record() can be called with just the output path.
+        """
+        output_file = cmd[-1]
+        key = output_key(cmd, extra_inputs)
+        if self.is_up_to_date(output_file, key):
+            return False
+        self._pending[Path(output_file).name] = key
+        return True
+
+    def record(self, output_file, key=None):
+        name = Path(output_file).name
+        key = key or self._pending.pop(name)
+        entry = {"name": name, "key": key, "size": Path(output_file).stat().st_size}
+        with self._lock:
+            self._entries[name] = entry
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def on_done(self, job, error):
+        """run_ffmpeg_jobs callback: record successful outputs."""
+        if error is None:
+            self.record(job.cmd[-1])
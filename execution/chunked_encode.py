@@ -0,0 +1,222 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import media_catalog
+from encoder_profiles import add_profile_argument, video_codec_args
+from ffmpeg_runner import run_ffmpeg
+from parallel_jobs import FFmpegJob, run_ffmpeg_jobs
+
+DEFAULT_CHUNK_DIR = ".tmp/chunks"
+# Target chunk length; chunks start at the first source keyframe after each multiple of this
+CHUNK_SECONDS = 10
+
+
+def plan_chunks(video_file, chunk_seconds=CHUNK_SECONDS):
+    """
+    Splits video_file into (start, end) spans of about `chunk_seconds` that start on source
+    keyframes (end is None for the last span), so every chunk decodes independently.
+    A tail shorter than half a chunk is merged into the previous span.
+    """
+    duration = media_catalog.probe(video_file)["duration"]
+    bounds = [0.0]
+    for k in media_catalog.keyframes(video_file):
+        if k - bounds[-1] >= chunk_seconds and duration - k >= chunk_seconds / 2:
+            bounds.append(k)
+    return list(zip(bounds, bounds[1:] + [None]))
+
+
+def chunk_command(video_file, start, end, output_file, video_filter=None, profile=None, fps=30):
+    """
+    ffmpeg command encoding the video of [start, end) on its own, with a closed GOP.
+    `video_filter` is a filter graph from [in] to [out]; it sees the source timestamps,
+    so time-based filters such as subtitles line up as in a single-process encode.
+    """
+    # Keyframe times are rounded to the microsecond: seek a quarter frame past the keyframe without
+    # dropping anything before it, and stop a quarter frame before the next one
+    margin = 0.25 / fps
+    cmd = ['ffmpeg', '-y', '-noaccurate_seek']
+    if start:
+        cmd.extend(['-ss', f"{start + margin:.6f}"])
+    if end is not None:
+        cmd.extend(['-t', f"{end - start - margin:.6f}"])
+    cmd.extend(['-i', str(video_file)])
+
+    # Rounded to the stream's time base, so a frame on a caption boundary stays on the same side of it
+    graph = f"[0:v]setpts=PTS-STARTPTS+round({start:.6f}/TB)[in];"
+    graph += video_filter if video_filter else "[in]null[out]"
+    graph += ";[out]setpts=PTS-STARTPTS[v]"
+    cmd.extend([
+        '-filter_complex', graph,
+        '-map', '[v]',
+        '-an',
+        *video_codec_args(profile),
+        '-flags', '+cgop',
+        str(output_file)
+    ])
+    return cmd
+
+
+def audio_command(audio_file, duration, output_file):
+    """Voiceover padded/trimmed to `duration`, encoded once for the whole output."""
+    return [
+        'ffmpeg', '-y', '-i', str(audio_file),
+        '-af', f"apad=whole_dur={duration},atrim=0:{duration}",
+        '-vn',
+        '-c:a', 'aac',
+        str(output_file)
+    ]
+
+
+def stream_timing(file_path):
+    """{codec_type: {"start", "duration", "frames"}} for the first video and audio stream (packets are counted, not decoded)."""
+    result = subprocess.run([
+        'ffprobe', '-v', 'error', '-count_packets',
+        '-show_entries', 'stream=codec_type,start_time,duration,nb_read_packets',
+        '-of', 'json', str(file_path)
+    ], capture_output=True, text=True, check=True)
+    timing = {}
+    for stream in json.loads(result.stdout).get('streams', []):
+        kind = stream.get('codec_type')
+        if kind in ('video', 'audio') and kind not in timing:
+            timing[kind] = {
+                "start": float(stream.get('start_time', 0) or 0),
+                "duration": float(stream.get('duration', 0) or 0),
+                "frames": int(stream.get('nb_read_packets', 0) or 0),
+            }
+    return timing
+
+
+def compare_timing(output_file, reference_file, fps=30, check_audio=True):
+    """
+    Checks that output_file has the reference's video frame count and duration, and the same
+    audio start and duration relative to the video (A/V sync), within one frame.
+    Returns a list of the differences found (empty if they match).
+    """
+    out, ref = stream_timing(output_file), stream_timing(reference_file)
+    tolerance = 1 / fps
+    problems = []
+    if "video" not in out:
+        return ["output has no video stream"]
+    if out["video"]["frames"] != ref["video"]["frames"]:
+        problems.append(f"video frames {out['video']['frames']} != {ref['video']['frames']}")
+    if abs(out["video"]["duration"] - ref["video"]["duration"]) > tolerance:
+        problems.append(f"video duration {out['video']['duration']:.3f}s != {ref['video']['duration']:.3f}s")
+    if check_audio and ("audio" in out) != ("audio" in ref):
+        problems.append("audio stream " + ("missing" if "audio" in ref else "unexpected"))
+    elif check_audio and "audio" in out:
+        offset = out["audio"]["start"] - out["video"]["start"]
+        ref_offset = ref["audio"]["start"] - ref["video"]["start"]
+        if abs(offset - ref_offset) > tolerance:
+            problems.append(f"audio starts {offset * 1000:+.0f}ms from video (expected {ref_offset * 1000:+.0f}ms)")
+        if abs(out["audio"]["duration"] - ref["audio"]["duration"]) > tolerance:
+            problems.append(f"audio duration {out['audio']['duration']:.3f}s != {ref['audio']['duration']:.3f}s")
+    return problems
+
+
+def chunked_encode(video_file, output_file, video_filter=None, audio_file=None, profile=None, jobs=None,
+                   chunk_seconds=CHUNK_SECONDS, chunk_dir=DEFAULT_CHUNK_DIR, reference_file=None):
+    """
+    Encodes one long output as keyframe-aligned chunks in up to `jobs` parallel ffmpeg processes
+    (default: one per CPU) with identical encoder settings, then joins them losslessly with the
+    concat demuxer. `video_filter` is a filter graph from [in] to [out] (see chunk_command).
+    The audio is not chunked: with `audio_file` (a voiceover) it is padded/trimmed to the video
+    and encoded once, alongside the chunks; otherwise the source audio is copied.
+    The result is checked against `reference_file` (default: the source) with compare_timing,
+    which a single-process encode of a frame-preserving filter would match.
+    Returns None on success, or the error (ffmpeg failure or timing mismatch).
+    """
+    video_file, output_file = Path(video_file), Path(output_file)
+    info = media_catalog.probe(video_file)
+    fps = info["fps"] or 30
+    spans = plan_chunks(video_file, chunk_seconds)
+
+    work_dir = Path(chunk_dir) / f"{output_file.stem}.{os.getpid()}"
+    work_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        chunks = [work_dir / f"chunk_{i:04d}.mp4" for i in range(len(spans))]
+        ffmpeg_jobs = [
+            FFmpegJob(f"Chunk {i + 1}/{len(spans)}: {video_file.name} [{start:.2f}s-{f'{end:.2f}s' if end is not None else 'end'}]",
+                      chunk_command(video_file, start, end, chunk, video_filter, profile, fps))
+            for i, ((start, end), chunk) in enumerate(zip(spans, chunks))
+        ]
+        if audio_file:
+            audio_out = work_dir / "audio.m4a"
+            ffmpeg_jobs.append(FFmpegJob(f"Audio: {Path(audio_file).name}", audio_command(audio_file, info["duration"], audio_out)))
+
+        print(f"Encoding '{video_file.name}' as {len(spans)} chunks.")
+        results = run_ffmpeg_jobs(ffmpeg_jobs, jobs or os.cpu_count() or 1)
+        errors = [error for _, error in results if error is not None]
+        if errors:
+            return errors[0]
+
+        concat_list = work_dir / "chunks.txt"
+        concat_list.write_text("".join(f"file '{c.resolve()}'\n" for c in chunks), encoding='utf-8')
+        output_file.parent.mkdir(parents=True, exist_ok=True)
+        cmd = [
+            'ffmpeg', '-y',
+            '-f', 'concat', '-safe', '0', '-i', str(concat_list),
+            '-i', str(audio_out if audio_file else video_file),
+            '-map', '0:v',
+            '-map', '1:a' if audio_file else '1:a?',
+            '-c', 'copy',
+            str(output_file)
+        ]
+        try:
+            run_ffmpeg(cmd, f"Concat: {output_file.name}")
+        except subprocess.CalledProcessError as e:
+            return e
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    # A voiceover replaces the source audio, so only the video timing is comparable to the source
+    problems = compare_timing(output_file, reference_file or video_file, fps, check_audio=bool(reference_file or not audio_file))
+    if problems:
+        return RuntimeError(f"Chunked output '{output_file.name}' does not match: " + "; ".join(problems))
+    return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-encode one long video as keyframe-aligned chunks in parallel, then join them losslessly.")
+    parser.add_argument("--input", required=True, help="Input video file")
+    parser.add_argument("--output", required=True, help="Output video file")
+    parser.add_argument("--jobs", type=int, help="Concurrent chunk encodes (default: CPU count)")
+    parser.add_argument("--chunk_seconds", type=float, default=CHUNK_SECONDS, help=f"Target chunk length in seconds (default {CHUNK_SECONDS})")
+    add_profile_argument(parser)
+    parser.add_argument("--verify", action="store_true",
+                        help="Also encode the video in a single process and compare duration, frame count, A/V sync and wall time")
+
+    args = parser.parse_args()
+
+    if not Path(args.input).exists():
+        print(f"Error: Input file '{args.input}' does not exist.")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    error = chunked_encode(args.input, args.output, profile=args.profile, jobs=args.jobs, chunk_seconds=args.chunk_seconds)
+    chunked_seconds = time.perf_counter() - start
+    if error:
+        print(f"Error: {error}")
+        sys.exit(1)
+    print(f"Chunked encode: {chunked_seconds:.1f}s -> {args.output}")
+
+    if args.verify:
+        output = Path(args.output)
+        single = output.with_name(f"{output.stem}.single{output.suffix}")
+        cmd = ['ffmpeg', '-y', '-i', args.input, '-map', '0:v', '-map', '0:a?', *video_codec_args(args.profile), '-c:a', 'copy', str(single)]
+        start = time.perf_counter()
+        run_ffmpeg(cmd, f"Single-process: {single.name}")
+        single_seconds = time.perf_counter() - start
+        print(f"Single-process encode: {single_seconds:.1f}s -> {single}")
+
+        problems = compare_timing(output, single, media_catalog.probe(args.input)["fps"] or 30)
+        for problem in problems:
+            print(f"  Mismatch: {problem}")
+        if problems:
+            sys.exit(1)
+        print(f"Duration, frame count and A/V sync match; speedup {single_seconds / chunked_seconds:.2f}x.")
@@ -0,0 +1,123 @@
+import argparse
+import fnmatch
+import itertools
+import math
+import random
+from pathlib import Path
+
+
+def parse_shard(value):
+    """Parses 'i/n' (1-based shard i of n) into (i, n)."""
+    try:
+        i, n = (int(x) for x in str(value).split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid shard '{value}': expected i/n, e.g. 2/4")
+    if not 1 <= i <= n:
+        raise argparse.ArgumentTypeError(f"invalid shard '{value}': i must be between 1 and n")
+    return i, n
+
+
+def decode(index, sizes):
+    """Mixed-radix decode of a flat product index into one position per axis (last axis fastest, like nested loops)."""
+    positions = []
+    for size in reversed(sizes):
+        index, position = divmod(index, size)
+        positions.append(position)
+    return positions[::-1]
+
+
+def load_patterns(values):
+    """Expands '@file' entries (one pattern per line, '#' comments) into the patterns they list."""
+    patterns = []
+    for value in values or ():
+        if value.startswith("@"):
+            for line in Path(value[1:]).read_text(encoding='utf-8').splitlines():
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    patterns.append(line)
+        else:
+            patterns.append(value)
+    return patterns
+
+
+def _reservoir(items, k, rng):
+    """k items drawn uniformly from an iterable of unknown length, in one pass and O(k) memory."""
+    picked = []
+    for n, item in enumerate(items):
+        if n < k:
+            picked.append(item)
+        else:
+            j = rng.randrange(n + 1)
+            if j < k:
+                picked[j] = item
+    return picked
+
+
+def combination_name(combo):
+    """Output stem of a combination: its files' stems joined by '_' (e.g. hook1_body2_pack1)."""
+    return "_".join(Path(str(item)).stem for item in combo)
+
+
+def select_combinations(axes, include=(), exclude=(), sample=None, seed=0, shard=None, limit=None, name=combination_name):
+    """
+    Lazily yields the Cartesian product of `axes` as tuples, in nested-loop order, narrowed down in this order:
+      include/exclude  glob patterns (or @files of patterns) matched against name(combo); a combination is
+                       kept if it matches any include (when given) and no exclude
+      sample           K combinations drawn at random with `seed`, so every host picks the same ones
+      shard            (i, n): every n-th of what is left starting with the i-th; shards are disjoint,
+                       cover everything and differ in size by at most one
+      limit            at most this many
+    Combinations are decoded from their index on demand, so the full product is never built.
+    """
+    axes = [list(axis) for axis in axes]
+    sizes = [len(axis) for axis in axes]
+    total = math.prod(sizes)
+    include, exclude = load_patterns(include), load_patterns(exclude)
+
+    def combo(index):
+        return tuple(axis[position] for axis, position in zip(axes, decode(index, sizes)))
+
+    def wanted(c):
+        n = name(c)
+        return ((not include or any(fnmatch.fnmatchcase(n, p) for p in include))
+                and not any(fnmatch.fnmatchcase(n, p) for p in exclude))
+
+    filtered = bool(include or exclude)
+    indices = range(total)
+    if sample is not None:
+        rng = random.Random(seed)
+        if filtered:
+            # The filtered population's size is unknown up front: one pass, keeping K
+            indices = sorted(_reservoir((i for i in indices if wanted(combo(i))), sample, rng))
+            filtered = False
+        elif sample < total:
+            indices = sorted(rng.sample(indices, sample))
+
+    selected = (combo(i) for i in indices)
+    if filtered:
+        selected = filter(wanted, selected)
+    if shard:
+        i, n = shard
+        selected = (c for k, c in enumerate(selected) if k % n == i - 1)
+    if limit is not None:
+        selected = itertools.islice(selected, limit)
+    return selected
+
+
+def add_selection_arguments(parser):
+    """Shared combination-selection options for the combinatorial stage CLIs."""
+    parser.add_argument("--include", action="append", default=[], metavar="PATTERN",
+                        help="Only render combinations whose output name matches this glob (repeatable; @file reads one pattern per line)")
+    parser.add_argument("--exclude", action="append", default=[], metavar="PATTERN",
+                        help="Skip combinations whose output name matches this glob (repeatable; @file reads one pattern per line)")
+    parser.add_argument("--sample", type=int, help="Render K combinations picked at random (see --seed)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for --sample (default 0)")
+    parser.add_argument("--shard", type=parse_shard, metavar="I/N",
+                        help="Render only shard I of N (e.g. 2/4); run every shard, on any hosts, to cover all combinations")
+    parser.add_argument("--limit", type=int, help="Render at most N combinations")
+
+
+def selection_from_args(args):
+    """select_combinations keyword arguments from add_selection_arguments options."""
+    return {"include": args.include, "exclude": args.exclude, "sample": args.sample, "seed": args.seed,
+            "shard": args.shard, "limit": args.limit}
@@ -1,149 +1,244 @@
 import argparse
+import hashlib
 import os
 import sys
 import time
-import requests
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+from api_cache import ApiCache, cache_key
+from stage_error import StageError
 
-def dub_voiceover(input_file, output_dir, source_lang="auto", target_lang="es"):
-    """
-    Dubs an audio file to a target language using ElevenLabs Dubbing API.
-    Downloads the dubbed audio and saves it to output_dir.
-    """
-    input_path = Path(input_file)
-    output_path = Path(output_dir)
+API_BASE = "https://api.elevenlabs.io/v1/dubbing"
+MAX_WAIT_SECONDS = 20 * 60
+MIN_POLL_SECONDS = 5
+MAX_POLL_SECONDS = 60
 
-    if not input_path.exists():
-        print(f"Error: Input file '{input_file}' does not exist.")
-        sys.exit(1)
 
-    output_path.mkdir(parents=True, exist_ok=True)
+def _create_dubbing_job(audio_bytes, filename, headers, source_lang, target_lang):
+    """Submits one dubbing job. Returns (dubbing_id, expected_duration_sec)."""
+    import requests
 
-    api_key = os.environ.get("ELEVENLABS_API_KEY")
-    if not api_key:
-        print("Error: ELEVENLABS_API_KEY environment variable is not set.")
-        sys.exit(1)
+    files = {
+        'file': (filename, audio_bytes, 'audio/mpeg')
+    }
+    data = {
+        'source_lang': source_lang,
+        'target_lang': target_lang,
+    }
 
-    print(f"Dubbing '{input_path.name}' from {source_lang} to {target_lang}...")
+    try:
+        response = requests.post(API_BASE, headers=headers, files=files, data=data)
+        response.raise_for_status()
+        result = response.json()
+    except requests.exceptions.RequestException as e:
+        detail = f" Response: {e.response.text}" if getattr(e, 'response', None) is not None else ""
+        raise RuntimeError(f"Error creating dubbing job: {e}.{detail}")
 
-    # Step 1: Create dubbing job
-    create_url = "https://api.elevenlabs.io/v1/dubbing"
-    headers = {
-        "xi-api-key": api_key
-    }
+    dubbing_id = result.get('dubbing_id')
+    if not dubbing_id:
+        raise RuntimeError(f"No dubbing_id returned. Response: {result}")
+    return dubbing_id, float(result.get('expected_duration_sec', 0) or 0)
 
-    with open(input_path, 'rb') as f:
-        files = {
-            'file': (input_path.name, f, 'audio/mpeg')
-        }
-        data = {
-            'source_lang': source_lang,
-            'target_lang': target_lang,
-        }
 
-        try:
-            response = requests.post(create_url, headers=headers, files=files, data=data)
-            response.raise_for_status()
-            result = response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"Error creating dubbing job: {e}")
-            if hasattr(e, 'response') and e.response is not None:
-                print(f"Response: {e.response.text}")
-            sys.exit(1)
+def _first_poll_delay(expected_duration):
+    """Initial wait derived from the API's own estimate instead of a fixed interval."""
+    return min(MAX_POLL_SECONDS, max(MIN_POLL_SECONDS, expected_duration * 0.5))
 
-    dubbing_id = result.get('dubbing_id')
-    expected_duration = result.get('expected_duration_sec', 0)
 
-    if not dubbing_id:
-        print(f"Error: No dubbing_id returned. Response: {result}")
-        sys.exit(1)
+def _next_poll_delay(delay):
+    return min(MAX_POLL_SECONDS, max(MIN_POLL_SECONDS, delay * 1.5))
 
-    print(f"Dubbing job created: {dubbing_id}")
-    print(f"Expected duration: {expected_duration:.1f}s")
-
-    # Step 2: Poll for completion
-    status_url = f"https://api.elevenlabs.io/v1/dubbing/{dubbing_id}"
-    max_attempts = 120  # Max 20 minutes (120 * 10s)
-    attempt = 0
-
-    while attempt < max_attempts:
-        attempt += 1
-        time.sleep(10)  # Poll every 10 seconds
-
-        try:
-            status_response = requests.get(status_url, headers=headers)
-            status_response.raise_for_status()
-            status_data = status_response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"Error checking status: {e}")
-            continue
-
-        status = status_data.get('status', 'unknown')
-        print(f"Status: {status} (attempt {attempt})")
-
-        if status == 'dubbed':
-            print("Dubbing completed!")
-            break
-        elif status == 'failed':
-            error = status_data.get('error', 'Unknown error')
-            print(f"Dubbing failed: {error}")
-            sys.exit(1)
-    else:
-        print("Error: Dubbing timed out after 20 minutes.")
-        sys.exit(1)
 
-    # Step 3: Download dubbed audio
-    download_url = f"https://api.elevenlabs.io/v1/dubbing/{dubbing_id}/audio/{target_lang}"
+def _download_results(dubbing_id, target_lang, headers, stem, output_path):
+    """Downloads the dubbed audio and (best-effort) the dubbed SRT transcript. Returns the audio path."""
+    import requests
+
+    download_url = f"{API_BASE}/{dubbing_id}/audio/{target_lang}"
 
     try:
         download_response = requests.get(download_url, headers=headers)
         download_response.raise_for_status()
     except requests.exceptions.RequestException as e:
-        print(f"Error downloading dubbed audio: {e}")
-        if hasattr(e, 'response') and e.response is not None:
-            print(f"Response: {e.response.text}")
-        sys.exit(1)
-
-    # Save dubbed audio
-    output_filename = f"{input_path.stem}_{target_lang}.mp3"
-    output_file_path = output_path / output_filename
+        detail = f" Response: {e.response.text}" if getattr(e, 'response', None) is not None else ""
+        raise RuntimeError(f"Error downloading dubbed audio: {e}.{detail}")
 
+    output_file_path = output_path / f"{stem}_{target_lang}.mp3"
     with open(output_file_path, 'wb') as f:
         f.write(download_response.content)
 
-    print(f"Success! Dubbed audio saved to: {output_file_path}")
+    print(f"[{target_lang}] Success! Dubbed audio saved to: {output_file_path}")
 
-    # Step 4: Download dubbed transcript (SRT)
-    print(f"Downloading transcript for {target_lang}...")
-    transcript_url = f"https://api.elevenlabs.io/v1/dubbing/{dubbing_id}/transcript/{target_lang}"
+    print(f"[{target_lang}] Downloading transcript...")
+    transcript_url = f"{API_BASE}/{dubbing_id}/transcript/{target_lang}"
+    # A transcript from an earlier dub must not pass for this one's (or get cached with it)
+    srt_file_path = output_path / f"{stem}_{target_lang}.srt"
+    srt_file_path.unlink(missing_ok=True)
 
     try:
         transcript_response = requests.get(transcript_url, headers=headers)
         transcript_response.raise_for_status()
 
-        # Save dubbed transcript
-        srt_filename = f"{input_path.stem}_{target_lang}.srt"
-        srt_file_path = output_path / srt_filename
-
         with open(srt_file_path, 'wb') as f:
             f.write(transcript_response.content)
 
-        print(f"Success! Dubbed transcript saved to: {srt_file_path}")
+        print(f"[{target_lang}] Success! Dubbed transcript saved to: {srt_file_path}")
 
     except requests.exceptions.RequestException as e:
-        print(f"Warning: Could not download transcript: {e}")
+        print(f"[{target_lang}] Warning: Could not download transcript: {e}")
 
     return str(output_file_path)
 
 
+def dub_voiceover_multi(input_file, output_dir, source_lang="auto", target_langs=("es",), use_cache=True, refresh_cache=False):
+    """
+    Dubs an audio file into several languages at once.
+    The file is read once, all jobs are submitted concurrently and polled from a single loop
+    with backoff seeded from each job's expected_duration_sec; each language is downloaded
+    as soon as its job completes. Total latency follows the slowest language.
+    Results are cached on disk by (audio hash, source_lang, target_lang); cached languages
+    skip the API entirely. refresh_cache re-dubs and overwrites; use_cache=False bypasses the cache.
+    Returns {target_lang: dubbed audio path, or None if that language failed}.
+    """
+    input_path = Path(input_file)
+    output_path = Path(output_dir)
+
+    if not input_path.exists():
+        raise StageError(f"Input file '{input_file}' does not exist.")
+
+    output_path.mkdir(parents=True, exist_ok=True)
+
+    target_langs = list(dict.fromkeys(target_langs))
+    audio_bytes = input_path.read_bytes()
+    results = {lang: None for lang in target_langs}
+
+    cache = ApiCache() if use_cache else None
+    audio_hash = hashlib.sha256(audio_bytes).hexdigest()
+    keys = {lang: cache_key(audio=audio_hash, source_lang=source_lang, target_lang=lang) for lang in target_langs}
+    if cache and not refresh_cache:
+        for lang in list(target_langs):
+            audio_out = output_path / f"{input_path.stem}_{lang}.mp3"
+            srt_out = output_path / f"{input_path.stem}_{lang}.srt"
+            # Entries cached without a transcript must not leave an older one next to the audio
+            srt_out.unlink(missing_ok=True)
+            if cache.restore("dubbing", keys[lang], {"audio.mp3": audio_out, "transcript.srt": srt_out}):
+                print(f"[{lang}] Cache hit. Restored: {audio_out}")
+                results[lang] = str(audio_out)
+                target_langs.remove(lang)
+        if not target_langs:
+            return results
+
+    api_key = os.environ.get("ELEVENLABS_API_KEY")
+    if not api_key:
+        raise StageError("ELEVENLABS_API_KEY environment variable is not set.")
+
+    # Imported here, like in the other API scripts: cache hits and importers that never call the API skip it
+    import requests
+
+    print(f"Dubbing '{input_path.name}' from {source_lang} to {', '.join(target_langs)}...")
+
+    headers = {
+        "xi-api-key": api_key
+    }
+
+    with ThreadPoolExecutor(max_workers=max(1, len(target_langs))) as pool:
+        # Step 1: Create all dubbing jobs concurrently
+        created = {
+            lang: pool.submit(_create_dubbing_job, audio_bytes, input_path.name, headers, source_lang, lang)
+            for lang in target_langs
+        }
+
+        now = time.monotonic()
+        pending = {}
+        for lang, future in created.items():
+            try:
+                dubbing_id, expected = future.result()
+            except RuntimeError as e:
+                print(f"[{lang}] {e}")
+                continue
+            delay = _first_poll_delay(expected)
+            pending[lang] = {"id": dubbing_id, "delay": delay, "next": now + delay, "attempt": 0}
+            print(f"[{lang}] Dubbing job created: {dubbing_id} (expected duration: {expected:.1f}s)")
+
+        # Step 2: Poll every pending job from one loop; download each as soon as it is dubbed
+        deadline = time.monotonic() + MAX_WAIT_SECONDS
+        downloads = {}
+        while pending and time.monotonic() < deadline:
+            lang, job = min(pending.items(), key=lambda item: item[1]["next"])
+            time.sleep(max(0.0, job["next"] - time.monotonic()))
+            job["attempt"] += 1
+
+            try:
+                status_response = requests.get(f"{API_BASE}/{job['id']}", headers=headers)
+                status_response.raise_for_status()
+                status_data = status_response.json()
+            except requests.exceptions.RequestException as e:
+                print(f"[{lang}] Error checking status: {e}")
+                status_data = {}
+
+            status = status_data.get('status', 'unknown')
+            print(f"[{lang}] Status: {status} (attempt {job['attempt']})")
+
+            if status == 'dubbed':
+                print(f"[{lang}] Dubbing completed!")
+                downloads[lang] = pool.submit(_download_results, job["id"], lang, headers, input_path.stem, output_path)
+                del pending[lang]
+            elif status == 'failed':
+                print(f"[{lang}] Dubbing failed: {status_data.get('error', 'Unknown error')}")
+                del pending[lang]
+            else:
+                job["delay"] = _next_poll_delay(job["delay"])
+                job["next"] = time.monotonic() + job["delay"]
+
+        for lang in pending:
+            print(f"[{lang}] Error: Dubbing timed out after {MAX_WAIT_SECONDS // 60} minutes.")
+
+        # Step 3: Collect downloads
+        for lang, future in downloads.items():
+            try:
+                results[lang] = future.result()
+            except RuntimeError as e:
+                print(f"[{lang}] {e}")
+                continue
+            if cache:
+                srt_path = Path(results[lang]).with_suffix(".srt")
+                files = {"audio.mp3": results[lang]}
+                if srt_path.exists():
+                    files["transcript.srt"] = srt_path
+                cache.put("dubbing", keys[lang], files)
+
+    return results
+
+
+def dub_voiceover(input_file, output_dir, source_lang="auto", target_lang="es", use_cache=True, refresh_cache=False):
+    """
+    Dubs an audio file to a target language using ElevenLabs Dubbing API.
+    Downloads the dubbed audio and saves it to output_dir.
+    """
+    result = dub_voiceover_multi(input_file, output_dir, source_lang, [target_lang], use_cache, refresh_cache)[target_lang]
+    if not result:
+        raise StageError(f"Dubbing '{Path(input_file).name}' to '{target_lang}' failed.")
+    return result
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Dub audio to another language using ElevenLabs API.")
     parser.add_argument("--input", required=True, help="Input audio file")
     parser.add_argument("--output", required=True, help="Output directory for dubbed audio")
     parser.add_argument("--source_lang", default="auto", help="Source language (ISO 639-1 code or 'auto')")
-    parser.add_argument("--target_lang", default="es", help="Target language (ISO 639-1 code)")
+    parser.add_argument("--target_lang", default="es", help="Target language (ISO 639-1 code), or a comma-separated list (e.g. es,pl,uk) to dub concurrently")
+    parser.add_argument("--no_cache", action="store_true", help="Bypass the local response cache")
+    parser.add_argument("--refresh_cache", action="store_true", help="Ignore cached results and overwrite them with fresh dubs")
 
     args = parser.parse_args()
 
-    dub_voiceover(args.input, args.output, args.source_lang, args.target_lang)
+    targets = [lang.strip() for lang in args.target_lang.split(",") if lang.strip()]
+    try:
+        results = dub_voiceover_multi(args.input, args.output, args.source_lang, targets, not args.no_cache, args.refresh_cache)
+    except StageError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    failed = [lang for lang, path in results.items() if not path]
+    if failed:
+        print(f"Failed languages: {', '.join(failed)}")
+        sys.exit(1)
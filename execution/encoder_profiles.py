@@ -0,0 +1,120 @@
+import argparse
+import json
+import re
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import media_catalog
+from ffmpeg_runner import run_ffmpeg
+
+# Named libx264 settings. gop/tune of None leave the encoder default.
+# Thread counts are not part of a profile: parallel_jobs caps each process to its share
+# of the CPU (thread_budget) for the batch it runs in.
+PROFILES = {
+    # Fast previews; quality is secondary
+    "draft": {"preset": "ultrafast", "crf": 28, "tune": None, "gop": None},
+    # Files that are decoded again by a later stage: fast to encode and to decode, near-lossless, regular keyframes
+    "intermediate": {"preset": "veryfast", "crf": 16, "tune": "fastdecode", "gop": 60},
+    # libx264's own defaults, spelled out
+    "default": {"preset": "medium", "crf": 23, "tune": None, "gop": None},
+    # Final deliverables: smaller files at the same quality, web-friendly MP4
+    "delivery": {"preset": "slow", "crf": 20, "tune": None, "gop": 60},
+}
+DEFAULT_CALIBRATION_DIR = ".tmp/encoder_calibration"
+
+
+def video_codec_args(profile=None):
+    """
+    libx264 output options for a named profile (see PROFILES).
+    profile=None keeps the stage's previous behaviour: libx264 with its defaults.
+    """
+    if profile is None:
+        return ['-c:v', 'libx264']
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown encoder profile '{profile}'. Choose from: {', '.join(PROFILES)}")
+
+    p = PROFILES[profile]
+    args = ['-c:v', 'libx264', '-preset', p["preset"], '-crf', str(p["crf"])]
+    if p["tune"]:
+        args.extend(['-tune', p["tune"]])
+    if p["gop"]:
+        args.extend(['-g', str(p["gop"])])
+    if profile == "delivery":
+        args.extend(['-pix_fmt', 'yuv420p', '-movflags', '+faststart'])
+    return args
+
+
+def add_profile_argument(parser):
+    """Shared --profile option for stage CLIs."""
+    parser.add_argument("--profile", choices=list(PROFILES),
+                        help="Encoder profile (draft, intermediate, default, delivery). Default: libx264 defaults")
+
+
+def _quality(encoded, reference, seconds):
+    """SSIM (All) and PSNR (average) of `encoded` against the first `seconds` of `reference`."""
+    result = subprocess.run([
+        'ffmpeg', '-t', str(seconds), '-i', str(encoded), '-t', str(seconds), '-i', str(reference),
+        '-lavfi', '[0:v]split[e0][e1];[1:v]split[r0][r1];[e0][r0]ssim;[e1][r1]psnr',
+        '-f', 'null', '-'
+    ], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    log = result.stderr.decode('utf-8', 'replace')
+    ssim = re.search(r'SSIM .*All:([\d.]+)', log)
+    psnr = re.search(r'PSNR .*average:([\d.]+|inf)', log)
+    return (float(ssim.group(1)) if ssim else None, float(psnr.group(1)) if psnr else None)
+
+
+def calibrate(sample_file, seconds=10, profiles=None, output_dir=DEFAULT_CALIBRATION_DIR):
+    """
+    Encodes the first `seconds` of sample_file under each profile and measures encode fps,
+    file size and SSIM/PSNR against the source. Returns {profile: metrics}.
+    """
+    info = media_catalog.probe(sample_file)
+    seconds = min(seconds, info["duration"])
+    frames = seconds * (info["fps"] or 30)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    results = {}
+    for profile in profiles or PROFILES:
+        output_file = output_dir / f"{Path(sample_file).stem}_{profile}.mp4"
+        cmd = ['ffmpeg', '-y', '-t', str(seconds), '-i', str(sample_file), '-an'] + video_codec_args(profile) + [str(output_file)]
+        start = time.perf_counter()
+        run_ffmpeg(cmd, f"Calibrate: {profile}")
+        elapsed = time.perf_counter() - start
+
+        ssim, psnr = _quality(output_file, sample_file, seconds)
+        results[profile] = {
+            "encode_fps": round(frames / elapsed, 1),
+            "seconds": round(elapsed, 2),
+            "size_bytes": output_file.stat().st_size,
+            "kbps": round(output_file.stat().st_size * 8 / 1000 / seconds, 1),
+            "ssim": ssim,
+            "psnr": psnr,
+        }
+
+    print(f"Calibration on '{Path(sample_file).name}' ({seconds:.1f}s, {info['width']}x{info['height']}):")
+    print(f"  {'profile':12s} {'fps':>7s} {'kbps':>8s} {'SSIM':>7s} {'PSNR':>7s}")
+    for profile, m in results.items():
+        print(f"  {profile:12s} {m['encode_fps']:7.1f} {m['kbps']:8.0f} {m['ssim'] or 0:7.4f} {m['psnr'] or 0:7.2f}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calibrate encoder profiles on a sample clip (speed, size, SSIM/PSNR).")
+    parser.add_argument("--calibrate", required=True, metavar="SAMPLE", help="Sample video to encode under each profile")
+    parser.add_argument("--seconds", type=float, default=10, help="Length of the sample to encode (default 10)")
+    parser.add_argument("--profiles", help=f"Comma-separated subset of {', '.join(PROFILES)} (default all)")
+    parser.add_argument("--json", help="Also write the measurements to this JSON file")
+
+    args = parser.parse_args()
+
+    if not Path(args.calibrate).exists():
+        print(f"Error: Sample '{args.calibrate}' does not exist.")
+        sys.exit(1)
+
+    profiles = [p.strip() for p in args.profiles.split(",")] if args.profiles else None
+    results = calibrate(args.calibrate, args.seconds, profiles)
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2), encoding='utf-8')
@@ -0,0 +1,230 @@
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+
+# Set FFMPEG_METRICS to a .jsonl path to log one metrics record per ffmpeg run;
+# set FFMPEG_BENCHMARK=1 to add ffmpeg's -benchmark CPU/RSS figures to each record.
+METRICS_PATH = os.environ.get("FFMPEG_METRICS")
+BENCHMARK = os.environ.get("FFMPEG_BENCHMARK") == "1"
+STDERR_LINES = 200
+
+_metrics_lock = threading.Lock()
+
+
+class FFmpegError(subprocess.CalledProcessError):
+    """
+    A failed ffmpeg run. `stderr` holds only the last lines of the log (bytes, like
+    CalledProcessError), so existing `e.stderr.decode()` handlers keep working.
+    """
+
+    def __init__(self, returncode, cmd, stderr_tail, progress=None):
+        super().__init__(returncode, cmd, output=None, stderr=stderr_tail)
+        self.progress = progress or {}
+
+
+def output_files(cmd):
+    """The file(s) a command writes: its last argument, or each slave of a `-f tee` output."""
+    if not any(opt == '-f' and fmt == 'tee' for opt, fmt in zip(cmd, cmd[1:])):
+        return [cmd[-1]]
+    slaves = re.split(r"(?<!\\)\|", cmd[-1])
+    return [re.sub(r"\\(.)", r"\1", re.sub(r"^\[[^\]]*\]", "", slave)) for slave in slaves]
+
+
+def _parse_bench(lines):
+    """Values from -benchmark's 'bench: utime=1.2s stime=0.1s rtime=1.5s' and 'bench: maxrss=1234kB' lines."""
+    bench = {}
+    for line in lines:
+        if not line.startswith(b"bench:"):
+            continue
+        for field in line.decode('utf-8', 'replace').split()[1:]:
+            key, _, value = field.partition("=")
+            if value.endswith(("kB", "KiB")):
+                bench[f"{key}_kb"] = int(value.rstrip("kKiB"))
+            elif value.endswith("s"):
+                try:
+                    bench[f"{key}_seconds"] = float(value[:-1])
+                except ValueError:
+                    pass
+    return bench
+
+
+def _snapshot(progress):
+    """Typed view of one -progress block."""
+    def num(key, cast=float):
+        try:
+            return cast(progress[key])
+        except (KeyError, ValueError):
+            return None
+    out_time_us = num("out_time_us", int) or num("out_time_ms", int)
+    speed = progress.get("speed", "").rstrip("x").strip()
+    return {
+        "frame": num("frame", int),
+        "fps": num("fps"),
+        "speed": float(speed) if speed not in ("", "N/A") else None,
+        "out_time_seconds": out_time_us / 1e6 if out_time_us is not None else None,
+        "total_size": num("total_size", int),
+        "progress": progress.get("progress"),
+    }
+
+
+def print_progress(label, snapshot):
+    """on_progress callback that keeps one live status line on a terminal."""
+    if snapshot["progress"] == "end":
+        sys.stdout.write("\r\033[K")
+    else:
+        sys.stdout.write(
+            f"\r\033[K  frame={snapshot['frame']} fps={snapshot['fps']} "
+            f"speed={snapshot['speed']}x time={snapshot['out_time_seconds'] or 0:.1f}s"
+        )
+    sys.stdout.flush()
+
+
+def record_metrics(record, path=None):
+    """Appends one JSON line to the metrics file (FFMPEG_METRICS) if one is configured."""
+    path = path or METRICS_PATH
+    if not path:
+        return
+    with _metrics_lock, open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def _drain(stream, tail):
+    for line in stream:
+        tail.append(line)
+
+
+def run_ffmpeg(cmd, label=None, on_progress=None, stderr_lines=STDERR_LINES, benchmark=None, metrics_path=None, stdin=None, cwd=None):
+    """
+    Runs an ffmpeg command with `-progress` on a private pipe.
+    on_progress(label, snapshot) is called for every progress block (frame, fps, speed,
+    out_time_seconds). Only the last `stderr_lines` lines of the log are kept.
+    `stdin` (e.g. an upstream process's stdout, for `-i pipe:0`) is handed to ffmpeg
+    and closed in this process. Relative paths in `cmd` are resolved against `cwd`
+    (default: this process's working directory).
+    Returns the metrics record; raises FFmpegError (a CalledProcessError) on failure.
+    An exception raised by on_progress kills ffmpeg and propagates.
+    """
+    benchmark = BENCHMARK if benchmark is None else benchmark
+    label = label or cmd[-1]
+
+    progress_read, progress_write = os.pipe()
+    extra = ['-progress', f'pipe:{progress_write}', '-nostats']
+    if benchmark:
+        extra.append('-benchmark')
+    full_cmd = [cmd[0]] + extra + list(cmd[1:])
+
+    tail = deque(maxlen=stderr_lines)
+    start = time.time()
+    try:
+        proc = subprocess.Popen(full_cmd, stdin=stdin if stdin is not None else subprocess.DEVNULL,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, pass_fds=(progress_write,), cwd=cwd)
+    finally:
+        os.close(progress_write)
+        if stdin is not None:
+            # Only ffmpeg may hold the read end, so the writer sees a broken pipe if ffmpeg dies
+            stdin.close()
+
+    reader = threading.Thread(target=_drain, args=(proc.stderr, tail), daemon=True)
+    reader.start()
+
+    last = {}
+    block = {}
+    with os.fdopen(progress_read, 'r', encoding='utf-8', errors='replace') as progress_pipe:
+        try:
+            for line in progress_pipe:
+                key, _, value = line.strip().partition("=")
+                block[key] = value
+                if key == "progress":
+                    last = _snapshot(block)
+                    block = {}
+                    if on_progress:
+                        on_progress(label, last)
+        except BaseException:
+            # on_progress raised (e.g. the job was cancelled): don't leave ffmpeg running
+            proc.kill()
+            proc.wait()
+            raise
+
+    returncode = proc.wait()
+    reader.join()
+    wall = time.time() - start
+
+    record = {
+        "label": label,
+        "output": str(cmd[-1]),
+        "started": round(start, 3),
+        "wall_seconds": round(wall, 3),
+        "returncode": returncode,
+        "frames": last.get("frame"),
+        "fps": round(last["frame"] / wall, 2) if last.get("frame") and wall else None,
+        "speed": last.get("speed"),
+        "out_time_seconds": last.get("out_time_seconds"),
+    }
+    if benchmark:
+        record["bench"] = _parse_bench(tail)
+    record_metrics(record, metrics_path)
+
+    if returncode != 0:
+        raise FFmpegError(returncode, full_cmd, b"".join(tail), last)
+    return record
+
+
+def run_ffmpeg_chain(cmds, label=None, on_progress=None, stderr_lines=STDERR_LINES, benchmark=None, metrics_path=None, cwd=None):
+    """
+    Runs ffmpeg commands as one streaming chain: every command but the last writes to
+    `pipe:1` and the next one reads it from `pipe:0`, all running concurrently.
+    Progress and metrics come from the last command (see run_ffmpeg).
+    A failing stage also breaks its neighbours (broken pipe upstream, truncated input
+    downstream), so the raised FFmpegError carries the log tail of every failed stage.
+    An exception raised by on_progress kills and reaps every stage, then propagates.
+    """
+    upstream = []
+    stdin = None
+    for cmd in cmds[:-1]:
+        tail = deque(maxlen=stderr_lines)
+        proc = subprocess.Popen(cmd, stdin=stdin if stdin is not None else subprocess.DEVNULL,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=cwd)
+        if stdin is not None:
+            stdin.close()
+        reader = threading.Thread(target=_drain, args=(proc.stderr, tail), daemon=True)
+        reader.start()
+        upstream.append((cmd, proc, tail, reader))
+        stdin = proc.stdout
+
+    failed = []
+    try:
+        record = run_ffmpeg(cmds[-1], label, on_progress, stderr_lines, benchmark, metrics_path, stdin=stdin, cwd=cwd)
+    except FFmpegError as e:
+        failed.append((len(cmds), e))
+    except BaseException:
+        # on_progress raised (e.g. LeaseLost in a farm worker): don't leave the upstream stages running
+        for _, proc, _, reader in upstream:
+            proc.kill()
+            proc.wait()
+            reader.join()
+        raise
+
+    for stage, (cmd, proc, tail, reader) in enumerate(upstream, 1):
+        returncode = proc.wait()
+        reader.join()
+        if returncode != 0:
+            failed.append((stage, FFmpegError(returncode, cmd, b"".join(tail))))
+
+    if not failed:
+        return record
+
+    # An upstream failure can leave the last stage with short but playable files; don't keep them
+    for output in output_files(cmds[-1]):
+        output = os.path.join(cwd or "", output)
+        if os.path.isfile(output):
+            os.remove(output)
+    failed.sort(key=lambda f: f[0])
+    stage, first = failed[0]
+    log = b"".join(f"--- stage {n}/{len(cmds)}: {e.cmd[0]} (exit {e.returncode}) ---\n".encode() + e.stderr
+                   for n, e in failed)
+    raise FFmpegError(first.returncode, first.cmd, log, failed[-1][1].progress)
@@ -0,0 +1,187 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import namedtuple
+from pathlib import Path
+
+# Override with JOB_QUEUE=/path/to/queue.sqlite
+DEFAULT_QUEUE_PATH = os.environ.get("JOB_QUEUE", ".tmp/job_queue.sqlite")
+# A job's life: queued -> running -> done, or back to queued (retry) until it is failed
+STATES = ("queued", "running", "done", "failed")
+
+# payload: JSON-serializable dict; attempts counts runs started so far
+Job = namedtuple("Job", ["id", "kind", "key", "payload", "attempts", "max_attempts"])
+
+
+class JobQueue:
+    """
+    SQLite-backed job queue. Jobs are deduplicated by key, claimed atomically (so several
+    worker threads or processes can share one queue) and retried with exponential backoff
+    until max_attempts runs have failed.
+    """
+
+    def __init__(self, db_path=DEFAULT_QUEUE_PATH, retry_delay=30):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.retry_delay = retry_delay
+        self._lock = threading.Lock()
+        # Autocommit: transactions are opened explicitly so claims can take the write lock up front
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=30, isolation_level=None)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " kind TEXT NOT NULL,"
+                " key TEXT NOT NULL UNIQUE,"
+                " payload TEXT NOT NULL,"
+                " state TEXT NOT NULL DEFAULT 'queued',"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " max_attempts INTEGER NOT NULL DEFAULT 3,"
+                " not_before REAL NOT NULL DEFAULT 0,"
+                " error TEXT,"
+                " result TEXT,"
+                " created_at REAL NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, not_before)")
+
+    def enqueue(self, kind, key, payload, max_attempts=3):
+        """Adds a job unless one with the same key was ever queued. Returns True if it was added."""
+        now = time.time()
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT OR IGNORE INTO jobs (kind, key, payload, max_attempts, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (kind, key, json.dumps(payload), max_attempts, now, now)
+            )
+        return cur.rowcount == 1
+
+    def claim(self, exclude_kinds=()):
+        """
+        Marks the oldest runnable queued job as running and returns it (None if there is none).
+        Jobs of `exclude_kinds` are left for later.
+        """
+        now = time.time()
+        query = "SELECT id, kind, key, payload, attempts, max_attempts FROM jobs WHERE state = 'queued' AND not_before <= ?"
+        params = [now]
+        if exclude_kinds:
+            query += f" AND kind NOT IN ({', '.join('?' * len(exclude_kinds))})"
+            params.extend(exclude_kinds)
+        query += " ORDER BY id LIMIT 1"
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(query, params).fetchone()
+                if row:
+                    self._conn.execute(
+                        "UPDATE jobs SET state = 'running', attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                        (now, row[0])
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if not row:
+            return None
+        return Job(row[0], row[1], row[2], json.loads(row[3]), row[4] + 1, row[5])
+
+    def complete(self, job_id, result=None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET state = 'done', error = NULL, result = ?, updated_at = ? WHERE id = ?",
+                (json.dumps(result, default=str), time.time(), job_id)
+            )
+
+    def fail(self, job_id, error):
+        """
+        Records a failed run. The job is queued again after retry_delay * 2^(attempts - 1)
+        seconds, or marked failed once it has used up its attempts. Returns the new state.
+        """
+        now = time.time()
+        with self._lock:
+            attempts, max_attempts = self._conn.execute(
+                "SELECT attempts, max_attempts FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            state = "queued" if attempts < max_attempts else "failed"
+            not_before = now + self.retry_delay * 2 ** max(0, attempts - 1) if state == "queued" else 0
+            self._conn.execute(
+                "UPDATE jobs SET state = ?, error = ?, not_before = ?, updated_at = ? WHERE id = ?",
+                (state, str(error), not_before, now, job_id)
+            )
+        return state
+
+    def recover(self):
+        """
+        Requeues jobs left running by a worker that died. Call it before starting workers,
+        while no other process is working the queue.
+        The interrupted run counts as an attempt, so a job that keeps killing its worker ends up failed.
+        Returns the number of jobs requeued.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET state = 'failed', error = 'interrupted', updated_at = ?"
+                " WHERE state = 'running' AND attempts >= max_attempts", (now,)
+            )
+            cur = self._conn.execute(
+                "UPDATE jobs SET state = 'queued', not_before = 0, updated_at = ? WHERE state = 'running'", (now,)
+            )
+        return cur.rowcount
+
+    def retry_failed(self):
+        """Gives every failed job a fresh set of attempts. Returns how many were requeued."""
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE jobs SET state = 'queued', attempts = 0, not_before = 0, updated_at = ? WHERE state = 'failed'",
+                (time.time(),)
+            )
+        return cur.rowcount
+
+    def next_due(self):
+        """Seconds until the earliest queued job becomes runnable (None if nothing is queued)."""
+        with self._lock:
+            row = self._conn.execute("SELECT MIN(not_before) FROM jobs WHERE state = 'queued'").fetchone()
+        return None if row[0] is None else max(0.0, row[0] - time.time())
+
+    def counts(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        return {state: dict(rows).get(state, 0) for state in STATES}
+
+    def recent(self, limit=20):
+        """The most recently updated jobs as dicts, newest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, kind, key, state, attempts, max_attempts, error, updated_at FROM jobs"
+                " ORDER BY updated_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        fields = ("id", "kind", "key", "state", "attempts", "max_attempts", "error", "updated_at")
+        return [dict(zip(fields, row)) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or maintain the pipeline job queue.")
+    parser.add_argument("--queue", default=DEFAULT_QUEUE_PATH, help=f"Queue database (default {DEFAULT_QUEUE_PATH})")
+    parser.add_argument("--retry_failed", action="store_true", help="Requeue failed jobs with fresh attempts")
+    parser.add_argument("--limit", type=int, default=20, help="Recent jobs to list (default 20)")
+
+    args = parser.parse_args()
+
+    if not Path(args.queue).exists():
+        print(f"Error: Queue '{args.queue}' does not exist.")
+        sys.exit(1)
+
+    queue = JobQueue(args.queue)
+    if args.retry_failed:
+        print(f"Requeued {queue.retry_failed()} failed jobs.")
+    print(json.dumps({"counts": queue.counts(), "recent": queue.recent(args.limit)}, indent=2))
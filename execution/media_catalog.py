@@ -0,0 +1,426 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Shared across all execution scripts; override with MEDIA_CATALOG=/path/to/catalog.sqlite
+DEFAULT_CATALOG_PATH = os.environ.get("MEDIA_CATALOG", ".tmp/media_catalog.sqlite")
+
+
+def _file_stamp(path):
+    """Returns (resolved path, size, mtime_ns) used as the cache key."""
+    resolved = Path(path).resolve()
+    st = resolved.stat()
+    return str(resolved), st.st_size, st.st_mtime_ns
+
+
+def _parse_rate(rate):
+    """Converts an ffprobe rational like '30000/1001' into a float."""
+    try:
+        num, den = rate.split('/')
+        return float(num) / float(den) if float(den) else 0.0
+    except (AttributeError, ValueError):
+        return 0.0
+
+
+def run_ffprobe(file_path):
+    """
+    Probes a file once and returns a flat info dict:
+    duration, width, height, has_audio, codecs, pixel format, frame rate and audio layout.
+    """
+    cmd = [
+        'ffprobe',
+        '-v', 'error',
+        '-show_entries', 'stream=codec_type,codec_name,width,height,pix_fmt,r_frame_rate,time_base,sample_rate,channels,channel_layout',
+        '-show_entries', 'format=duration,format_name',
+        '-of', 'json',
+        str(file_path)
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    data = json.loads(result.stdout)
+
+    info = {
+        "duration": float(data.get('format', {}).get('duration', 0) or 0),
+        "format_name": data.get('format', {}).get('format_name'),
+        "width": None,
+        "height": None,
+        "has_video": False,
+        "has_audio": False,
+        "video_codec": None,
+        "pix_fmt": None,
+        "fps": 0.0,
+        "time_base": None,
+        "audio_codec": None,
+        "sample_rate": None,
+        "channels": None,
+        "channel_layout": None,
+    }
+
+    for stream in data.get('streams', []):
+        if stream.get('codec_type') == 'video' and 'width' in stream and not info["has_video"]:
+            info["has_video"] = True
+            info["width"] = int(stream['width'])
+            info["height"] = int(stream['height'])
+            info["video_codec"] = stream.get('codec_name')
+            info["pix_fmt"] = stream.get('pix_fmt')
+            info["fps"] = _parse_rate(stream.get('r_frame_rate'))
+            info["time_base"] = stream.get('time_base')
+        if stream.get('codec_type') == 'audio' and not info["has_audio"]:
+            info["has_audio"] = True
+            info["audio_codec"] = stream.get('codec_name')
+            info["sample_rate"] = int(stream.get('sample_rate', 0) or 0)
+            info["channels"] = stream.get('channels')
+            info["channel_layout"] = stream.get('channel_layout')
+
+    return info
+
+
+def run_keyframe_probe(file_path):
+    """Returns the sorted presentation times (seconds) of video keyframes, read from packets without decoding."""
+    cmd = [
+        'ffprobe',
+        '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', 'packet=pts_time,flags',
+        '-of', 'csv=p=0',
+        str(file_path)
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    keyframes = []
+    for line in result.stdout.splitlines():
+        pts_time, _, flags = line.partition(',')
+        if 'K' in flags and pts_time not in ('', 'N/A'):
+            keyframes.append(float(pts_time))
+    return sorted(keyframes)
+
+
+def run_video_end_probe(file_path, duration=None):
+    """
+    Returns the end of the video stream (last frame pts + duration), which can be shorter than the
+    container duration when the audio runs longer. Only packets from the keyframe before the last
+    second of `duration` (the container duration) are read; nothing is decoded.
+    """
+    def read(interval):
+        cmd = [
+            'ffprobe',
+            '-v', 'error',
+            '-select_streams', 'v:0',
+            '-read_intervals', interval,
+            '-show_entries', 'packet=pts_time,duration_time',
+            '-of', 'csv=p=0',
+            str(file_path)
+        ]
+        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        ends = []
+        for line in result.stdout.splitlines():
+            pts_time, _, duration_time = line.partition(',')
+            try:
+                ends.append(float(pts_time) + float(duration_time or 0))
+            except ValueError:
+                continue
+        return ends
+
+    ends = read(f"{max(0.0, (duration or 0) - 1):.3f}%") if duration else []
+    # Seeking can land past the video in odd files; fall back to reading every packet
+    ends = ends or read("%")
+    return max(ends) if ends else 0.0
+
+
+def run_loudness_probe(file_path):
+    """
+    Measures the first audio stream with loudnorm's analysis pass (EBU R128) and returns
+    integrated loudness (LUFS), true peak (dBTP), loudness range (LU) and the gating threshold (LUFS).
+    Silent or very short audio measures as -inf.
+    """
+    cmd = [
+        'ffmpeg',
+        '-hide_banner',
+        '-nostats',
+        '-i', str(file_path),
+        '-map', '0:a:0',
+        '-af', 'loudnorm=print_format=json',
+        '-f', 'null',
+        '-'
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    stats = json.loads(result.stderr[result.stderr.rindex('{'):])
+    return {
+        "integrated": float(stats["input_i"]),
+        "true_peak": float(stats["input_tp"]),
+        "lra": float(stats["input_lra"]),
+        "threshold": float(stats["input_thresh"]),
+    }
+
+
+class MediaCatalog:
+    """
+    SQLite-backed index of probe results keyed by (path, size, mtime).
+    A file is probed once; later lookups from any script are a single row read.
+    Loudness measurements are keyed by content hash, so copies and renames are not re-analysed.
+    """
+
+    def __init__(self, db_path=DEFAULT_CATALOG_PATH):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=30)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS media ("
+                " path TEXT PRIMARY KEY,"
+                " size INTEGER NOT NULL,"
+                " mtime_ns INTEGER NOT NULL,"
+                " info TEXT NOT NULL,"
+                " keyframes TEXT)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS content_hashes ("
+                " path TEXT PRIMARY KEY,"
+                " size INTEGER NOT NULL,"
+                " mtime_ns INTEGER NOT NULL,"
+                " sha256 TEXT NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS loudness ("
+                " sha256 TEXT PRIMARY KEY,"
+                " info TEXT NOT NULL)"
+            )
+            self._conn.commit()
+
+    def _lookup(self, key, size, mtime_ns):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime_ns, info, keyframes FROM media WHERE path = ?", (key,)
+            ).fetchone()
+        if row and row[0] == size and row[1] == mtime_ns:
+            return row
+        return None
+
+    def _store(self, key, size, mtime_ns, info, keyframes=None):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO media (path, size, mtime_ns, info, keyframes) VALUES (?, ?, ?, ?, ?)",
+                (key, size, mtime_ns, json.dumps(info), json.dumps(keyframes) if keyframes is not None else None)
+            )
+            self._conn.commit()
+
+    def probe(self, file_path):
+        """Returns the info dict for file_path, running ffprobe only if the file is new or changed."""
+        key, size, mtime_ns = _file_stamp(file_path)
+        row = self._lookup(key, size, mtime_ns)
+        if row:
+            return json.loads(row[2])
+
+        info = run_ffprobe(key)
+        self._store(key, size, mtime_ns, info)
+        return info
+
+    def probe_many(self, paths, workers=None):
+        """
+        Probes many files in parallel (only those not already indexed).
+        Returns {Path: info}; files that fail to probe are reported and omitted.
+        """
+        paths = [Path(p) for p in paths]
+        results = {}
+        missing = []
+        for p in paths:
+            key, size, mtime_ns = _file_stamp(p)
+            row = self._lookup(key, size, mtime_ns)
+            if row:
+                results[p] = json.loads(row[2])
+            else:
+                missing.append((p, key, size, mtime_ns))
+
+        if missing:
+            workers = workers or min(8, os.cpu_count() or 1)
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = [(item, pool.submit(run_ffprobe, item[1])) for item in missing]
+                for (p, key, size, mtime_ns), future in futures:
+                    try:
+                        info = future.result()
+                    except Exception as e:
+                        print(f"Error getting info for {p}: {e}")
+                        continue
+                    self._store(key, size, mtime_ns, info)
+                    results[p] = info
+
+        return results
+
+    def keyframes(self, file_path):
+        """Returns cached keyframe timestamps for file_path, probing packets on first request."""
+        key, size, mtime_ns = _file_stamp(file_path)
+        row = self._lookup(key, size, mtime_ns)
+        if row and row[3] is not None:
+            return json.loads(row[3])
+
+        info = json.loads(row[2]) if row else run_ffprobe(key)
+        keyframes = run_keyframe_probe(key)
+        self._store(key, size, mtime_ns, info, keyframes)
+        return keyframes
+
+    def video_end(self, file_path):
+        """
+        Returns the end of the video stream (see run_video_end_probe), probing packets on first request.
+        It is kept in the file's probe row, so repeat runs read it like any other probe field.
+        """
+        key, size, mtime_ns = _file_stamp(file_path)
+        row = self._lookup(key, size, mtime_ns)
+        info = json.loads(row[2]) if row else run_ffprobe(key)
+        if "video_end" not in info:
+            info["video_end"] = run_video_end_probe(key, info["duration"])
+            self._store(key, size, mtime_ns, info, json.loads(row[3]) if row and row[3] is not None else None)
+        return info["video_end"]
+
+    def content_hash(self, file_path):
+        """Returns the SHA-256 of the file's bytes, hashing it only if the file is new or changed."""
+        key, size, mtime_ns = _file_stamp(file_path)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime_ns, sha256 FROM content_hashes WHERE path = ?", (key,)
+            ).fetchone()
+        if row and row[0] == size and row[1] == mtime_ns:
+            return row[2]
+
+        h = hashlib.sha256()
+        with open(key, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        digest = h.hexdigest()
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO content_hashes (path, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)",
+                (key, size, mtime_ns, digest)
+            )
+            self._conn.commit()
+        return digest
+
+    def _lookup_loudness(self, digest):
+        with self._lock:
+            row = self._conn.execute("SELECT info FROM loudness WHERE sha256 = ?", (digest,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _store_loudness(self, digest, info):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO loudness (sha256, info) VALUES (?, ?)", (digest, json.dumps(info)))
+            self._conn.commit()
+
+    def loudness(self, file_path):
+        """Returns the EBU R128 measurements of the file's audio (see run_loudness_probe), analysed once per distinct content."""
+        digest = self.content_hash(file_path)
+        info = self._lookup_loudness(digest)
+        if info is None:
+            info = run_loudness_probe(Path(file_path).resolve())
+            self._store_loudness(digest, info)
+        return info
+
+    def loudness_many(self, paths, workers=None):
+        """
+        Measures many files in parallel (only content not already analysed).
+        Returns {Path: loudness}; files that fail to measure are reported and omitted.
+        """
+        results = {}
+        missing = {}
+        for p in map(Path, paths):
+            digest = self.content_hash(p)
+            info = self._lookup_loudness(digest)
+            if info is not None:
+                results[p] = info
+            else:
+                missing.setdefault(digest, []).append(p)
+
+        if missing:
+            workers = workers or min(8, os.cpu_count() or 1)
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = [(digest, same, pool.submit(run_loudness_probe, same[0].resolve())) for digest, same in missing.items()]
+                for digest, same, future in futures:
+                    try:
+                        info = future.result()
+                    except Exception as e:
+                        print(f"Error measuring loudness of {same[0]}: {e}")
+                        continue
+                    self._store_loudness(digest, info)
+                    results.update((p, info) for p in same)
+
+        return results
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_default_catalog = None
+_default_lock = threading.Lock()
+
+
+def get_catalog():
+    """Returns the process-wide catalog at DEFAULT_CATALOG_PATH."""
+    global _default_catalog
+    with _default_lock:
+        if _default_catalog is None:
+            _default_catalog = MediaCatalog()
+        return _default_catalog
+
+
+def probe(file_path):
+    return get_catalog().probe(file_path)
+
+
+def probe_many(paths, workers=None):
+    return get_catalog().probe_many(paths, workers)
+
+
+def keyframes(file_path):
+    return get_catalog().keyframes(file_path)
+
+
+def video_end(file_path):
+    return get_catalog().video_end(file_path)
+
+
+def content_hash(file_path):
+    return get_catalog().content_hash(file_path)
+
+
+def loudness(file_path):
+    return get_catalog().loudness(file_path)
+
+
+def loudness_many(paths, workers=None):
+    return get_catalog().loudness_many(paths, workers)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index media files (duration, geometry, codecs, keyframes, loudness) in the shared probe catalog.")
+    parser.add_argument("paths", nargs="+", help="Files or folders to index")
+    parser.add_argument("--keyframes", action="store_true", help="Also index video keyframe positions")
+    parser.add_argument("--loudness", action="store_true", help="Also measure audio loudness (EBU R128)")
+    parser.add_argument("--jobs", type=int, default=None, help="Parallel ffprobe processes")
+
+    args = parser.parse_args()
+
+    files = []
+    for item in map(Path, args.paths):
+        if item.is_dir():
+            files.extend(sorted(f for f in item.iterdir() if f.is_file()))
+        elif item.exists():
+            files.append(item)
+        else:
+            print(f"Error: '{item}' does not exist.")
+            sys.exit(1)
+
+    infos = probe_many(files, args.jobs)
+    levels = loudness_many([f for f, info in infos.items() if info.get("has_audio")], args.jobs) if args.loudness else {}
+    for f, info in infos.items():
+        if args.keyframes and info.get("has_video"):
+            info["keyframes"] = keyframes(f)
+        if f in levels:
+            info["loudness"] = levels[f]
+        print(json.dumps({"path": str(f), **info}))
@@ -0,0 +1,142 @@
+import argparse
+import hashlib
+import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import media_catalog
+from ffmpeg_runner import run_ffmpeg
+from parallel_jobs import thread_budget, with_thread_limit
+
+DEFAULT_MEZZANINE_DIR = ".tmp/mezzanine"
+# Part of the cache key; bump when normalize_clip's output changes so cached mezzanines are rebuilt
+MEZZANINE_VERSION = 2
+
+
+def mezzanine_path(src, cache_dir, width, height, fps, sample_rate=44100):
+    """Cache location for a normalized copy of src; changes whenever the source or the target format changes."""
+    st = Path(src).stat()
+    key = f"{Path(src).resolve()}|{st.st_size}|{st.st_mtime_ns}|{width}x{height}|{fps}|{sample_rate}|v{MEZZANINE_VERSION}"
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+    return Path(cache_dir) / f"{Path(src).stem}_{digest}.mp4"
+
+
+def mezzanine_video_args(fps):
+    """
+    Video encoder options of every mezzanine: near-lossless, one keyframe per second.
+    Anything encoded with these (and the same size and pixel format) shares the
+    mezzanines' H.264 parameter sets, so it can be stream-copied next to them.
+    """
+    gop = max(1, round(fps))
+    return [
+        '-c:v', 'libx264',
+        '-preset', 'veryfast',
+        '-crf', '16',
+        '-g', str(gop),
+        '-keyint_min', str(gop),
+        '-sc_threshold', '0',
+        '-video_track_timescale', str(gop * 512),
+    ]
+
+
+def normalize_clip(src, cache_dir, width, height, fps=30, sample_rate=44100, threads=None):
+    """
+    Converts a clip once into a codec-uniform mezzanine:
+    fixed resolution (letterboxed), SAR 1, constant frame rate, yuv420p, 1s closed GOPs
+    and stereo AAC audio (silence if the source has none), padded to the full length of the
+    video so a short soundtrack never cuts the picture.
+    Returns the mezzanine path; reuses the cached file if present.
+    `threads` caps ffmpeg's filter/encoder threads when several clips run at once.
+    """
+    src = Path(src)
+    out = mezzanine_path(src, cache_dir, width, height, fps, sample_rate)
+    if out.exists():
+        return out
+
+    out.parent.mkdir(parents=True, exist_ok=True)
+    info = media_catalog.probe(src)
+
+    vf = (
+        f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+        f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1,fps={fps},format=yuv420p"
+    )
+    duration = media_catalog.video_end(src)
+    cmd = ['ffmpeg', '-y', '-i', str(src)]
+    if not info["has_audio"]:
+        cmd.extend(['-f', 'lavfi', '-i', f"anullsrc=channel_layout=stereo:sample_rate={sample_rate}"])
+    cmd.extend([
+        '-map', '0:v:0',
+        '-map', '0:a:0' if info["has_audio"] else '1:a:0',
+        '-vf', vf,
+        '-af', 'apad',
+        *mezzanine_video_args(fps),
+        '-c:a', 'aac',
+        '-b:a', '192k',
+        '-ar', str(sample_rate),
+        '-ac', '2',
+        '-t', f"{duration:.6f}",
+    ])
+
+    # Write to a temp name first so an interrupted encode never leaves a "valid" cache entry.
+    tmp_out = out.with_name(f".{out.stem}.{os.getpid()}.tmp.mp4")
+    cmd.append(str(tmp_out))
+    if threads:
+        cmd = with_thread_limit(cmd, threads)
+
+    try:
+        run_ffmpeg(cmd, f"Normalize: {Path(src).name}")
+    except subprocess.CalledProcessError:
+        tmp_out.unlink(missing_ok=True)
+        raise
+    os.replace(tmp_out, out)
+    return out
+
+
+def normalize_clips(paths, cache_dir=DEFAULT_MEZZANINE_DIR, width=1080, height=1920, fps=30, sample_rate=44100, jobs=1):
+    """
+    Normalizes each clip once, up to `jobs` clips at a time.
+    Returns {source Path: mezzanine Path}; clips that fail to convert are reported and omitted.
+    """
+    paths = [Path(p) for p in paths]
+    jobs = max(1, min(jobs, len(paths) or 1))
+    threads = thread_budget(jobs) if jobs > 1 else None
+
+    mezzanines = {}
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = []
+        for src in paths:
+            cached = mezzanine_path(src, cache_dir, width, height, fps, sample_rate).exists()
+            futures.append((src, cached, pool.submit(normalize_clip, src, cache_dir, width, height, fps, sample_rate, threads)))
+
+        for src, cached, future in futures:
+            try:
+                mezzanines[src] = future.result()
+                print(f"  {'Cached' if cached else 'Normalized'}: {src.name}")
+            except subprocess.CalledProcessError as e:
+                print(f"  Error normalizing {src.name}: {e}")
+                print(f"  FFmpeg Error: {e.stderr.decode()}")
+    return mezzanines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Normalize clips once into cached, codec-uniform mezzanine files.")
+    parser.add_argument("--input", required=True, nargs="+", help="Clip files or folders")
+    parser.add_argument("--output", default=DEFAULT_MEZZANINE_DIR, help=f"Mezzanine cache folder (default {DEFAULT_MEZZANINE_DIR})")
+    parser.add_argument("--width", type=int, default=1080, help="Target width")
+    parser.add_argument("--height", type=int, default=1920, help="Target height")
+    parser.add_argument("--fps", type=float, default=30, help="Target constant frame rate")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of concurrent ffmpeg processes (default 1)")
+
+    args = parser.parse_args()
+
+    exts = {'.mp4', '.mov', '.avi', '.mkv'}
+    clips = []
+    for item in map(Path, args.input):
+        if not item.exists():
+            print(f"Error: '{item}' does not exist.")
+            sys.exit(1)
+        clips.extend(sorted(f for f in item.iterdir() if f.suffix.lower() in exts) if item.is_dir() else [item])
+
+    normalize_clips(clips, args.output, args.width, args.height, args.fps, jobs=args.jobs)
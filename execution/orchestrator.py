@@ -0,0 +1,217 @@
+import argparse
+import json
+import shutil
+import sys
+import time
+import traceback
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+
+from stage_error import StageError
+
+# fn receives {dependency name: dependency result}
+Task = namedtuple("Task", ["name", "fn", "deps"])
+TaskResult = namedtuple("TaskResult", ["name", "status", "value", "error", "seconds"])
+
+
+def run_dag(tasks, workers=4):
+    """
+    Runs tasks as soon as all their dependencies succeeded, up to `workers` at a time.
+    A failed task (StageError or other exception, or sys.exit) marks its
+    dependents as skipped; independent branches keep running.
+    Returns {name: TaskResult}.
+    """
+    tasks = {t.name: t for t in tasks}
+    for t in tasks.values():
+        for dep in t.deps:
+            if dep not in tasks:
+                raise ValueError(f"Task '{t.name}' depends on unknown task '{dep}'")
+
+    results = {}
+    running = {}
+
+    def execute(task, dep_values):
+        start = time.time()
+        try:
+            value = task.fn(dep_values)
+            return TaskResult(task.name, "ok", value, None, time.time() - start)
+        except (Exception, SystemExit) as e:
+            # Execution scripts raise StageError (their CLIs exit); contain them to this task
+            detail = f"exit code {e.code}" if isinstance(e, SystemExit) else f"{type(e).__name__}: {e}"
+            if not isinstance(e, (SystemExit, StageError)):
+                traceback.print_exc()
+            return TaskResult(task.name, "failed", None, detail, time.time() - start)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while len(results) < len(tasks):
+            progressed = False
+            for t in tasks.values():
+                if t.name in results or t.name in running.values():
+                    continue
+                dep_results = [results.get(d) for d in t.deps]
+                if any(r and r.status != "ok" for r in dep_results):
+                    failed = [r.name for r in dep_results if r and r.status != "ok"]
+                    results[t.name] = TaskResult(t.name, "skipped", None, f"dependency failed: {', '.join(failed)}", 0.0)
+                    print(f"[orchestrator] Skipped {t.name} ({', '.join(failed)} failed)")
+                    progressed = True
+                elif all(dep_results):
+                    print(f"[orchestrator] Starting {t.name}")
+                    running[pool.submit(execute, t, {d: results[d].value for d in t.deps})] = t.name
+                    progressed = True
+
+            if not running:
+                if progressed:
+                    # Skips may cascade to further dependents; resolve them first
+                    continue
+                if len(results) < len(tasks):
+                    raise ValueError(f"Dependency cycle among: {', '.join(sorted(set(tasks) - set(results)))}")
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                result = future.result()
+                results[name] = result
+                print(f"[orchestrator] {result.status.upper()}: {name} ({result.seconds:.1f}s)"
+                      + (f" - {result.error}" if result.error else ""))
+
+    return results
+
+
+def build_pipeline(script_file, languages=("es", "pl", "uk"), voiceover_dir="input/voiceovers",
+                   subtitle_dir="input/subtitles", video_dir="input/videos", music_dir="input/music",
+                   assembly_dir=".tmp/automated_assembly", final_dir="output/final",
+                   processed_dir="input/processed", mezzanine=False, jobs=1, streaming=False):
+    """
+    Models .agent/workflows/run.md as a task graph:
+
+        tts -> dub -> subs_<lang> ---------\\
+        tts -> subs_en --------------------+-> render_<lang> -> archive
+        assemble --------------------------/
+
+    Assembly runs while TTS/dubbing are in flight and every language renders in parallel.
+    With streaming, no assembled files are written: each render pipes assembly straight
+    into its voiceover/resize stages and fans out to every music track (see stream_pipeline).
+    The assembly then runs once per combination and language instead of once in total,
+    which trades CPU for disk when there are several languages.
+    """
+    # Imported here so run_dag stays usable without the API dependencies (requests)
+    from assemble_video import assemble_videos, prepare_sources
+    from dub_voiceover import dub_voiceover_multi
+    from render_pipeline import render_pipeline
+    from stream_pipeline import stream_pipeline
+    from text_to_speech import text_to_speech
+    from transcribe_audio import generate_srt
+
+    script_path = Path(script_file)
+    stem = script_path.stem
+    clip_dirs = [Path(video_dir) / part for part in ("hook", "body", "packshot")]
+    Path(subtitle_dir).mkdir(parents=True, exist_ok=True)
+
+    def copy_dubbed_srt(lang):
+        def run(deps):
+            audio = deps["dub"].get(lang)
+            if not audio:
+                raise RuntimeError(f"Dubbing to '{lang}' failed")
+            src = Path(audio).with_suffix(".srt")
+            if not src.exists():
+                # The dub succeeded but its transcript download didn't
+                raise RuntimeError(f"No dubbed transcript for '{lang}'")
+            dst = Path(subtitle_dir) / src.name
+            shutil.copy(src, dst)
+            return {"audio": audio, "subtitles": str(dst)}
+        return run
+
+    def render(lang):
+        def run(deps):
+            out = Path(final_dir) / lang
+            out.mkdir(parents=True, exist_ok=True)
+            voice = deps[f"subs_{lang}"]
+            if streaming:
+                stream_pipeline(*clip_dirs, out, voice["audio"], voice["subtitles"], music_dir, jobs=jobs, mezzanine=mezzanine)
+            else:
+                render_pipeline(deps["assemble"], out, voice["audio"], voice["subtitles"], music_dir, jobs=jobs, incremental=True)
+            return str(out)
+        return run
+
+    def archive(deps):
+        Path(processed_dir).mkdir(parents=True, exist_ok=True)
+        return shutil.move(str(script_path), str(Path(processed_dir) / script_path.name))
+
+    def prepare_streaming(deps):
+        # Normalize mezzanines once here so the parallel language chains only read the cache
+        if mezzanine:
+            exts = {'.mp4', '.mov', '.avi', '.mkv'}
+            prepare_sources(*(sorted(f for f in d.iterdir() if f.suffix.lower() in exts) for d in clip_dirs),
+                            mezzanine=True, jobs=jobs)
+        return None
+
+    tasks = [
+        Task("tts", lambda deps: text_to_speech(script_path, voiceover_dir), []),
+        Task("subs_en", lambda deps: {
+            "audio": deps["tts"],
+            "subtitles": generate_srt(deps["tts"], Path(subtitle_dir) / f"{stem}.srt"),
+        }, ["tts"]),
+        # One stable folder per script: a re-run (e.g. after a daemon restart) resumes instead of starting over
+        Task("assemble", prepare_streaming if streaming else lambda deps: str(assemble_videos(
+            *clip_dirs, Path(assembly_dir) / stem, mezzanine=mezzanine, jobs=jobs, incremental=True
+        )), []),
+    ]
+    if languages:
+        # All languages are submitted and polled together; one failed language only fails its own branch
+        tasks.append(Task("dub", lambda deps: dub_voiceover_multi(deps["tts"], voiceover_dir, target_langs=languages), ["tts"]))
+    for lang in languages:
+        tasks.append(Task(f"subs_{lang}", copy_dubbed_srt(lang), ["dub"]))
+
+    render_tasks = []
+    for lang in ("en",) + tuple(languages):
+        render_tasks.append(Task(f"render_{lang}", render(lang), [f"subs_{lang}", "assemble"]))
+    tasks.extend(render_tasks)
+    tasks.append(Task("archive", archive, [t.name for t in render_tasks]))
+    return tasks
+
+
+def run_pipeline(script_file, workers=4, **kwargs):
+    """Runs the full pipeline for one script. Returns a JSON-serializable summary."""
+    print(f"[orchestrator] Starting pipeline for {Path(script_file).name}...")
+    results = run_dag(build_pipeline(script_file, **kwargs), workers)
+    return {
+        "script": str(script_file),
+        "ok": all(r.status == "ok" for r in results.values()),
+        "tasks": {name: r._asdict() for name, r in results.items()},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the full pipeline as a dependency graph (replaces automation.sh).")
+    parser.add_argument("--input", default="input/text", help="Script file or folder of .txt scripts (default input/text)")
+    parser.add_argument("--langs", default="es,pl,uk", help="Comma-separated dubbing languages (default es,pl,uk)")
+    parser.add_argument("--workers", type=int, default=4, help="Tasks running concurrently (default 4)")
+    parser.add_argument("--jobs", type=int, default=1, help="ffmpeg processes per render task (default 1)")
+    parser.add_argument("--mezzanine", action="store_true", help="Assemble from normalized mezzanines")
+    parser.add_argument("--streaming", action="store_true", help="Pipe assembly into each render instead of writing assembled files (re-assembles per language)")
+    parser.add_argument("--summary", help="Write the JSON summary to this file")
+
+    args = parser.parse_args()
+
+    input_path = Path(args.input)
+    scripts = sorted(input_path.glob("*.txt")) if input_path.is_dir() else [input_path]
+    scripts = [s for s in scripts if s.exists()]
+    if not scripts:
+        print(f"No new scripts found in {args.input}. Skipping...")
+        sys.exit(0)
+
+    languages = tuple(l.strip() for l in args.langs.split(",") if l.strip())
+    summaries = [
+        run_pipeline(s, args.workers, languages=languages, mezzanine=args.mezzanine, jobs=args.jobs,
+                     streaming=args.streaming)
+        for s in scripts
+    ]
+
+    output = json.dumps(summaries, indent=2, default=str)
+    if args.summary:
+        Path(args.summary).write_text(output, encoding='utf-8')
+    print(output)
+
+    sys.exit(0 if all(s["ok"] for s in summaries) else 1)
@@ -0,0 +1,109 @@
+import os
+import subprocess
+import sys
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from ffmpeg_runner import print_progress, run_ffmpeg, run_ffmpeg_chain
+
+# Shared farm directory; when set, run_ffmpeg_jobs queues jobs for render_farm workers instead of running them
+FARM_DIR = os.environ.get("RENDER_FARM")
+
+# label: what to print for the job; cmd: full ffmpeg argv (output path last),
+# or a list of argvs run as one streaming chain (see ffmpeg_runner.run_ffmpeg_chain)
+FFmpegJob = namedtuple("FFmpegJob", ["label", "cmd"])
+
+
+def thread_budget(jobs):
+    """Threads each ffmpeg process may use so that `jobs` concurrent processes don't oversubscribe the CPU."""
+    return max(1, (os.cpu_count() or 1) // max(1, jobs))
+
+
+def with_thread_limit(cmd, threads):
+    """
+    Returns a copy of an ffmpeg command capped to `threads` for both filtering and encoding.
+    The encoder option is inserted right before the output path (last argument).
+    """
+    if isinstance(cmd[0], list):
+        return [with_thread_limit(stage, threads) for stage in cmd]
+    filter_opt = '-filter_complex_threads' if '-filter_complex' in cmd else '-filter_threads'
+    return [cmd[0], filter_opt, str(threads)] + cmd[1:-1] + ['-threads', str(threads), cmd[-1]]
+
+
+def _run(cmd, label, live=False):
+    run = run_ffmpeg_chain if isinstance(cmd[0], list) else run_ffmpeg
+    run(cmd, label, on_progress=print_progress if live else None)
+
+
+def report_result(job, error):
+    """Prints the outcome of one job (ffmpeg's log tail on failure)."""
+    if error is None:
+        print("  Done.")
+    else:
+        print(f"  Error: {error}")
+        print(f"  FFmpeg Error Log:\n{error.stderr.decode(errors='replace')}")
+
+
+def report_summary(results):
+    """Prints the end-of-batch summary of (job, error) results."""
+    total = len(results)
+    failed = [job for job, error in results if error is not None]
+    if failed:
+        print(f"Finished with errors: {total - len(failed)}/{total} succeeded. Failed:")
+        for job in failed:
+            print(f"  - {job.label}")
+    elif total > 1:
+        print(f"All {total} jobs succeeded.")
+
+
+def run_ffmpeg_jobs(jobs, n_jobs=1, on_done=None):
+    """
+    Runs FFmpegJobs with up to n_jobs concurrent ffmpeg processes.
+    Progress is reported in submission order; failures are collected and summarized at the end.
+    Returns a list of (job, error) pairs where error is None on success.
+    `on_done(job, error)` is called in the main thread as each result is reported.
+    With RENDER_FARM set, the jobs are run by render_farm workers instead (same contract).
+    """
+    jobs = list(jobs)
+    if not jobs:
+        return []
+    if FARM_DIR:
+        # Imported here: render_farm builds on this module
+        from render_farm import RenderFarm
+        return RenderFarm(FARM_DIR).run_jobs(jobs, on_done)
+
+    n_jobs = max(1, min(n_jobs, len(jobs)))
+    total = len(jobs)
+    results = []
+
+    if n_jobs == 1:
+        # Serial path: keep ffmpeg's own thread defaults
+        pending = ((job, None) for job in jobs)
+        pool = None
+    else:
+        threads = thread_budget(n_jobs)
+        print(f"Running {total} jobs with {n_jobs} workers ({threads} threads each).")
+        pool = ThreadPoolExecutor(max_workers=n_jobs)
+        pending = [(job, pool.submit(_run, with_thread_limit(job.cmd, threads), job.label)) for job in jobs]
+
+    try:
+        for i, (job, future) in enumerate(pending, 1):
+            print(f"[{i}/{total}] {job.label}")
+            try:
+                if future is None:
+                    # Serial jobs show a live progress line on a terminal
+                    _run(job.cmd, job.label, live=sys.stdout.isatty())
+                else:
+                    future.result()
+                results.append((job, None))
+            except subprocess.CalledProcessError as e:
+                results.append((job, e))
+            report_result(*results[-1])
+            if on_done:
+                on_done(*results[-1])
+    finally:
+        if pool:
+            pool.shutdown(wait=True)
+
+    report_summary(results)
+    return results
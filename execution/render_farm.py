@@ -0,0 +1,424 @@
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+from ffmpeg_runner import output_files, run_ffmpeg, run_ffmpeg_chain
+from parallel_jobs import FARM_DIR, report_result, report_summary, thread_budget, with_thread_limit
+
+DEFAULT_LEASE_SECONDS = 60
+DEFAULT_MAX_ATTEMPTS = 3
+SUBDIRS = ("jobs", "leases", "errors", "done", "failed", "clock")
+
+
+class LeaseLost(Exception):
+    """Raised inside a running job once another worker has taken over its lease."""
+
+
+def _write_json(path, data):
+    """Atomic write: readers on any host see the previous file or the complete new one."""
+    tmp = path.with_name(f".{path.name}.{socket.gethostname()}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_text(json.dumps(data, default=str), encoding='utf-8')
+    os.replace(tmp, path)
+
+
+def _read_json(path):
+    try:
+        return json.loads(Path(path).read_text(encoding='utf-8'))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _private_output(cmd, tag):
+    """
+    Returns (cmd, (temp, output)) with the final output redirected to a temp name next to it,
+    so a job that ran twice (or died) never leaves a half-written deliverable.
+    (cmd, None) if the output isn't a plain file (a pipe, an image sequence or a tee of several files).
+    """
+    chain = isinstance(cmd[0], list)
+    last = cmd[-1] if chain else cmd
+    output = Path(last[-1])
+    if str(output).startswith("pipe:") or "%" in output.name or output_files(last) != [last[-1]]:
+        return cmd, None
+    tmp = output.with_name(f".{output.stem}.{tag}.tmp{output.suffix}")
+    last = last[:-1] + [str(tmp)]
+    return (cmd[:-1] + [last] if chain else last), (tmp, output)
+
+
+class RenderFarm:
+    """
+    Queue of ffmpeg jobs kept as plain files in a directory every host mounts (NFS or similar):
+
+        jobs/<id>.json         the job (label and argv), written by the coordinator
+        leases/<id>            created with O_EXCL by the worker that claims the job;
+                               its mtime is the worker's heartbeat
+        errors/<id>.<n>.json   why attempt n failed (ffmpeg error or expired lease)
+        done/<id>.json         success, failed/<id>.json: out of attempts
+
+    Claims rely only on atomic create and rename, which NFS provides (SQLite locking does not).
+    A lease whose heartbeat is older than its lease time is reclaimed by the next worker and
+    counts as a failed attempt. Time is read from the file server (the mtime of a touched file),
+    so the hosts' clocks don't need to agree.
+    """
+
+    def __init__(self, farm_dir, lease_seconds=DEFAULT_LEASE_SECONDS, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.root = Path(farm_dir)
+        for d in SUBDIRS:
+            (self.root / d).mkdir(parents=True, exist_ok=True)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}"
+
+    def _path(self, kind, name):
+        return self.root / kind / name
+
+    def now(self):
+        """Current time on the shared filesystem."""
+        clock = self._path("clock", socket.gethostname())
+        clock.touch()
+        return clock.stat().st_mtime
+
+    # Coordinator side
+
+    def submit(self, jobs):
+        """Queues FFmpegJobs (oldest first). Returns their ids."""
+        stamp = time.time_ns()
+        ids = []
+        for i, job in enumerate(jobs):
+            job_id = f"{stamp}_{self.worker_id}_{i:06d}"
+            _write_json(self._path("jobs", f"{job_id}.json"), {
+                "id": job_id, "label": job.label, "cmd": job.cmd, "cwd": os.getcwd(),
+                "max_attempts": self.max_attempts, "submitted_by": self.worker_id,
+            })
+            ids.append(job_id)
+        return ids
+
+    def _finished(self, kind):
+        return {p.name[:-len(".json")]: p for p in self._path(kind, "").glob("*.json")}
+
+    def remove(self, job_id):
+        """Deletes every file of a job (after its result was collected)."""
+        for kind in ("done", "failed", "jobs"):
+            self._path(kind, f"{job_id}.json").unlink(missing_ok=True)
+        for p in self._path("errors", "").glob(f"{job_id}.*.json"):
+            p.unlink(missing_ok=True)
+
+    def run_jobs(self, jobs, on_done=None, poll=1.0):
+        """
+        Drop-in for run_ffmpeg_jobs: queues the jobs, waits for workers to finish them and
+        returns [(job, error)] in submission order. on_done(job, error) runs in this process
+        as results arrive, so e.g. a build manifest is written by one host only.
+        """
+        jobs = list(jobs)
+        if not jobs:
+            return []
+        ids = self.submit(jobs)
+        pending = dict(zip(ids, jobs))
+        total = len(jobs)
+        print(f"Queued {total} jobs on render farm '{self.root}'; waiting for workers.")
+
+        results = {}
+        while pending:
+            done, failed = self._finished("done"), self._finished("failed")
+            for job_id in [i for i in ids if i in pending and (i in done or i in failed)]:
+                job = pending.pop(job_id)
+                error = None
+                if job_id in failed:
+                    info = _read_json(failed[job_id]) or {}
+                    error = subprocess.CalledProcessError(info.get("returncode") or 1, job.cmd,
+                                                          stderr=info.get("stderr", "").encode())
+                else:
+                    info = _read_json(done[job_id]) or {}
+                results[job_id] = (job, error)
+                print(f"[{len(results)}/{total}] {job.label}" + (f" ({info['worker']})" if info.get("worker") else ""))
+                report_result(job, error)
+                if on_done:
+                    on_done(job, error)
+                self.remove(job_id)
+            if pending:
+                time.sleep(poll)
+
+        results = [results[i] for i in ids]
+        report_summary(results)
+        return results
+
+    # Worker side
+
+    def _expire(self, job_id, now):
+        """
+        Reclaims the lease of job_id if its holder stopped sending heartbeats.
+        Returns True if the job is free to claim.
+        """
+        lease = self._path("leases", job_id)
+        holder = _read_json(lease) or {}
+        try:
+            if lease.stat().st_mtime + holder.get("lease_seconds", self.lease_seconds) > now:
+                return False
+        except FileNotFoundError:
+            return True
+
+        # Rename first: of several workers reaping the same lease, exactly one succeeds
+        stale = lease.with_name(f".{job_id}.{self.worker_id}.expired")
+        try:
+            os.rename(lease, stale)
+        except FileNotFoundError:
+            return False
+        if stale.stat().st_mtime + holder.get("lease_seconds", self.lease_seconds) > self.now():
+            # A heartbeat landed in between: the holder is alive, give its lease back
+            try:
+                os.link(stale, lease)
+            except FileExistsError:
+                pass
+            stale.unlink(missing_ok=True)
+            return False
+
+        attempt = holder.get("attempt") or len(list(self._path("errors", "").glob(f"{job_id}.*.json"))) + 1
+        _write_json(self._path("errors", f"{job_id}.{attempt}.json"), {
+            "worker": holder.get("worker"), "error": "lease expired: the worker stopped sending heartbeats",
+        })
+        stale.unlink(missing_ok=True)
+        spec = _read_json(self._path("jobs", f"{job_id}.json"))
+        if spec and holder.get("worker"):
+            # The dead worker's partial output
+            _, private = _private_output(spec["cmd"], holder["worker"])
+            if private:
+                private[0].unlink(missing_ok=True)
+        print(f"[farm] Requeued {job_id}: lease of {holder.get('worker', 'unknown worker')} expired.")
+        return True
+
+    def claim(self):
+        """
+        Claims the oldest unfinished job without a live lease.
+        Returns the job dict (with its "attempt" number) or None if there is nothing to run.
+        """
+        finished = set(self._finished("done")) | set(self._finished("failed"))
+        leased = {p.name for p in self._path("leases", "").iterdir()}
+        now = None
+        for spec in sorted(self._path("jobs", "").glob("*.json")):
+            job_id = spec.name[:-len(".json")]
+            if job_id in finished:
+                continue
+            if job_id in leased:
+                now = now or self.now()
+                if not self._expire(job_id, now):
+                    continue
+
+            lease = self._path("leases", job_id)
+            try:
+                fd = os.open(lease, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileExistsError:
+                continue
+            attempt = len(list(self._path("errors", "").glob(f"{job_id}.*.json"))) + 1
+            with os.fdopen(fd, "w", encoding='utf-8') as f:
+                json.dump({"worker": self.worker_id, "attempt": attempt, "lease_seconds": self.lease_seconds,
+                           "claimed": time.time()}, f)
+
+            job = _read_json(spec)
+            if job is None or self._path("done", spec.name).exists() or self._path("failed", spec.name).exists():
+                # Collected or finished by another worker since the directory listing
+                lease.unlink(missing_ok=True)
+                continue
+            if attempt > job["max_attempts"]:
+                self._give_up(job_id)
+                lease.unlink(missing_ok=True)
+                continue
+            job["attempt"] = attempt
+            return job
+        return None
+
+    def _give_up(self, job_id):
+        errors = [_read_json(p) or {} for p in sorted(self._path("errors", "").glob(f"{job_id}.*.json"))]
+        last = errors[-1] if errors else {}
+        _write_json(self._path("failed", f"{job_id}.json"), {
+            "attempts": len(errors), "errors": [e.get("error") for e in errors],
+            "returncode": last.get("returncode"), "stderr": last.get("stderr", last.get("error", "")),
+        })
+
+    def heartbeat(self, job_ids, lost):
+        """Refreshes the leases of job_ids; ids whose lease was taken over are added to `lost`."""
+        for job_id in list(job_ids):
+            lease = self._path("leases", job_id)
+            holder = _read_json(lease)
+            try:
+                if not holder or holder.get("worker") != self.worker_id:
+                    raise FileNotFoundError
+                os.utime(lease)
+            except FileNotFoundError:
+                lost.add(job_id)
+
+    def execute(self, job, threads=None, lost=()):
+        """
+        Runs a claimed job in the coordinator's working directory (the same path on shared storage),
+        so relative inputs and outputs land where the coordinator expects them.
+        Raises LeaseLost (after killing ffmpeg) if its lease is taken over.
+        """
+        cwd = job.get("cwd")
+        if cwd and not os.path.isdir(cwd):
+            raise FileNotFoundError(f"Job directory '{cwd}' does not exist on this worker")
+        cmd, private = _private_output(job["cmd"], self.worker_id)
+        if private and cwd:
+            private = tuple(Path(cwd, p) for p in private)
+        if threads:
+            cmd = with_thread_limit(cmd, threads)
+
+        def check_lease(label, snapshot):
+            if job["id"] in lost:
+                raise LeaseLost(job["id"])
+
+        run = run_ffmpeg_chain if isinstance(cmd[0], list) else run_ffmpeg
+        try:
+            run(cmd, job["label"], on_progress=check_lease, cwd=cwd)
+        except BaseException:
+            if private:
+                private[0].unlink(missing_ok=True)
+            raise
+        if job["id"] in lost:
+            if private:
+                private[0].unlink(missing_ok=True)
+            raise LeaseLost(job["id"])
+        if private:
+            os.replace(*private)
+
+    def finish(self, job, seconds=None, error=None):
+        """Records the outcome of a job this worker ran and releases its lease."""
+        job_id = job["id"]
+        if error is None:
+            _write_json(self._path("done", f"{job_id}.json"), {
+                "worker": self.worker_id, "attempt": job["attempt"], "seconds": round(seconds or 0, 3),
+            })
+        else:
+            stderr = getattr(error, "stderr", None)
+            _write_json(self._path("errors", f"{job_id}.{job['attempt']}.json"), {
+                "worker": self.worker_id, "error": str(error), "returncode": getattr(error, "returncode", None),
+                "stderr": stderr.decode(errors='replace') if isinstance(stderr, bytes) else str(error),
+            })
+            if job["attempt"] >= job["max_attempts"]:
+                self._give_up(job_id)
+        self._path("leases", job_id).unlink(missing_ok=True)
+
+    def work(self, jobs=1, poll=2.0, idle_exit=None, stop=None):
+        """
+        Runs farm jobs on `jobs` threads until `stop` is set, or until nothing was
+        claimable for `idle_exit` seconds. Each ffmpeg process gets cpu_count / jobs threads.
+        """
+        stop = stop or threading.Event()
+        threads = thread_budget(jobs) if jobs > 1 else None
+        held, lost = set(), set()
+        idle = {"since": time.time(), "busy": 0}
+        lock = threading.Lock()
+
+        def beat():
+            while not stop.wait(self.lease_seconds / 4):
+                self.heartbeat(held, lost)
+
+        def loop():
+            while not stop.is_set():
+                job = self.claim()
+                if job is None:
+                    with lock:
+                        if idle_exit and not idle["busy"] and time.time() - idle["since"] >= idle_exit:
+                            return
+                    stop.wait(poll)
+                    continue
+
+                with lock:
+                    idle["busy"] += 1
+                held.add(job["id"])
+                print(f"[farm {self.worker_id}] {job['label']} (attempt {job['attempt']}/{job['max_attempts']})")
+                start = time.time()
+                try:
+                    self.execute(job, threads, lost)
+                    self.finish(job, time.time() - start)
+                    print(f"[farm {self.worker_id}] Done: {job['label']} ({time.time() - start:.1f}s)")
+                except LeaseLost:
+                    # The job belongs to the worker that reclaimed it; record nothing
+                    print(f"[farm {self.worker_id}] Lease lost, abandoned: {job['label']}")
+                except (subprocess.CalledProcessError, OSError) as e:
+                    self.finish(job, error=e)
+                    print(f"[farm {self.worker_id}] Error: {job['label']}: {e}")
+                finally:
+                    held.discard(job["id"])
+                    lost.discard(job["id"])
+                    with lock:
+                        idle["busy"] -= 1
+                        idle["since"] = time.time()
+
+        heart = threading.Thread(target=beat, daemon=True)
+        heart.start()
+        workers = [threading.Thread(target=loop, name=f"farm-{i}") for i in range(max(1, jobs))]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        stop.set()
+
+    def status(self):
+        """Counts of queued/running/done/failed jobs plus the live leases."""
+        finished_done, finished_failed = self._finished("done"), self._finished("failed")
+        leases = []
+        for lease in self._path("leases", "").iterdir():
+            if lease.name.startswith("."):
+                continue
+            holder = _read_json(lease) or {}
+            try:
+                age = self.now() - lease.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            leases.append({"job": lease.name, "worker": holder.get("worker"), "attempt": holder.get("attempt"),
+                           "heartbeat_age": round(age, 1), "expired": age > holder.get("lease_seconds", self.lease_seconds)})
+        job_ids = [p.name[:-len(".json")] for p in self._path("jobs", "").glob("*.json")]
+        running = {l["job"] for l in leases}
+        unfinished = [i for i in job_ids if i not in finished_done and i not in finished_failed]
+        return {
+            "queued": sum(1 for i in unfinished if i not in running),
+            "running": sum(1 for i in unfinished if i in running),
+            "done": len(finished_done),
+            "failed": len(finished_failed),
+            "leases": leases,
+        }
+
+    def purge(self):
+        """Removes finished jobs whose coordinator never collected them. Returns how many."""
+        finished = set(self._finished("done")) | set(self._finished("failed"))
+        for job_id in finished:
+            self.remove(job_id)
+        return len(finished)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render farm over shared storage: run worker processes, or inspect the queue. Coordinators are the normal scripts run with RENDER_FARM set.")
+    parser.add_argument("--farm_dir", default=FARM_DIR, help="Shared farm directory (default $RENDER_FARM)")
+    parser.add_argument("--worker", action="store_true", help="Run jobs from the farm")
+    parser.add_argument("--jobs", type=int, default=1, help="Concurrent jobs on this worker (default 1)")
+    parser.add_argument("--lease", type=float, default=DEFAULT_LEASE_SECONDS, help=f"Seconds without a heartbeat before a job is reclaimed (default {DEFAULT_LEASE_SECONDS})")
+    parser.add_argument("--idle_exit", type=float, help="Exit after this many seconds without work")
+    parser.add_argument("--purge", action="store_true", help="Remove finished jobs nobody collected")
+
+    args = parser.parse_args()
+    if not args.farm_dir:
+        parser.error("--farm_dir is required (or set RENDER_FARM)")
+
+    farm = RenderFarm(args.farm_dir, lease_seconds=args.lease)
+    if args.worker:
+        stop = threading.Event()
+
+        def request_stop(signum, frame):
+            print(f"[farm {farm.worker_id}] Stopping after the running jobs (interrupt again to abandon them).")
+            stop.set()
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+        print(f"[farm {farm.worker_id}] Working '{args.farm_dir}' with {args.jobs} slots.")
+        farm.work(args.jobs, idle_exit=args.idle_exit, stop=stop)
+        sys.exit(0)
+
+    if args.purge:
+        print(f"Removed {farm.purge()} finished jobs.")
+    print(json.dumps(farm.status(), indent=2))
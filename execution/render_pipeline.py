@@ -0,0 +1,195 @@
+import argparse
+import sys
+from pathlib import Path
+
+import media_catalog
+from add_music import music_mix_filter
+from audio_stems import ensure_stems
+from build_manifest import BuildManifest
+from encoder_profiles import add_profile_argument, video_codec_args
+from apply_voiceover import subtitle_filter
+from parallel_jobs import FFmpegJob, run_ffmpeg_jobs
+from resize_video_1x1 import blur_pad_filter
+from stage_error import StageError
+from subtitle_overlay import ensure_overlays, overlay_filter, overlay_request
+
+
+def compile_render(video_file, output_file, audio_file=None, subtitle_file=None, music_file=None, size=None, stem_file=None, overlay=None, profile=None, levels=None, duck=False):
+    """
+    Compiles the voiceover -> subtitles -> music -> 1:1 resize stages into ONE ffmpeg command.
+    Each stage is optional; the result matches running apply_voiceover, add_music and
+    resize_video_1x1 in sequence, but with a single decode and a single video encode.
+    If `stem_file` (a pre-rendered voiceover+music mix from audio_stems) is given, it is
+    stream-copied instead of mixing and re-encoding the audio for this output.
+    If `overlay` (the subtitles pre-rendered by subtitle_overlay) is given, it is
+    composited in place of running libass on this video.
+    `profile` selects the encoder settings for the video encode (see encoder_profiles).
+    `levels` is the (voice, music) loudness for a normalized mix (see music_mix_filter; either
+    None mixes the music at the fixed level) and `duck` the add_music ducking option.
+    """
+    cmd = ['ffmpeg', '-y', '-i', str(video_file)]
+    filters = []
+    next_input = 1
+
+    # Video chain: burn subtitles at source resolution, then blur-pad to square
+    video_label = "[0:v]"
+    if overlay:
+        cmd.extend(['-i', str(overlay.path)])
+        filters.append(overlay_filter(video_label, f"[{next_input}:v]", "[vsub]", overlay.x, overlay.y))
+        video_label = "[vsub]"
+        next_input += 1
+    elif subtitle_file:
+        filters.append(f"{video_label}{subtitle_filter(subtitle_file)}[vsub]")
+        video_label = "[vsub]"
+    if size:
+        filters.append(blur_pad_filter(size, src=video_label, out="[vout]"))
+        video_label = "[vout]"
+
+    # Audio chain: voiceover padded/trimmed to the video length replaces the original audio
+    audio_label = "[0:a]"
+    if stem_file:
+        cmd.extend(['-i', str(stem_file)])
+        audio_label = f"{next_input}:a"
+        next_input += 1
+        audio_file = music_file = None
+    elif audio_file:
+        duration = media_catalog.probe(video_file)["duration"]
+        cmd.extend(['-i', str(audio_file)])
+        filters.append(f"[{next_input}:a]apad=whole_dur={duration},atrim=0:{duration}[vo]")
+        audio_label = "[vo]"
+        next_input += 1
+    if music_file:
+        cmd.extend(['-i', str(music_file)])
+        filters.append(music_mix_filter(audio_label, f"[{next_input}:a]", "[aout]", *(levels or (None, None)), duck=duck))
+        audio_label = "[aout]"
+        next_input += 1
+
+    if filters:
+        cmd.extend(['-filter_complex', ";".join(filters)])
+
+    cmd.extend(['-map', video_label if video_label != "[0:v]" else "0:v"])
+    cmd.extend(['-map', audio_label if audio_label != "[0:a]" else "0:a?"])
+
+    # Video is encoded once (only when a video stage ran); audio once when remixed
+    cmd.extend(video_codec_args(profile) if (subtitle_file or size) else ['-c:v', 'copy'])
+    if audio_file or music_file:
+        cmd.extend(['-c:a', 'aac', '-b:a', '192k'])
+    else:
+        cmd.extend(['-c:a', 'copy'])
+    if stem_file:
+        # Stems are rendered in 0.1s steps; cut at the end of the video
+        cmd.extend(['-t', str(media_catalog.probe(video_file)["duration"])])
+
+    cmd.append(str(output_file))
+    return cmd
+
+
+def render_pipeline(input_dir, output_dir, audio_file=None, subtitle_file=None, music_dir=None, size=1080, jobs=1, use_stems=True, prerender_subs=False, profile=None, normalize=False, duck=False, incremental=False):
+    """
+    Renders every (video x music track) deliverable from assembled videos in a single pass each.
+    Output names match the staged pipeline: {video}_{music}_1x1.mp4
+    With a voiceover and use_stems, each distinct (voiceover, music, duration) audio mix
+    is rendered once via audio_stems and muxed into every matching output.
+    With subtitles and prerender_subs, captions are rasterized once per resolution and overlaid.
+    `profile` selects the encoder settings (see encoder_profiles).
+    `normalize` and `duck` are the add_music mix options; loudness is measured once per file.
+    With incremental=True only outputs whose inputs or settings changed since the last run
+    are rendered (see build_manifest).
+    """
+    input_path = Path(input_dir)
+    output_path = Path(output_dir)
+
+    for label, p in [("Input directory", input_path), ("Audio file", audio_file),
+                     ("Subtitle file", subtitle_file), ("Music directory", music_dir)]:
+        if p and not Path(p).exists():
+            raise StageError(f"{label} '{p}' does not exist.")
+
+    output_path.mkdir(parents=True, exist_ok=True)
+    manifest = BuildManifest(output_path) if incremental else None
+
+    video_exts = {'.mp4', '.mov', '.avi', '.mkv'}
+    audio_exts = {'.mp3', '.wav', '.aac', '.m4a'}
+
+    video_files = sorted([f for f in input_path.iterdir() if f.suffix.lower() in video_exts])
+    music_files = sorted([f for f in Path(music_dir).iterdir() if f.suffix.lower() in audio_exts]) if music_dir else [None]
+
+    if not video_files:
+        print(f"No video files found in '{input_dir}'.")
+        return output_path
+
+    if not music_files:
+        print(f"No music files found in '{music_dir}'.")
+        return output_path
+
+    infos = media_catalog.probe_many(video_files)
+
+    stems = {}
+    levels = {}
+    if audio_file and use_stems:
+        stems = ensure_stems(
+            {(audio_file, m, infos[v]["duration"]) for v in video_files if v in infos for m in music_files},
+            jobs=jobs, normalize=normalize, duck=duck
+        )
+    elif normalize and music_dir:
+        # Analyse the voices and tracks up front, in parallel (cached in the media catalog)
+        levels = media_catalog.loudness_many(([audio_file] if audio_file else list(infos)) + music_files)
+
+    overlays = {}
+    if subtitle_file and prerender_subs:
+        overlays = ensure_overlays({overlay_request(v, subtitle_file) for v in video_files if v in infos}, jobs=jobs)
+
+    ffmpeg_jobs = []
+    up_to_date = 0
+    for video_path in video_files:
+        if video_path not in infos:
+            print(f"Skipping {video_path.name}: could not be probed.")
+            continue
+        for music_path in music_files:
+            name = video_path.stem
+            if music_path:
+                name += f"_{music_path.stem}"
+            if size:
+                name += "_1x1"
+            output_file_path = output_path / f"{name}.mp4"
+
+            stem_file = stems.get((audio_file, music_path, infos.get(video_path, {}).get("duration")))
+            overlay = overlays.get(overlay_request(video_path, subtitle_file)) if overlays else None
+            # Files that couldn't be measured were reported; their mixes use the fixed level, as in add_music
+            mix_levels = (levels.get(Path(audio_file) if audio_file else video_path), levels.get(music_path)) if levels else None
+            cmd = compile_render(video_path, output_file_path, audio_file, subtitle_file, music_path, size, stem_file, overlay, profile, mix_levels, duck)
+            # The SRT is only referenced inside the filter graph
+            if manifest and not manifest.plan(cmd, extra_inputs=(subtitle_file,)):
+                up_to_date += 1
+                continue
+            ffmpeg_jobs.append(FFmpegJob(f"Rendering: {video_path.name} -> {output_file_path.name}", cmd))
+
+    if manifest:
+        print(f"{up_to_date} outputs up to date, {len(ffmpeg_jobs)} to render.")
+    print(f"Rendering {len(ffmpeg_jobs)} deliverables in a single pass each.")
+    run_ffmpeg_jobs(ffmpeg_jobs, jobs, on_done=manifest.on_done if manifest else None)
+    return output_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fused single-pass render: voiceover + subtitles + music + 1:1 resize.")
+    parser.add_argument("--input", required=True, help="Folder containing assembled videos")
+    parser.add_argument("--output", required=True, help="Output folder for final videos")
+    parser.add_argument("--audio", help="Voiceover audio file (replaces video audio)")
+    parser.add_argument("--subtitles", help="SRT file to burn in")
+    parser.add_argument("--music_dir", help="Folder containing music tracks (one output per track)")
+    parser.add_argument("--size", type=int, default=1080, help="Square output dimension; 0 keeps the source geometry. Default 1080.")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of concurrent ffmpeg processes (default 1)")
+    parser.add_argument("--no_stems", action="store_true", help="Mix audio inside every render instead of reusing cached audio stems")
+    add_profile_argument(parser)
+    parser.add_argument("--prerender_subs", action="store_true", help="Rasterize subtitles once per resolution and overlay them instead of running libass per output")
+    parser.add_argument("--normalize", action="store_true", help="Level voice and music from their cached loudness (EBU R128) instead of mixing music at a fixed 20%%")
+    parser.add_argument("--duck", action="store_true", help="Lower the music while the voice is speaking (sidechain compression)")
+    parser.add_argument("--incremental", action="store_true", help="Skip outputs that are already up to date")
+
+    args = parser.parse_args()
+
+    try:
+        render_pipeline(args.input, args.output, args.audio, args.subtitles, args.music_dir, args.size, args.jobs, not args.no_stems, args.prerender_subs, args.profile, args.normalize, args.duck, args.incremental)
+    except StageError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
@@ -2,19 +2,111 @@ import argparse
 import subprocess
 import os
 import sys
+import time
 from pathlib import Path
 
-def process_videos(input_dir, output_dir, size=1080):
+import media_catalog
+from chunked_encode import CHUNK_SECONDS, chunked_encode
+from encoder_profiles import add_profile_argument, video_codec_args
+from parallel_jobs import FFmpegJob, run_ffmpeg_jobs
+from stage_error import StageError
+
+# Output aspect ratios (width, height); `size` is the short edge
+ASPECTS = {
+    "1x1": (1, 1),
+    "9x16": (9, 16),
+    "4x5": (4, 5),
+    "16x9": (16, 9),
+}
+BLUR_RADIUS = 40
+# Fast mode blurs the background at 1/FAST_BLUR_SCALE resolution and scales it back up
+FAST_BLUR_SCALE = 4
+
+def aspect_dimensions(aspect, size):
+    """Even (width, height) for an ASPECTS key with `size` as the short edge."""
+    w, h = ASPECTS[aspect]
+    short = min(w, h)
+    return (size * w // short) // 2 * 2, (size * h // short) // 2 * 2
+
+def blur_pad_filter(size, src="[0:v]", out="", height=None, fast=False, prefix=""):
     """
-    Resizes videos from input_dir to 1:1 format with blurred background
-    and saves them to output_dir.
+    Blur-pad graph (square unless `height` is given):
+    1. Background: Scale to cover the frame, crop to it, blur
+    2. Foreground: Scale to fit the frame
+    3. Overlay Foreground on Background
+    The source is decoded once and split into both layers.
+    With fast, the background is covered, cropped and blurred at reduced resolution
+    and scaled back up, which looks the same since it is blurred anyway.
+    `prefix` keeps labels unique when several graphs share one filter_complex.
+    """
+    width = size
+    height = height or size
+    if fast:
+        bw, bh = max(2, width // FAST_BLUR_SCALE // 2 * 2), max(2, height // FAST_BLUR_SCALE // 2 * 2)
+        radius = max(1, min(BLUR_RADIUS // FAST_BLUR_SCALE, bw // 2 - 1, bh // 2 - 1))
+        background = (f"scale={bw}:{bh}:force_original_aspect_ratio=increase,crop={bw}:{bh},"
+                      f"boxblur={radius},scale={width}:{height}")
+    else:
+        background = f"scale={width}:{height}:force_original_aspect_ratio=increase,crop={width}:{height},boxblur={BLUR_RADIUS}"
+    return (
+        f"{src}split=2[{prefix}bg_src][{prefix}fg_src];"
+        f"[{prefix}bg_src]{background}[{prefix}bg];"
+        f"[{prefix}fg_src]scale={width}:{height}:force_original_aspect_ratio=decrease[{prefix}fg];"
+        f"[{prefix}bg][{prefix}fg]overlay=(W-w)/2:(H-h)/2{out}"
+    )
+
+def aspect_filter(aspect, size, fast=False, source_size=None, src="[0:v]", out=""):
+    """Graph for one ASPECTS target: blur-padded, or only scaled if the source already has its aspect ratio."""
+    w, h = aspect_dimensions(aspect, size)
+    if source_size and source_size[0] * h == source_size[1] * w:
+        return f"{src}scale={w}:{h}{out}"
+    return blur_pad_filter(w, src, out, height=h, fast=fast, prefix=f"{aspect}_")
+
+def multi_aspect_filter(aspects, size, fast=False, source_size=None, src="[0:v]"):
+    """
+    One graph that splits a single decode into every aspect in `aspects`.
+    Outputs are labelled [v_<aspect>]. Targets with the source's own aspect ratio
+    (given `source_size` as (width, height)) are only scaled, no background needed.
+    """
+    parts = [f"{src}split={len(aspects)}" + "".join(f"[s_{a}]" for a in aspects)] if len(aspects) > 1 else []
+    for a in aspects:
+        label = f"[s_{a}]" if len(aspects) > 1 else src
+        parts.append(aspect_filter(a, size, fast, source_size, label, f"[v_{a}]"))
+    return ";".join(parts)
+
+def output_name(file_path, aspect):
+    return f"{file_path.stem}_{aspect}{file_path.suffix}"
+
+def multi_aspect_command(file_path, outputs, size, fast=False, source_size=None, profile=None):
+    """ffmpeg command writing {aspect: output path} from one decode of file_path."""
+    aspects = list(outputs)
+    cmd = [
+        'ffmpeg',
+        '-y', # Overwrite output
+        '-i', str(file_path),
+        '-filter_complex', multi_aspect_filter(aspects, size, fast, source_size),
+    ]
+    for a in aspects:
+        # Without a profile the container's default encoder (libx264 for mp4) is used, as before
+        codec = video_codec_args(profile) if profile else []
+        cmd.extend(['-map', f"[v_{a}]", '-map', '0:a?', *codec, '-c:a', 'copy', str(outputs[a])])
+    return cmd
+
+def process_videos(input_dir, output_dir, size=1080, jobs=None, aspects=("1x1",), fast=False, profile=None, chunked=False, chunk_seconds=CHUNK_SECONDS):
+    """
+    Resizes videos from input_dir to 1:1 format (or every aspect in `aspects`,
+    see ASPECTS) with blurred background and saves them to output_dir.
+    All aspects of a video are written by one ffmpeg process from a single decode.
+    Runs up to `jobs` ffmpeg processes concurrently (default 1).
+    `profile` selects the encoder settings (see encoder_profiles).
+    With chunked, videos are done one output at a time, each split at keyframes into
+    `chunk_seconds` chunks encoded by `jobs` processes (default: CPU count; see chunked_encode).
     """
     input_path = Path(input_dir)
     output_path = Path(output_dir)
 
     if not input_path.exists():
-        print(f"Error: Input directory '{input_dir}' does not exist.")
-        sys.exit(1)
+        raise StageError(f"Input directory '{input_dir}' does not exist.")
 
     output_path.mkdir(parents=True, exist_ok=True)
 
@@ -27,48 +119,93 @@ def process_videos(input_dir, output_dir, size=1080):
         print(f"No video files found in '{input_dir}'.")
         return
 
+    unknown = [a for a in aspects if a not in ASPECTS]
+    if unknown:
+        raise StageError(f"Unknown aspect(s) {', '.join(unknown)}. Choose from: {', '.join(ASPECTS)}")
+
     print(f"Found {len(files)} videos to process.")
 
+    infos = media_catalog.probe_many(files)
+
+    if chunked:
+        failed = []
+        for file_path in files:
+            info = infos.get(file_path)
+            source_size = (info["width"], info["height"]) if info and info["has_video"] else None
+            for a in aspects:
+                output_file = output_path / output_name(file_path, a)
+                error = chunked_encode(file_path, output_file, aspect_filter(a, size, fast, source_size, "[in]", "[out]"),
+                                       profile=profile, jobs=jobs, chunk_seconds=chunk_seconds)
+                if error:
+                    print(f"  Error: {error}")
+                    failed.append(output_file.name)
+        if failed:
+            print(f"Finished with errors: {len(failed)} outputs failed: {', '.join(failed)}")
+        return output_path
+
+    ffmpeg_jobs = []
     for file_path in files:
-        output_filename = f"{file_path.stem}_1x1{file_path.suffix}"
-        output_file_path = output_path / output_filename
-
-        print(f"Processing: {file_path.name} -> {output_filename}")
-
-        # FFmpeg filter complex
-        # 1. Background: Scale to cover 1:1, crop to 1:1, blur
-        # 2. Foreground: Scale to fit 1:1
-        # 3. Overlay Foreground on Background
-
-        filter_complex = (
-            f"[0:v]scale={size}:{size}:force_original_aspect_ratio=increase,crop={size}:{size},boxblur=40[bg];"
-            f"[0:v]scale={size}:{size}:force_original_aspect_ratio=decrease[fg];"
-            f"[bg][fg]overlay=(W-w)/2:(H-h)/2"
-        )
-
-        cmd = [
-            'ffmpeg',
-            '-y', # Overwrite output
-            '-i', str(file_path),
-            '-filter_complex', filter_complex,
-            '-c:a', 'copy', # Copy audio
-            str(output_file_path)
-        ]
+        outputs = {a: output_path / output_name(file_path, a) for a in aspects}
+        info = infos.get(file_path)
+        source_size = (info["width"], info["height"]) if info and info["has_video"] else None
 
-        try:
-            # Run ffmpeg, suppress verbose output
+        # FFmpeg filter complex: blurred cover background + fitted foreground, per aspect
+        cmd = multi_aspect_command(file_path, outputs, size, fast, source_size, profile)
+
+        names = ", ".join(p.name for p in outputs.values())
+        ffmpeg_jobs.append(FFmpegJob(f"Processing: {file_path.name} -> {names}", cmd))
+
+    run_ffmpeg_jobs(ffmpeg_jobs, jobs or 1)
+    return output_path
+
+def benchmark(video_file, size=1080, aspects=("1x1",), runs=2):
+    """
+    Measures filter throughput (fps, null output, no encode) of the full and fast
+    background modes on video_file for the given aspects. Returns {mode: fps}.
+    """
+    info = media_catalog.probe(video_file)
+    frames = info["duration"] * (info["fps"] or 30)
+    source_size = (info["width"], info["height"])
+    results = {}
+    for mode, fast in (("blur", False), ("fast", True)):
+        cmd = ['ffmpeg', '-y', '-i', str(video_file),
+               '-filter_complex', multi_aspect_filter(list(aspects), size, fast, source_size)]
+        for a in aspects:
+            cmd.extend(['-map', f"[v_{a}]", '-f', 'null', '-'])
+        best = None
+        for _ in range(runs):
+            start = time.perf_counter()
             subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            print("  Done.")
-        except subprocess.CalledProcessError as e:
-            print(f"  Error processing {file_path.name}: {e}")
-            # print(e.stderr.decode()) # Uncomment for debug
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results[mode] = frames / best
+        print(f"  {mode:5s} {', '.join(aspects)}: {results[mode]:6.1f} fps ({best:.2f}s)")
+    return results
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Resize videos to 1:1 with blurred background.")
+    parser = argparse.ArgumentParser(description="Resize videos to 1:1 (or several aspect ratios) with blurred background.")
     parser.add_argument("--input", required=True, help="Input folder containing videos")
     parser.add_argument("--output", required=True, help="Output folder for processed videos")
-    parser.add_argument("--size", type=int, default=1080, help="Output dimension (square size). Default 1080.")
+    parser.add_argument("--size", type=int, default=1080, help="Output dimension (square size; short edge for other aspects). Default 1080.")
+    parser.add_argument("--jobs", type=int, help="Number of concurrent ffmpeg processes (default 1; chunk encodes with --chunked default to the CPU count)")
+    parser.add_argument("--aspects", default="1x1", help=f"Comma-separated output aspects from {', '.join(ASPECTS)}, all written from one decode (default 1x1)")
+    parser.add_argument("--fast_blur", action="store_true", help=f"Blur the background at 1/{FAST_BLUR_SCALE} resolution and upscale it")
+    add_profile_argument(parser)
+    parser.add_argument("--benchmark", action="store_true", help="Report fps of the blur and fast modes on the first input video instead of processing")
+    parser.add_argument("--chunked", action="store_true", help="Encode each output as keyframe-aligned chunks on --jobs processes, for long videos")
+    parser.add_argument("--chunk_seconds", type=float, default=CHUNK_SECONDS, help=f"Target chunk length with --chunked (default {CHUNK_SECONDS})")
 
     args = parser.parse_args()
 
-    process_videos(args.input, args.output, args.size)
+    aspects = tuple(a.strip() for a in args.aspects.split(",") if a.strip())
+    if args.benchmark:
+        extensions = {'.mp4', '.mov', '.avi', '.mkv'}
+        video = sorted(f for f in Path(args.input).iterdir() if f.suffix.lower() in extensions)[0]
+        print(f"Resize benchmark ({video.name}, size {args.size}):")
+        benchmark(video, args.size, aspects)
+    else:
+        try:
+            process_videos(args.input, args.output, args.size, args.jobs, aspects, args.fast_blur, args.profile, args.chunked, args.chunk_seconds)
+        except StageError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
@@ -0,0 +1,226 @@
+import hashlib
+import math
+import os
+import subprocess
+from collections import namedtuple
+from functools import lru_cache
+from pathlib import Path
+
+import media_catalog
+from parallel_jobs import FFmpegJob, run_ffmpeg_jobs
+
+DEFAULT_TRANSITION_DIR = ".tmp/transitions"
+# Length of assemble_video's body -> packshot crossfade
+CROSSFADE = 0.5
+# Catalog fields that must match for clips to be stream-copied into one file
+COPY_FIELDS = ("video_codec", "width", "height", "pix_fmt", "fps", "time_base")
+
+# fade_start: where the crossfade starts in the body; body_keyframe: pts of the last body keyframe
+# before it; body_keyframe_dts: its dts; packshot_keyframe: first packshot keyframe after the fade (None: none)
+Cut = namedtuple("Cut", ["fade_start", "body_keyframe", "body_keyframe_dts", "packshot_keyframe"])
+Transition = namedtuple("Transition", ["path", "cut", "end"])
+
+
+def _read_packets(file_path, interval):
+    """(pts, dts, duration, is_keyframe) of the video packets in an ffprobe -read_intervals range."""
+    result = subprocess.run([
+        'ffprobe', '-v', 'error', '-select_streams', 'v:0', '-read_intervals', interval,
+        '-show_entries', 'packet=pts_time,dts_time,duration_time,flags', '-of', 'csv=p=0',
+        str(file_path)
+    ], capture_output=True, text=True, check=True)
+    packets = []
+    for line in result.stdout.splitlines():
+        pts, dts, duration, flags = (line.split(",") + ["", "", "", ""])[:4]
+        try:
+            packets.append((float(pts), float(dts), float(duration or 0), "K" in flags))
+        except ValueError:
+            continue
+    return packets
+
+
+def keyframe_dts(file_path, pts):
+    """Decode timestamp of the keyframe at `pts` (earlier than pts when the stream has B-frames)."""
+    for p, dts, _, key in _read_packets(file_path, f"{pts}%+#1"):
+        if key:
+            return dts
+    return pts
+
+
+@lru_cache(maxsize=None)
+def video_stream_signature(file_path):
+    """(container stream id, extradata hash) of the video stream; the extradata holds the H.264 SPS/PPS."""
+    result = subprocess.run([
+        'ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'stream=id,extradata_hash',
+        '-show_data_hash', 'sha256', '-of', 'csv=p=0', str(file_path)
+    ], capture_output=True, text=True, check=True)
+    stream_id, _, extradata = result.stdout.strip().partition(",")
+    return int(stream_id, 0) if stream_id else None, extradata
+
+
+def compatible(*files):
+    """
+    True if the clips' video can be stream-copied into one H.264 file: same codec,
+    geometry, pixel format, frame rate and time base, identical parameter sets, and the
+    video in the same container stream (so the concat script can select it by id).
+    """
+    infos = [media_catalog.probe(f) for f in files]
+    if any(info["video_codec"] != "h264" for info in infos):
+        return False
+    if any(tuple(info[k] for k in COPY_FIELDS) != tuple(infos[0][k] for k in COPY_FIELDS) for info in infos):
+        return False
+    return len({video_stream_signature(f) for f in files}) == 1
+
+
+def plan_cut(body, packshot):
+    """
+    Where to switch between copying and encoding: the last body keyframe at or before the
+    crossfade and the first packshot keyframe at or after its end. Returns a Cut.
+    As with assemble_video's xfade offset, the fade starts with the first body frame at or
+    after 0.5s before the end of the body's video stream.
+    """
+    eps = 1e-3
+    fps = media_catalog.probe(body)["fps"] or 30
+    fade_start = max(0.0, math.ceil((media_catalog.video_end(body) - CROSSFADE) * fps - eps) / fps)
+    body_keyframe = max((k for k in media_catalog.keyframes(body) if k <= fade_start + eps), default=0.0)
+    packshot_keyframe = min((k for k in media_catalog.keyframes(packshot) if k >= CROSSFADE - eps), default=None)
+    dts = keyframe_dts(body, body_keyframe) if body_keyframe > 0 else 0.0
+    return Cut(fade_start, body_keyframe, dts, packshot_keyframe)
+
+
+def transition_path(body, packshot, cut, encoder_args, cache_dir=DEFAULT_TRANSITION_DIR):
+    """Cache location of an encoded transition; changes with either clip, the cut or the encoder settings."""
+    parts = []
+    for p in (body, packshot):
+        st = Path(p).stat()
+        parts.append(f"{Path(p).resolve()}|{st.st_size}|{st.st_mtime_ns}")
+    parts.append(repr(tuple(cut)))
+    parts.extend(encoder_args)
+    digest = hashlib.sha1("|".join(parts).encode('utf-8')).hexdigest()[:16]
+    return Path(cache_dir) / f"{Path(body).stem}_{Path(packshot).stem}_{digest}.mp4"
+
+
+def transition_command(body, packshot, cut, encoder_args, output_file):
+    """
+    Encodes only the GOP-aligned window around the crossfade: the body from its cut keyframe,
+    faded into the packshot from `fade_start` on, up to the packshot's cut keyframe (or its end).
+    The frame rate, time base and pixel format of the clips are kept so the segment can be
+    stream-copied between them.
+    """
+    info = media_catalog.probe(body)
+    cmd = ['ffmpeg', '-y']
+    if cut.body_keyframe > 0:
+        cmd.extend(['-ss', str(cut.body_keyframe)])
+    cmd.extend(['-i', str(body)])
+    if cut.packshot_keyframe is not None:
+        cmd.extend(['-t', str(cut.packshot_keyframe)])
+    cmd.extend(['-i', str(packshot)])
+    offset = cut.fade_start - cut.body_keyframe
+    cmd.extend([
+        '-filter_complex',
+        f"[0:v]settb=AVTB[b];[1:v]settb=AVTB[p];"
+        f"[b][p]xfade=transition=fade:duration={CROSSFADE}:offset={offset},"
+        f"settb=1/{info['fps']:g},format={info['pix_fmt']}[v]",
+        '-map', '[v]',
+        '-an',
+        *encoder_args,
+        str(output_file)
+    ])
+    return cmd
+
+
+def ensure_transitions(pairs, encoder_args, cache_dir=DEFAULT_TRANSITION_DIR, jobs=1):
+    """
+    Encodes the crossfade window of each distinct (body, packshot) pair once.
+    Pairs whose clips can't be stream-copied together, or whose encoded window came out
+    with different parameter sets than the clips, are left out (they need a full render).
+    Returns {(body, packshot): Transition}.
+    """
+    Path(cache_dir).mkdir(parents=True, exist_ok=True)
+
+    planned = {}
+    for body, packshot in set(pairs):
+        if compatible(body, packshot):
+            cut = plan_cut(body, packshot)
+            planned[(body, packshot)] = (cut, transition_path(body, packshot, cut, encoder_args, cache_dir))
+
+    missing = {path: (req, cut) for req, (cut, path) in planned.items() if not path.exists()}
+    if missing:
+        print(f"Encoding {len(missing)} crossfade segments ({len(planned) - len(missing)} cached).")
+        ffmpeg_jobs = []
+        for path, ((body, packshot), cut) in missing.items():
+            tmp_out = path.with_name(f".{path.stem}.{os.getpid()}.tmp.mp4")
+            label = f"Transition: {Path(body).name} -> {Path(packshot).name}"
+            ffmpeg_jobs.append((path, tmp_out, FFmpegJob(label, transition_command(body, packshot, cut, encoder_args, tmp_out))))
+
+        results = run_ffmpeg_jobs([job for _, _, job in ffmpeg_jobs], jobs)
+        for (path, tmp_out, _), (_, error) in zip(ffmpeg_jobs, results):
+            if error is None:
+                os.replace(tmp_out, path)
+            else:
+                Path(tmp_out).unlink(missing_ok=True)
+
+    transitions = {}
+    for req, (cut, path) in planned.items():
+        if path.exists() and compatible(req[0], path):
+            transitions[req] = Transition(path, cut, media_catalog.video_end(path))
+    return transitions
+
+
+def _concat_entry(path, **directives):
+    escaped = str(Path(path).resolve()).replace("'", "'\\''")
+    lines = [f"file '{escaped}'"]
+    lines.extend(f"{key} {value}" for key, value in directives.items())
+    return "\n".join(lines)
+
+
+def concat_list(hook, body, packshot, transition, cache_dir=DEFAULT_TRANSITION_DIR):
+    """
+    Writes the concat demuxer script for one combination: the whole hook, the body up to its
+    cut keyframe, the encoded transition and the packshot from its cut keyframe.
+    Only the video stream is declared and every entry has an explicit inpoint; otherwise the
+    demuxer would offset the video by the start time of the clips' AAC audio (its priming delay).
+    The hook lasts until the end of its video stream (not the container, which AAC audio makes
+    longer): assemble_video's concat filter starts the body's video right after the hook's last
+    frame, so the body lands on the same frame timestamps as in the full render.
+    The script is named by its content, so unchanged combinations reuse it.
+    """
+    cut = transition.cut
+    stream_id, _ = video_stream_signature(hook)
+    entries = ["ffconcat version 1.0", "stream", f"exact_stream_id {stream_id}", _concat_entry(hook, inpoint=0, duration=media_catalog.video_end(hook))]
+    if cut.body_keyframe > 0:
+        # The concat demuxer cuts on dts: stop before the keyframe's dts so it isn't copied too
+        entries.append(_concat_entry(body, inpoint=0, outpoint=cut.body_keyframe_dts, duration=cut.body_keyframe))
+    entries.append(_concat_entry(transition.path, inpoint=0, duration=transition.end))
+    if cut.packshot_keyframe is not None:
+        entries.append(_concat_entry(packshot, inpoint=cut.packshot_keyframe))
+    content = "\n".join(entries) + "\n"
+
+    path = Path(cache_dir) / "lists" / f"{hashlib.sha1(content.encode('utf-8')).hexdigest()[:16]}.txt"
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp.write_text(content, encoding='utf-8')
+        os.replace(tmp, path)
+    return path
+
+
+def smart_command(hook, body, packshot, transition, audio_filter, output_file, cache_dir=DEFAULT_TRANSITION_DIR):
+    """
+    Assembles one combination with the video stream-copied through the concat demuxer
+    (only the transition was encoded) and the audio rendered in full by `audio_filter`
+    (assembly_filter with video=False), which keeps it sample-accurate.
+    """
+    return [
+        'ffmpeg',
+        '-y',
+        '-i', str(hook),
+        '-i', str(body),
+        '-i', str(packshot),
+        '-f', 'concat', '-safe', '0', '-i', str(concat_list(hook, body, packshot, transition, cache_dir)),
+        '-filter_complex', audio_filter,
+        '-map', '3:v',
+        '-map', '[a]',
+        '-c:v', 'copy',
+        '-c:a', 'aac',
+        str(output_file)
+    ]
@@ -0,0 +1,6 @@
+class StageError(Exception):
+    """
+    A stage could not run (missing input, missing API key) or its ffmpeg/API work failed.
+    Stage functions raise it instead of exiting, so one process can drive many calls;
+    the scripts' command lines print it and exit with status 1.
+    """
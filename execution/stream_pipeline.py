@@ -0,0 +1,208 @@
+import argparse
+import re
+import sys
+from pathlib import Path
+
+from add_music import music_mix_filter
+from apply_voiceover import subtitle_filter
+from assemble_video import DEFAULT_MEZZANINE_DIR, assembly_filter, prepare_sources
+from encoder_profiles import add_profile_argument, video_codec_args
+from parallel_jobs import FFmpegJob, run_ffmpeg_jobs
+from resize_video_1x1 import blur_pad_filter
+from stage_error import StageError
+
+# Video codecs for the NUT streams passed between stages
+PIPE_CODECS = {
+    # Uncompressed: no encode cost, most pipe bandwidth
+    "rawvideo": ['-c:v', 'rawvideo'],
+    # Lossless intra-only: a fraction of the bandwidth for some CPU per stage
+    "ffv1": ['-c:v', 'ffv1', '-g', '1'],
+}
+PIPE_AUDIO = ['-c:a', 'pcm_s16le']
+
+
+def _to_pipe(video_codec):
+    return ['-c:v', 'copy'] if video_codec is None else PIPE_CODECS[video_codec]
+
+
+def _pipe_output(video_codec, audio_codec=PIPE_AUDIO):
+    """Output options writing a NUT stream to stdout; video_codec=None copies the incoming video."""
+    return [*_to_pipe(video_codec), *audio_codec, '-f', 'nut', 'pipe:1']
+
+
+def assemble_stage(sources, durations, has_audio, norm_filters=None, pipe_codec="rawvideo"):
+    """Hook -> Body -> Packshot assembly (see assemble_video) streamed to stdout."""
+    cmd = ['ffmpeg']
+    for src in sources:
+        cmd.extend(['-i', str(src)])
+    cmd.extend([
+        '-filter_complex', assembly_filter(durations, has_audio, norm_filters),
+        '-map', '[v]', '-map', '[a]',
+    ])
+    return cmd + _pipe_output(pipe_codec)
+
+
+def voiceover_stage(duration, audio_file=None, subtitle_file=None, pipe_codec="rawvideo"):
+    """Replaces the streamed audio with the voiceover (fitted to `duration`) and burns in subtitles."""
+    cmd = ['ffmpeg', '-f', 'nut', '-i', 'pipe:0']
+    filters = []
+    video_map, audio_map = '0:v', '0:a'
+    if subtitle_file:
+        filters.append(f"[0:v]{subtitle_filter(subtitle_file)}[v]")
+        video_map = '[v]'
+    if audio_file:
+        cmd.extend(['-i', str(audio_file)])
+        filters.append(f"[1:a]apad=whole_dur={duration},atrim=0:{duration}[a]")
+        audio_map = '[a]'
+    if filters:
+        cmd.extend(['-filter_complex', ";".join(filters)])
+    cmd.extend(['-map', video_map, '-map', audio_map])
+    return cmd + _pipe_output(pipe_codec if subtitle_file else None)
+
+
+def _tee_slave(output_file, audio_index):
+    """One tee muxer output: the shared video plus one of the audio streams."""
+    path = re.sub(r"([\\'|])", r"\\\1", str(output_file))
+    return f"[f=mp4:select=\\'v:0,a:{audio_index}\\']{path}"
+
+
+def fanout_stage(outputs, size=None, profile=None):
+    """
+    Final stage for every music track of one combination, so the head of the chain runs once.
+    `outputs` is a list of (output_file, music_file or None). The stream is blur-padded to a
+    square (if size) and encoded once; each track is mixed under its own copy of the streamed
+    audio (asplit), and the tee muxer writes the shared video with each mix to its own file.
+    """
+    cmd = ['ffmpeg', '-y', '-f', 'nut', '-i', 'pipe:0']
+    filters = []
+    video_map = '0:v'
+    if size:
+        filters.append(blur_pad_filter(size, src="[0:v]", out="[v]"))
+        video_map = '[v]'
+
+    tracks = [music for _, music in outputs if music]
+    audio_maps = ['0:a']
+    if tracks:
+        voices = ["[0:a]"]
+        if len(tracks) > 1:
+            voices = [f"[voice{i}]" for i in range(len(tracks))]
+            filters.append("[0:a]asplit=" + str(len(tracks)) + "".join(voices))
+        audio_maps = []
+        for i, music in enumerate(tracks):
+            cmd.extend(['-i', str(music)])
+            filters.append(music_mix_filter(voices[i], f"[{i + 1}:a]", f"[a{i}]"))
+            audio_maps.append(f"[a{i}]")
+
+    if filters:
+        cmd.extend(['-filter_complex', ";".join(filters)])
+    cmd.extend(['-map', video_map])
+    for audio_map in audio_maps:
+        cmd.extend(['-map', audio_map])
+    cmd.extend([*video_codec_args(profile), '-c:a', 'aac', '-b:a', '192k'])
+    if len(outputs) == 1:
+        return cmd + [str(outputs[0][0])]
+    return cmd + ['-f', 'tee', "|".join(_tee_slave(f, i) for i, (f, _) in enumerate(outputs))]
+
+
+def stream_pipeline(hook_dir, body_dir, packshot_dir, output_dir, audio_file=None, subtitle_file=None,
+                    music_dir=None, size=1080, jobs=1, pipe_codec="rawvideo", mezzanine=False,
+                    mezzanine_dir=DEFAULT_MEZZANINE_DIR, profile=None):
+    """
+    Renders every (hook x body x packshot x music track) deliverable with one chain of concurrent
+    ffmpeg processes per combination: assembly -> voiceover/subtitles -> 1:1 resize and encode,
+    fanned out to one music mix and output per track (see fanout_stage), so the assembly and
+    voiceover run once per combination rather than once per track.
+    Stages hand their output to the next one through a pipe as NUT with `pipe_codec` video and
+    PCM audio, so no intermediate is written to disk and the only lossy encode is the last one.
+    Output names match the staged pipeline: {hook}_{body}_{packshot}_{music}_1x1.mp4
+    Runs up to `jobs` chains concurrently.
+    """
+    if pipe_codec not in PIPE_CODECS:
+        raise StageError(f"Unknown pipe codec '{pipe_codec}'. Choose from: {', '.join(PIPE_CODECS)}")
+
+    for label, p in [("Directory", hook_dir), ("Directory", body_dir), ("Directory", packshot_dir),
+                     ("Audio file", audio_file), ("Subtitle file", subtitle_file), ("Music directory", music_dir)]:
+        if p and not Path(p).exists():
+            raise StageError(f"{label} '{p}' does not exist.")
+
+    output_path = Path(output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+
+    exts = {'.mp4', '.mov', '.avi', '.mkv'}
+    audio_exts = {'.mp3', '.wav', '.aac', '.m4a'}
+    hooks, bodies, packshots = (sorted(f for f in Path(d).iterdir() if f.suffix.lower() in exts)
+                                for d in (hook_dir, body_dir, packshot_dir))
+    music_files = sorted(f for f in Path(music_dir).iterdir() if f.suffix.lower() in audio_exts) if music_dir else [None]
+
+    if not hooks or not bodies or not packshots:
+        print("Error: One or more input directories are empty.")
+        return output_path
+    if not music_files:
+        print(f"No music files found in '{music_dir}'.")
+        return output_path
+
+    sources, infos, norm_filters = prepare_sources(hooks, bodies, packshots, mezzanine, mezzanine_dir, jobs)
+
+    ffmpeg_jobs = []
+    deliverables = 0
+    for hook in hooks:
+        for body in bodies:
+            for packshot in packshots:
+                clips = (hook, body, packshot)
+                if any(c not in sources or infos[c][0] <= 0 for c in clips):
+                    print(f"Skipping {hook.stem}_{body.stem}_{packshot.stem}: missing or invalid clip.")
+                    continue
+                durations = tuple(infos[c][0] for c in clips)
+                if durations[0] + durations[1] < 0.5:
+                    print(f"Skipping {hook.stem}_{body.stem}_{packshot.stem}: Hook+Body shorter than the 0.5s overlap.")
+                    continue
+                # The packshot crossfades over the last 0.5s of the body
+                duration = sum(durations) - 0.5
+
+                head = [assemble_stage([sources[c] for c in clips], durations,
+                                       tuple(infos[c][3] for c in clips), norm_filters, pipe_codec)]
+                if audio_file or subtitle_file:
+                    head.append(voiceover_stage(duration, audio_file, subtitle_file, pipe_codec))
+
+                outputs = []
+                for music_path in music_files:
+                    stem = f"{hook.stem}_{body.stem}_{packshot.stem}"
+                    if music_path:
+                        stem += f"_{music_path.stem}"
+                    if size:
+                        stem += "_1x1"
+                    outputs.append((output_path / f"{stem}.mp4", music_path))
+
+                chain = head + [fanout_stage(outputs, size, profile)]
+                ffmpeg_jobs.append(FFmpegJob(f"Streaming: {hook.stem}_{body.stem}_{packshot.stem} -> {len(outputs)} output(s)", chain))
+                deliverables += len(outputs)
+
+    print(f"Rendering {deliverables} deliverables as {len(ffmpeg_jobs)} streaming chains ({pipe_codec} pipes).")
+    run_ffmpeg_jobs(ffmpeg_jobs, jobs)
+    return output_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Streaming render: assembly -> voiceover -> 1:1 resize + music as piped processes, no intermediate files.")
+    parser.add_argument("--hook_dir", required=True, help="Folder containing hooks")
+    parser.add_argument("--body_dir", required=True, help="Folder containing bodies")
+    parser.add_argument("--packshot_dir", required=True, help="Folder containing packshots")
+    parser.add_argument("--output", required=True, help="Output folder for final videos")
+    parser.add_argument("--audio", help="Voiceover audio file (replaces video audio)")
+    parser.add_argument("--subtitles", help="SRT file to burn in")
+    parser.add_argument("--music_dir", help="Folder containing music tracks (one output per track)")
+    parser.add_argument("--size", type=int, default=1080, help="Square output dimension; 0 keeps the source geometry. Default 1080.")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of concurrent chains (default 1)")
+    parser.add_argument("--pipe_codec", default="rawvideo", choices=list(PIPE_CODECS), help="Video codec between stages (default rawvideo)")
+    parser.add_argument("--mezzanine", action="store_true", help="Assemble from normalized mezzanines")
+    parser.add_argument("--mezzanine_dir", default=DEFAULT_MEZZANINE_DIR, help=f"Mezzanine cache folder (default {DEFAULT_MEZZANINE_DIR})")
+    add_profile_argument(parser)
+
+    args = parser.parse_args()
+
+    try:
+        stream_pipeline(args.hook_dir, args.body_dir, args.packshot_dir, args.output, args.audio, args.subtitles,
+                        args.music_dir, args.size, args.jobs, args.pipe_codec, args.mezzanine, args.mezzanine_dir, args.profile)
+    except StageError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
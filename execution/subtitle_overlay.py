@@ -0,0 +1,206 @@
+import argparse
+import hashlib
+import json
+import math
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import namedtuple
+from pathlib import Path
+
+import media_catalog
+from apply_voiceover import SUBTITLE_STYLE, subtitle_filter
+from parallel_jobs import FFmpegJob, run_ffmpeg_jobs
+
+DEFAULT_OVERLAY_DIR = ".tmp/subtitle_overlays"
+
+# A cached caption overlay: only the band that ever holds captions, placed at (x, y)
+Overlay = namedtuple("Overlay", ["path", "x", "y"])
+
+
+def overlay_duration(duration):
+    """Overlays are rendered in whole seconds (rounded up) so similar video lengths share one."""
+    return math.ceil(round(duration, 3))
+
+
+def overlay_path(subtitle_file, style, width, height, fps, duration, cache_dir=DEFAULT_OVERLAY_DIR):
+    """Cache location for the rasterized captions of (SRT content, style, resolution, fps, duration)."""
+    parts = [media_catalog.content_hash(subtitle_file), style, f"{width}x{height}", f"{fps:.3f}", str(overlay_duration(duration))]
+    digest = hashlib.sha1("|".join(parts).encode('utf-8')).hexdigest()[:16]
+    return Path(cache_dir) / f"{Path(subtitle_file).stem}_{width}x{height}_{digest}.mov"
+
+
+def overlay_command(subtitle_file, style, width, height, fps, duration, output_file):
+    """
+    ffmpeg command that burns captions onto a fully transparent canvas and stores the
+    result as QuickTime Animation (qtrle, ARGB). With one keyframe, identical consecutive
+    frames compress to almost nothing, so the file stays small however long the video is.
+    """
+    return [
+        'ffmpeg',
+        '-y',
+        '-f', 'lavfi',
+        '-i', f"color=c=black@0:s={width}x{height}:r={fps}:d={overlay_duration(duration)},format=rgba",
+        '-vf', f"{subtitle_filter(subtitle_file, style)}:alpha=1",
+        '-c:v', 'qtrle',
+        '-g', '100000',
+        '-pix_fmt', 'argb',
+        str(output_file)
+    ]
+
+
+def caption_bounds(overlay_file):
+    """
+    Union of the non-transparent area over all frames as (x, y, w, h), aligned to even
+    pixels for 4:2:0 video. Returns None if the overlay is empty.
+    """
+    result = subprocess.run(
+        ['ffmpeg', '-i', str(overlay_file), '-vf', 'alphaextract,bbox=min_val=1', '-f', 'null', '-'],
+        check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    boxes = re.findall(r'x1:(\d+) x2:(\d+) y1:(\d+) y2:(\d+)', result.stderr.decode('utf-8', 'replace'))
+    if not boxes:
+        return None
+    x1, x2, y1, y2 = (f(int(b[i]) for b in boxes) for f, i in ((min, 0), (max, 1), (min, 2), (max, 3)))
+    x1, y1 = x1 - x1 % 2, y1 - y1 % 2
+    return x1, y1, (x2 - x1 + 2) // 2 * 2, (y2 - y1 + 2) // 2 * 2
+
+
+def crop_command(full_overlay, bounds, output_file):
+    x, y, w, h = bounds
+    return ['ffmpeg', '-y', '-i', str(full_overlay), '-vf', f"crop={w}:{h}:{x}:{y}",
+            '-c:v', 'qtrle', '-g', '100000', '-pix_fmt', 'argb', str(output_file)]
+
+
+def overlay_filter(video="[0:v]", overlay="[1:v]", out="", x=0, y=0):
+    """Composites a pre-rendered caption overlay; the video continues untouched if it outlasts it."""
+    return f"{video}{overlay}overlay={x}:{y}:eof_action=pass{out}"
+
+
+def _read_overlay(path):
+    meta = path.with_suffix(".json")
+    if not (path.exists() and meta.exists()):
+        return None
+    pos = json.loads(meta.read_text())
+    return Overlay(path, pos["x"], pos["y"])
+
+
+def ensure_overlays(requests, cache_dir=DEFAULT_OVERLAY_DIR, jobs=1):
+    """
+    Rasterizes each distinct caption overlay once, then crops it to the area captions
+    actually occupy so compositing only blends that band.
+    `requests` is an iterable of (subtitle_file, style, width, height, fps, duration) tuples.
+    Returns {request: Overlay}; requests whose overlay failed to render are omitted.
+    """
+    Path(cache_dir).mkdir(parents=True, exist_ok=True)
+
+    overlays = {}
+    missing = {}
+    for req in requests:
+        path = overlay_path(*req, cache_dir)
+        overlays[req] = path
+        if not _read_overlay(path) and path not in missing:
+            missing[path] = req
+
+    if missing:
+        print(f"Rendering {len(missing)} subtitle overlays ({len(overlays) - len(missing)} cached).")
+        ffmpeg_jobs = []
+        for path, (subtitle_file, style, width, height, fps, duration) in missing.items():
+            tmp_out = path.with_name(f".{path.stem}.{os.getpid()}.full.mov")
+            label = f"Overlay: {Path(subtitle_file).name} @ {width}x{height}, {overlay_duration(duration)}s"
+            cmd = overlay_command(subtitle_file, style, width, height, fps, duration, tmp_out)
+            ffmpeg_jobs.append((path, tmp_out, FFmpegJob(label, cmd)))
+
+        results = run_ffmpeg_jobs([job for _, _, job in ffmpeg_jobs], jobs)
+        crop_jobs = []
+        for (path, tmp_out, _), (_, error) in zip(ffmpeg_jobs, results):
+            if error is None:
+                bounds = caption_bounds(tmp_out) or (0, 0, 2, 2)
+                tmp_crop = path.with_name(f".{path.stem}.{os.getpid()}.tmp.mov")
+                crop_jobs.append((path, tmp_out, tmp_crop, bounds,
+                                  FFmpegJob(f"Cropping overlay to {bounds[2]}x{bounds[3]}+{bounds[0]}+{bounds[1]}",
+                                            crop_command(tmp_out, bounds, tmp_crop))))
+            else:
+                Path(tmp_out).unlink(missing_ok=True)
+
+        results = run_ffmpeg_jobs([job for *_, job in crop_jobs], jobs)
+        for (path, tmp_out, tmp_crop, bounds, _), (_, error) in zip(crop_jobs, results):
+            Path(tmp_out).unlink(missing_ok=True)
+            if error is None:
+                path.with_suffix(".json").write_text(json.dumps({"x": bounds[0], "y": bounds[1]}))
+                os.replace(tmp_crop, path)
+            else:
+                Path(tmp_crop).unlink(missing_ok=True)
+
+    overlays = {req: _read_overlay(path) for req, path in overlays.items()}
+    return {req: overlay for req, overlay in overlays.items() if overlay}
+
+
+def overlay_request(video_file, subtitle_file, style=SUBTITLE_STYLE):
+    """The ensure_overlays request matching a video's geometry, frame rate and length."""
+    info = media_catalog.probe(video_file)
+    return (str(subtitle_file), style, info["width"], info["height"], info["fps"] or 30, info["duration"])
+
+
+def benchmark(video_file, subtitle_file, style=SUBTITLE_STYLE, runs=3, output_dir=".tmp/subtitle_benchmark"):
+    """
+    Times burning subtitle_file into video_file with the subtitles= filter versus
+    compositing a pre-rendered overlay (render time reported separately). Outputs go to
+    the null muxer so the shared decode is the only other cost. Returns the timings.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    def timed(cmd):
+        start = time.perf_counter()
+        subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        return time.perf_counter() - start
+
+    req = overlay_request(video_file, subtitle_file, style)
+    start = time.perf_counter()
+    overlay = ensure_overlays({req}, output_dir)[req]
+    timings = {"prerender": time.perf_counter() - start}
+
+    libass_cmd = ['ffmpeg', '-y', '-i', str(video_file), '-vf', subtitle_filter(subtitle_file, style),
+                  '-an', '-f', 'null', '-']
+    overlay_cmd = ['ffmpeg', '-y', '-i', str(video_file), '-i', str(overlay.path),
+                   '-filter_complex', overlay_filter(out="[v]", x=overlay.x, y=overlay.y), '-map', '[v]',
+                   '-an', '-f', 'null', '-']
+    decode_cmd = ['ffmpeg', '-y', '-i', str(video_file), '-an', '-f', 'null', '-']
+    timings["decode"] = min(timed(decode_cmd) for _ in range(runs))
+    timings["subtitles_filter"] = min(timed(libass_cmd) for _ in range(runs))
+    timings["overlay"] = min(timed(overlay_cmd) for _ in range(runs))
+
+    print(f"Subtitle burn-in benchmark ({Path(video_file).name}, best of {runs}):")
+    print(f"  decode only         {timings['decode']:.2f}s")
+    print(f"  subtitles= filter   {timings['subtitles_filter']:.2f}s per output (burn-in {timings['subtitles_filter'] - timings['decode']:.2f}s)")
+    print(f"  overlay             {timings['overlay']:.2f}s per output (burn-in {timings['overlay'] - timings['decode']:.2f}s, +{timings['prerender']:.2f}s once)")
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-render burned-in subtitles once per (SRT, style, resolution).")
+    parser.add_argument("--input", required=True, help="Video file or folder (geometry, fps and duration are read from it)")
+    parser.add_argument("--subtitles", required=True, help="Path to .srt file")
+    parser.add_argument("--output", default=DEFAULT_OVERLAY_DIR, help=f"Overlay cache folder (default {DEFAULT_OVERLAY_DIR})")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of concurrent ffmpeg processes (default 1)")
+    parser.add_argument("--benchmark", action="store_true", help="Compare the subtitles= filter with overlay compositing on the first video")
+
+    args = parser.parse_args()
+
+    for p in [args.input, args.subtitles]:
+        if not Path(p).exists():
+            print(f"Error: '{p}' does not exist.")
+            sys.exit(1)
+
+    video_exts = {'.mp4', '.mov', '.avi', '.mkv'}
+    input_path = Path(args.input)
+    videos = [input_path] if input_path.is_file() else sorted(f for f in input_path.iterdir() if f.suffix.lower() in video_exts)
+
+    if args.benchmark:
+        benchmark(videos[0], args.subtitles)
+    else:
+        overlays = ensure_overlays({overlay_request(v, args.subtitles) for v in videos}, args.output, args.jobs)
+        print(f"{len(set(overlays.values()))} overlays available in '{args.output}'.")
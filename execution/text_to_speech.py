@@ -1,41 +1,189 @@
 import argparse
 import os
+import re
 import sys
 import json
 import base64
-import requests
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-def text_to_speech(input_file, output_dir, voice_id="21m00Tcm4TlvDq8ikWAM"): # Default voice: Rachel
+import media_catalog
+from api_cache import ApiCache, cache_key
+from stage_error import StageError
+
+MODEL_ID = "eleven_turbo_v2_5"
+VOICE_SETTINGS = {
+    "stability": 0.5,
+    "similarity_boost": 0.5
+}
+ALIGNMENT_KEYS = ("characters", "character_start_times_seconds", "character_end_times_seconds")
+
+
+def split_text(text, max_chars):
+    """
+    Splits text at sentence boundaries into chunks of at most ~max_chars characters.
+    A single sentence longer than max_chars becomes its own chunk.
+    """
+    chunks = []
+    current = ""
+    for sentence in re.split(r'(?<=[.!?…])\s+', text):
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            chunks.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _synthesize_chunk(url, headers, text, previous_text=None, next_text=None):
+    """One /with-timestamps request. Neighbouring text keeps prosody continuous across chunks."""
+    import requests
+
+    data = {
+        "text": text,
+        "model_id": MODEL_ID,
+        "voice_settings": VOICE_SETTINGS
+    }
+    if previous_text:
+        data["previous_text"] = previous_text
+    if next_text:
+        data["next_text"] = next_text
+
+    try:
+        response = requests.post(url, json=data, headers=headers)
+        response.raise_for_status()
+        json_response = response.json()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        detail = f" Response: {e.response.text}" if getattr(e, 'response', None) is not None else ""
+        raise RuntimeError(f"Error synthesizing chunk: {e}.{detail}")
+
+    if 'audio_base64' not in json_response:
+        raise RuntimeError("Chunk response did not contain audio.")
+    return base64.b64decode(json_response['audio_base64']), json_response.get('alignment')
+
+
+def synthesize_chunked(chunks, url, headers, output_file_path, json_output_path, workers=4):
+    """
+    Synthesizes chunks concurrently (at most `workers` requests ahead of the writer) and
+    appends each chunk's audio to output_file_path as soon as it and all earlier chunks arrived.
+    Per-chunk alignments are shifted by the measured duration of the audio before them and
+    stitched into the single JSON sidecar transcribe_audio expects.
+    The audio is streamed to a temp name and only replaces output_file_path once every chunk
+    is in, so a failure never leaves a truncated file at the final path.
+    """
+    output_file_path = Path(output_file_path)
+    # Per process: the orchestrator and the watch daemon may synthesize the same script at once
+    part_path = output_file_path.with_name(f".{output_file_path.stem}.{os.getpid()}.chunk.mp3")
+    tmp_path = output_file_path.with_name(f".{output_file_path.stem}.{os.getpid()}.tmp.mp3")
+    try:
+        offset, alignment = _write_chunks(chunks, url, headers, tmp_path, part_path, workers)
+        with open(json_output_path, 'w', encoding='utf-8') as f:
+            json.dump(alignment, f, indent=2)
+        os.replace(tmp_path, output_file_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    return offset
+
+
+def _write_chunks(chunks, url, headers, audio_path, part_path, workers):
+    """The writer loop of synthesize_chunked; returns (total duration, stitched alignment)."""
+    alignment = {k: [] for k in ALIGNMENT_KEYS}
+    offset = 0.0
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool, open(audio_path, 'wb') as out:
+        in_flight = deque()
+        next_index = 0
+        for i in range(len(chunks)):
+            while next_index < len(chunks) and len(in_flight) < max(1, workers):
+                previous_text = chunks[next_index - 1] if next_index > 0 else None
+                next_text = chunks[next_index + 1] if next_index + 1 < len(chunks) else None
+                in_flight.append(pool.submit(_synthesize_chunk, url, headers, chunks[next_index], previous_text, next_text))
+                next_index += 1
+
+            audio_data, chunk_alignment = in_flight.popleft().result()
+
+            # The real chunk length (including trailing silence) positions the next chunk
+            part_path.write_bytes(audio_data)
+            try:
+                duration = media_catalog.run_ffprobe(part_path)["duration"]
+            finally:
+                part_path.unlink(missing_ok=True)
+
+            out.write(audio_data)
+            out.flush()
+
+            if chunk_alignment:
+                if i > 0 and alignment["characters"]:
+                    # Chunks were split on whitespace; keep words apart at the seam
+                    alignment["characters"].append(" ")
+                    alignment["character_start_times_seconds"].append(offset)
+                    alignment["character_end_times_seconds"].append(offset)
+                alignment["characters"].extend(chunk_alignment.get("characters", []))
+                for k in ALIGNMENT_KEYS[1:]:
+                    alignment[k].extend(round(t + offset, 3) for t in chunk_alignment.get(k, []))
+
+            offset += duration
+            print(f"Chunk {i + 1}/{len(chunks)} written ({duration:.1f}s, total {offset:.1f}s).")
+
+    return offset, alignment
+
+
+def text_to_speech(input_file, output_dir, voice_id="21m00Tcm4TlvDq8ikWAM", use_cache=True, refresh_cache=False, chunk_chars=0, workers=4): # Default voice: Rachel
     """
     Converts text file to audio using ElevenLabs API.
     Also saves word timestamps to a JSON file for SRT generation.
+    Results are cached on disk by (text, voice_id, model_id, voice_settings); a hit skips the API call.
+    refresh_cache re-requests and overwrites the entry; use_cache=False bypasses the cache entirely.
+    With chunk_chars > 0, scripts longer than that are split at sentence boundaries and the
+    chunks are synthesized by `workers` concurrent requests (see synthesize_chunked).
     """
     input_path = Path(input_file)
     output_path = Path(output_dir)
 
     if not input_path.exists():
-        print(f"Error: Input file '{input_file}' does not exist.")
-        sys.exit(1)
+        raise StageError(f"Input file '{input_file}' does not exist.")
 
     output_path.mkdir(parents=True, exist_ok=True)
 
-    api_key = os.environ.get("ELEVENLABS_API_KEY")
-    if not api_key:
-        print("Error: ELEVENLABS_API_KEY environment variable is not set.")
-        # Attempt to check if user provided it as a manual check or proceed with error
-        sys.exit(1)
-
     try:
         with open(input_path, 'r', encoding='utf-8') as f:
             text = f.read().strip()
     except Exception as e:
-        print(f"Error reading input file: {e}")
-        sys.exit(1)
+        raise StageError(f"Could not read input file: {e}")
 
     if not text:
-        print("Error: Input text file is empty.")
-        sys.exit(1)
+        raise StageError("Input text file is empty.")
+
+    output_file_path = output_path / f"{input_path.stem}.mp3"
+    json_output_path = output_path / f"{input_path.stem}.json"
+
+    chunks = split_text(text, chunk_chars) if chunk_chars and len(text) > chunk_chars else None
+
+    cache = ApiCache() if use_cache else None
+    key_fields = {"text": text, "voice_id": voice_id, "model_id": MODEL_ID, "voice_settings": VOICE_SETTINGS}
+    if chunks:
+        # Chunk boundaries change the synthesized audio
+        key_fields["chunk_chars"] = chunk_chars
+    key = cache_key(**key_fields)
+    if cache and not refresh_cache:
+        restored = cache.restore("tts", key, {"audio.mp3": output_file_path, "alignment.json": json_output_path})
+        if restored:
+            if str(json_output_path) not in restored:
+                # Entry has no alignment (raw audio response): a sidecar from an earlier run would
+                # give transcribe_audio the timestamps of different audio
+                json_output_path.unlink(missing_ok=True)
+            print(f"Cache hit for '{input_path.name}'. Restored: {', '.join(restored)}")
+            return str(output_file_path)
+
+    api_key = os.environ.get("ELEVENLABS_API_KEY")
+    if not api_key:
+        raise StageError("ELEVENLABS_API_KEY environment variable is not set.")
+
+    # Imported here, like in the other API scripts: cache hits and importers that never call the API skip it
+    import requests
 
     print(f"Converting text from '{input_path.name}' to speech...")
 
@@ -53,13 +201,23 @@ def text_to_speech(input_file, output_dir, voice_id="21m00Tcm4TlvDq8ikWAM"): # D
         "xi-api-key": api_key
     }
 
+    if chunks:
+        print(f"Synthesizing {len(chunks)} chunks with {workers} concurrent requests...")
+        try:
+            duration = synthesize_chunked(chunks, url, headers, output_file_path, json_output_path, workers)
+        except Exception as e:
+            # API errors, or a chunk ffprobe couldn't read (CalledProcessError/KeyError from run_ffprobe)
+            raise StageError(f"Chunked synthesis failed: {e}")
+        print(f"Success! Audio saved to: {output_file_path} ({duration:.1f}s)")
+        print(f"Timestamps saved to: {json_output_path}")
+        if cache:
+            cache.put("tts", key, {"audio.mp3": output_file_path, "alignment.json": json_output_path})
+        return str(output_file_path)
+
     data = {
         "text": text,
-        "model_id": "eleven_turbo_v2_5",
-        "voice_settings": {
-            "stability": 0.5,
-            "similarity_boost": 0.5
-        }
+        "model_id": MODEL_ID,
+        "voice_settings": VOICE_SETTINGS
     }
 
     try:
@@ -71,16 +229,12 @@ def text_to_speech(input_file, output_dir, voice_id="21m00Tcm4TlvDq8ikWAM"): # D
             except json.JSONDecodeError:
                 print("Warning: Response was not JSON (Timestamps unavailable). Saving raw audio.")
                 # Save raw audio directly
-                output_filename = f"{input_path.stem}.mp3"
-                output_file_path = output_path / output_filename
                 with open(output_file_path, 'wb') as f:
                     f.write(response.content)
                 print(f"Success! Audio saved to: {output_file_path}")
-                return # Exit successfully without saving JSON
-
-            output_filename = f"{input_path.stem}.mp3"
-            output_file_path = output_path / output_filename
-            json_output_path = output_path / f"{input_path.stem}.json"
+                if cache:
+                    cache.put("tts", key, {"audio.mp3": response.content})
+                return str(output_file_path) # Exit successfully without saving JSON
 
             if 'audio_base64' in json_response:
                 audio_data = base64.b64decode(json_response['audio_base64'])
@@ -89,30 +243,44 @@ def text_to_speech(input_file, output_dir, voice_id="21m00Tcm4TlvDq8ikWAM"): # D
 
                 print(f"Success! Audio saved to: {output_file_path}")
 
+                cached_files = {"audio.mp3": audio_data}
                 if 'alignment' in json_response:
                     with open(json_output_path, 'w', encoding='utf-8') as f:
                         json.dump(json_response['alignment'], f, indent=2)
                     print(f"Timestamps saved to: {json_output_path}")
+                    cached_files["alignment.json"] = json_output_path
+                if cache:
+                    cache.put("tts", key, cached_files)
             else:
                  # Fallback if streaming raw audio (shouldn't happen with json header+timestamps)
                  with open(output_file_path, 'wb') as f:
                     f.write(response.content)
                  print(f"Warning: Saved raw audio, no alignment data found. {output_file_path}")
 
+            return str(output_file_path)
+
         else:
-            print(f"Error from ElevenLabs API: {response.status_code} - {response.text}")
-            sys.exit(1)
+            raise StageError(f"ElevenLabs API returned {response.status_code} - {response.text}")
 
+    except StageError:
+        raise
     except Exception as e:
-        print(f"Error during API request: {e}")
-        sys.exit(1)
+        raise StageError(f"API request failed: {e}")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Convert text to speech using ElevenLabs API.")
     parser.add_argument("--input", required=True, help="Input text file")
     parser.add_argument("--output", required=True, help="Output directory for audio")
     parser.add_argument("--voice_id", default="21m00Tcm4TlvDq8ikWAM", help="ElevenLabs Voice ID")
+    parser.add_argument("--no_cache", action="store_true", help="Bypass the local response cache")
+    parser.add_argument("--refresh_cache", action="store_true", help="Ignore cached results and overwrite them with a fresh API response")
+    parser.add_argument("--chunk_chars", type=int, default=0, help="Split scripts longer than this many characters at sentence boundaries and synthesize the chunks concurrently (default 0: one request)")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent chunk requests with --chunk_chars (default 4)")
 
     args = parser.parse_args()
 
-    text_to_speech(args.input, args.output, args.voice_id)
+    try:
+        text_to_speech(args.input, args.output, args.voice_id, not args.no_cache, args.refresh_cache, args.chunk_chars, args.workers)
+    except StageError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
@@ -1,115 +1,221 @@
 import argparse
 import json
-import sys
+import random
+import re
+import time
+from bisect import bisect_right
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate
 from pathlib import Path
 
-def generate_srt(audio_file, output_srt):
+import media_catalog
+
+# One caption line. Times are in seconds.
+Cue = namedtuple("Cue", ["start", "end", "text"])
+
+# "Finite" captions: Shorter segments for punchy feel.
+# Max chars ~15-20 suitable for vertical video / shorts.
+MAX_LINE_CHARS = 20
+LINE_BREAK_ENDINGS = ('.', '!', '?', ',')
+
+# Same look as apply_voiceover.SUBTITLE_STYLE, expressed as an ASS style.
+# PlayRes matches libass' default for SRT, so font sizes render identically.
+ASS_PLAY_RES = (384, 288)
+ASS_STYLE = {
+    "Fontname": "Arial", "Fontsize": "24",
+    "PrimaryColour": "&H00FFFFFF", "SecondaryColour": "&H00FFFFFF",
+    "OutlineColour": "&H00000000", "BackColour": "&H00000000",
+    "Bold": "0", "Italic": "0", "Underline": "0", "StrikeOut": "0",
+    "ScaleX": "100", "ScaleY": "100", "Spacing": "0", "Angle": "0",
+    "BorderStyle": "1", "Outline": "1", "Shadow": "1", "Alignment": "2",
+    "MarginL": "10", "MarginR": "10", "MarginV": "30", "Encoding": "1",
+}
+_WORD = re.compile(r'\S+')
+
+
+def alignment_words(alignment):
     """
-    Generates SRT file from ElevenLabs alignment JSON sidecar.
+    Splits an ElevenLabs alignment into words: [(text, start, end)].
+    The characters are joined once and scanned with a regex; word times are
+    looked up by index in the start/end arrays instead of building strings per character.
+
+    ElevenLabs alignment format:
+    {
+      "characters": ["H", "e", "l", "l", "o", " "],
+      "character_start_times_seconds": [0.0, 0.05, ...],
+      "character_end_times_seconds": [0.05, 0.1, ...]
+    }
+    """
+    chars = alignment.get("characters", [])
+    starts = alignment.get("character_start_times_seconds", [])
+    ends = alignment.get("character_end_times_seconds", [])
+    text = "".join(chars)
+
+    last = len(text) - 1
+
+    # A word ends with the space that follows it (or the last character)
+    if len(text) == len(chars):
+        return [(m.group(), starts[m.start()], ends[min(m.end(), last)]) for m in _WORD.finditer(text)]
+
+    # Some entries hold more than one code point: map string offsets back to entries
+    offsets = list(accumulate(len(c) for c in chars))
+    return [
+        (m.group(), starts[bisect_right(offsets, m.start())], ends[bisect_right(offsets, min(m.end(), last))])
+        for m in _WORD.finditer(text)
+    ]
+
+
+def words_to_cues(words, max_chars=MAX_LINE_CHARS):
+    """Groups words into lines, breaking after max_chars or at punctuation."""
+    cues = []
+    line_start = 0
+    count = 0
+    for i, (text, _, end) in enumerate(words):
+        count += len(text) + 1
+        if count > max_chars or text.endswith(LINE_BREAK_ENDINGS) or i == len(words) - 1:
+            cues.append(Cue(words[line_start][1], end, " ".join(w[0] for w in words[line_start:i + 1])))
+            line_start = i + 1
+            count = 0
+    return cues
+
+
+def alignment_cues(alignment, max_chars=MAX_LINE_CHARS):
+    """Caption cues for an alignment dict."""
+    return words_to_cues(alignment_words(alignment), max_chars)
+
+
+def load_cues(audio_file, max_chars=MAX_LINE_CHARS):
+    """
+    Caption cues for an audio file, read from its ElevenLabs alignment JSON sidecar.
+    Without a sidecar, returns one placeholder cue spanning the audio duration.
     """
     audio_path = Path(audio_file)
     json_path = audio_path.with_suffix(".json")
 
     if not json_path.exists():
         print(f"Warning: Alignment file '{json_path}' not found. Generating estimated SRT from audio duration (fallback).")
-        # Fallback: Create a single subtitle line for the whole duration (or split blindly)
-        # We need audio duration. Use ffprobe or just guess/read if possible.
-        # Since we don't have python-ffmpeg installed easily, we'll try to run ffprobe.
-        import subprocess
+        # We need audio duration. Read it from the shared media catalog (runs ffprobe only on first sight).
         try:
-             result = subprocess.run(["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", str(audio_path)], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-             duration = float(result.stdout.strip())
+             duration = float(media_catalog.probe(audio_path)["duration"])
+             if duration <= 0:
+                 raise ValueError("zero duration")
         except Exception as e:
              print(f"Error getting duration: {e}. Defaulting to 10s.")
              duration = 10.0
-
-        # Create a simple SRT with one block
-        with open(output_srt, 'w', encoding='utf-8') as f:
-            s = format_time(0)
-            e = format_time(duration)
-            f.write(f"1\n{s} --> {e}\n(Voiceover Caption)\n\n")
-        print(f"SRT generated (Fallback): {output_srt}")
-        return
+        return [Cue(0.0, duration, "(Voiceover Caption)")]
 
     with open(json_path, 'r', encoding='utf-8') as f:
-        alignment = json.load(f)
-
-    # ElevenLabs alignment format:
-    # {
-    #   "characters": ["H", "e", "l", "l", "o", " "],
-    #   "character_start_times_seconds": [0.0, 0.05, ...],
-    #   "character_end_times_seconds": [0.05, 0.1, ...]
-    # }
+        return alignment_cues(json.load(f), max_chars)
 
-    chars = alignment.get("characters", [])
-    starts = alignment.get("character_start_times_seconds", [])
-    ends = alignment.get("character_end_times_seconds", [])
 
-    words = []
-    current_word = ""
-    word_start = 0.0
-    word_end = 0.0
-
-    # Simple word grouping logic
-    if chars:
-         word_start = starts[0]
-
-    for i, char in enumerate(chars):
-        current_word += char
-
-        # Word end detection (space)
-        if char == " " or i == len(chars) - 1:
-            word_end = ends[i]
-            if current_word.strip():
-                 words.append({
-                    "text": current_word.strip(),
-                    "start": word_start,
-                    "end": word_end
-                 })
-            current_word = ""
-            if i < len(chars) - 1:
-                word_start = starts[i+1]
-
-    # SRT Line Grouping (simplified)
-    subtitles = []
-    current_line = []
-    current_line_char_count = 0
-    line_start = 0.0
-
-    for i, word in enumerate(words):
-        if not current_line:
-            line_start = word['start']
-
-        current_line.append(word)
-        current_line_char_count += len(word['text']) + 1
-
-        # "Finite" captions: Shorter segments for punchy feel.
-        # Max chars ~15-20 suitable for vertical video / shorts.
-        is_end_of_sentence = word['text'].endswith(('.', '!', '?', ','))
-        if current_line_char_count > 20 or is_end_of_sentence or i == len(words) - 1:
-            line_end = word['end']
-            line_text = " ".join([w['text'] for w in current_line])
-
-            subtitles.append({
-                "start": line_start,
-                "end": line_end,
-                "text": line_text
-            })
-            current_line = []
-            current_line_char_count = 0
-            if i < len(words) - 1:
-                # Next line starts at the next word's start
-                # (handled by line_start assignment at loop start)
-                pass
-
-    # Write SRT
+def write_srt(cues, output_srt):
     with open(output_srt, 'w', encoding='utf-8') as f:
-        for i, sub in enumerate(subtitles, 1):
-            s = format_time(sub['start'])
-            e = format_time(sub['end'])
-            f.write(f"{i}\n{s} --> {e}\n{sub['text']}\n\n")
+        f.write("".join(
+            f"{i}\n{format_time(c.start)} --> {format_time(c.end)}\n{c.text}\n\n"
+            for i, c in enumerate(cues, 1)
+        ))
+    return str(output_srt)
+
+
+def write_ass(cues, output_ass, style=None):
+    """Writes cues as an ASS script. `style` overrides ASS_STYLE fields (force_style keys)."""
+    fields = dict(ASS_STYLE, **(style or {}))
+    header = (
+        "[Script Info]\nScriptType: v4.00+\n"
+        f"PlayResX: {ASS_PLAY_RES[0]}\nPlayResY: {ASS_PLAY_RES[1]}\nWrapStyle: 0\n\n"
+        "[V4+ Styles]\n"
+        f"Format: Name, {', '.join(fields)}\n"
+        f"Style: Default,{','.join(fields.values())}\n\n"
+        "[Events]\nFormat: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n"
+    )
+    with open(output_ass, 'w', encoding='utf-8') as f:
+        f.write(header)
+        f.write("".join(
+            f"Dialogue: 0,{format_ass_time(c.start)},{format_ass_time(c.end)},Default,,0,0,0,,{c.text}\n"
+            for c in cues
+        ))
+    return str(output_ass)
+
 
+def generate_srt(audio_file, output_srt):
+    """
+    Generates SRT file from ElevenLabs alignment JSON sidecar.
+    """
+    output = write_srt(load_cues(audio_file), output_srt)
     print(f"SRT generated: {output_srt}")
+    return output
+
+
+def _generate_one(json_path, output_dir, formats):
+    cues = load_cues(Path(json_path).with_suffix(".mp3"))
+    outputs = []
+    if "srt" in formats:
+        outputs.append(write_srt(cues, Path(output_dir) / f"{Path(json_path).stem}.srt"))
+    if "ass" in formats:
+        outputs.append(write_ass(cues, Path(output_dir) / f"{Path(json_path).stem}.ass"))
+    return outputs
+
+
+def generate_batch(input_dir, output_dir, formats=("srt", "ass"), jobs=None):
+    """
+    Generates subtitles for every alignment sidecar (*.json) in input_dir in one process pool.
+    Returns {sidecar path: [written files]}; failures are reported and omitted.
+    """
+    sidecars = sorted(Path(input_dir).glob("*.json"))
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {p: pool.submit(_generate_one, p, output_dir, formats) for p in sidecars}
+        for p, future in futures.items():
+            try:
+                results[p] = future.result()
+            except Exception as e:
+                print(f"Error processing {p.name}: {e}")
+    print(f"Generated subtitles for {len(results)}/{len(sidecars)} alignments in '{output_dir}'.")
+    return results
+
+
+def synthetic_alignment(minutes, seed=0):
+    """Alignment for `minutes` of speech (~15 chars/s) built from random words."""
+    rng = random.Random(seed)
+    vocab = ["the", "video", "render", "quickly", "subtitle", "music", "voice", "and", "is", "a", "frame", "pipeline"]
+    chars, starts, ends = [], [], []
+    t = 0.0
+    while t < minutes * 60:
+        word = rng.choice(vocab) + rng.choice(["", "", "", ",", "."]) + " "
+        for c in word:
+            chars.append(c)
+            starts.append(round(t, 3))
+            t += 1 / 15
+            ends.append(round(t, 3))
+    return {"characters": chars, "character_start_times_seconds": starts, "character_end_times_seconds": ends}
+
+
+def benchmark(minutes=60, repeat=3, output_dir=".tmp/transcribe_benchmark"):
+    """Times segmentation and SRT/ASS writing on a synthetic alignment. Returns the best timings."""
+    alignment = synthetic_alignment(minutes)
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    best = {}
+    for _ in range(repeat):
+        timings = {}
+        t0 = time.perf_counter()
+        cues = alignment_cues(alignment)
+        timings["segment"] = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        write_srt(cues, Path(output_dir) / "benchmark.srt")
+        timings["srt"] = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        write_ass(cues, Path(output_dir) / "benchmark.ass")
+        timings["ass"] = time.perf_counter() - t0
+        best = {k: min(v, best.get(k, v)) for k, v in timings.items()}
+
+    print(f"{minutes} min alignment: {len(alignment['characters'])} characters -> {len(cues)} cues")
+    for k, v in best.items():
+        print(f"  {k:8s} {v * 1000:8.1f} ms")
+    return best
+
 
 def format_time(seconds):
     # HH:MM:SS,mmm
@@ -120,10 +226,27 @@ def format_time(seconds):
     seconds = seconds % 60
     return f"{hours:02}:{minutes:02}:{seconds:02},{millis:03}"
 
+def format_ass_time(seconds):
+    # H:MM:SS.cc
+    centis = int(round(seconds * 100))
+    return f"{centis // 360000}:{(centis // 6000) % 60:02}:{(centis // 100) % 60:02}.{centis % 100:02}"
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Generate SRT from TTS alignment JSON.")
-    parser.add_argument("--audio", required=True, help="Input audio file (expects .json sidecar)")
-    parser.add_argument("--output", required=True, help="Output SRT file")
+    parser.add_argument("--audio", help="Input audio file (expects .json sidecar)")
+    parser.add_argument("--output", help="Output SRT file (or output folder with --input_dir)")
+    parser.add_argument("--input_dir", help="Batch mode: folder of alignment .json sidecars")
+    parser.add_argument("--formats", default="srt,ass", help="Batch mode output formats (default srt,ass)")
+    parser.add_argument("--jobs", type=int, help="Batch mode worker processes (default: CPU count)")
+    parser.add_argument("--benchmark", type=float, metavar="MINUTES", help="Benchmark cue generation on a synthetic alignment of this length")
 
     args = parser.parse_args()
-    generate_srt(args.audio, args.output)
+
+    if args.benchmark:
+        benchmark(args.benchmark)
+    elif args.input_dir and args.output:
+        generate_batch(args.input_dir, args.output, tuple(f.strip() for f in args.formats.split(",")), args.jobs)
+    elif args.audio and args.output:
+        generate_srt(args.audio, args.output)
+    else:
+        parser.error("either --audio and --output, --input_dir and --output, or --benchmark is required")
@@ -0,0 +1,383 @@
+import argparse
+import ctypes
+import ctypes.util
+import fcntl
+import os
+import select
+import signal
+import struct
+import sys
+import threading
+import time
+import traceback
+from pathlib import Path
+
+import media_catalog
+from job_queue import DEFAULT_QUEUE_PATH, JobQueue
+from stage_error import StageError
+
+VIDEO_EXTS = {'.mp4', '.mov', '.avi', '.mkv'}
+AUDIO_EXTS = {'.mp3', '.wav', '.aac', '.m4a'}
+
+# inotify(7) constants
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+# struct inotify_event header: wd, mask, cookie, len (the name follows, NUL-padded)
+_EVENT = struct.Struct("iIII")
+
+
+class Inotify:
+    """
+    Minimal ctypes binding of Linux inotify: reports files in watched directories that
+    finished writing (IN_CLOSE_WRITE) or were moved in (IN_MOVED_TO).
+    Raises OSError (or AttributeError off Linux) when inotify is unavailable.
+    """
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self.watches = {}
+
+    def add_watch(self, directory, mask=IN_CLOSE_WRITE | IN_MOVED_TO):
+        wd = self._add_watch(self.fd, os.fsencode(str(directory)), mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), str(directory))
+        self.watches[wd] = Path(directory)
+
+    def read(self, timeout=None):
+        """
+        Waits up to `timeout` seconds for events. Returns a list of file paths; None in the list
+        means events were lost or a watch went away, so the directories should be rescanned.
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        paths = []
+        offset = 0
+        while offset + _EVENT.size <= len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            name = data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b"\0")
+            offset += _EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                paths.append(None)
+            elif mask & IN_IGNORED:
+                # Directory deleted or unmounted
+                self.watches.pop(wd, None)
+                paths.append(None)
+            elif wd in self.watches and name:
+                paths.append(self.watches[wd] / os.fsdecode(name))
+        return paths
+
+    def close(self):
+        os.close(self.fd)
+
+
+def watch_dirs(input_dir="input"):
+    """{directory: role} for the inputs the pipeline reads (same layout as orchestrator.build_pipeline)."""
+    root = Path(input_dir)
+    dirs = {root / "text": "script", root / "music": "music"}
+    for part in ("hook", "body", "packshot"):
+        dirs[root / "videos" / part] = "clip"
+    return dirs
+
+
+def pipeline_dirs(input_dir="input"):
+    """orchestrator.build_pipeline input folders under `input_dir`, so a pipeline reads the tree being watched."""
+    root = Path(input_dir)
+    return {
+        "voiceover_dir": str(root / "voiceovers"),
+        "subtitle_dir": str(root / "subtitles"),
+        "video_dir": str(root / "videos"),
+        "music_dir": str(root / "music"),
+        "processed_dir": str(root / "processed"),
+    }
+
+
+def classify(path, role):
+    """Job kind for a file arriving in a `role` directory, or None if it isn't an input."""
+    suffix = path.suffix.lower()
+    if path.name.startswith("."):
+        # Temp files of in-progress copies and of our own atomic writes
+        return None
+    if role == "script" and suffix == ".txt":
+        return "pipeline"
+    if (role == "clip" and suffix in VIDEO_EXTS) or (role == "music" and suffix in AUDIO_EXTS):
+        return "media"
+    return None
+
+
+class WatchDaemon:
+    """
+    Watches the input folders and turns every new script into a full pipeline job and
+    every new clip or music track into a media job (catalog probe, keyframes and, with
+    mezzanine=True, normalization), so later renders start warm.
+    Jobs go through a persistent JobQueue and run on `workers` threads; at most
+    `pipelines` pipeline jobs run at once since their deliverables share output/final.
+    """
+
+    def __init__(self, queue, input_dir="input", workers=2, pipelines=1, languages=("es", "pl", "uk"),
+                 pipeline_workers=4, jobs=1, mezzanine=False, streaming=False, max_attempts=3,
+                 rescan=300, settle=2.0, poll=None):
+        self.queue = queue
+        self.input_dir = Path(input_dir)
+        self.dirs = watch_dirs(input_dir)
+        self.workers = max(1, workers)
+        self.pipelines = max(1, pipelines)
+        self.languages = tuple(languages)
+        self.pipeline_workers = pipeline_workers
+        self.jobs = jobs
+        self.mezzanine = mezzanine
+        self.streaming = streaming
+        self.max_attempts = max_attempts
+        self.rescan = rescan
+        self.settle = settle
+        self.poll = poll
+
+        self.stop = threading.Event()
+        self._wake = threading.Event()
+        self._claim_lock = threading.Lock()
+        self._running = {}
+
+    def enqueue_file(self, path, role, settle=0.0):
+        """Queues the job for one input file (once per file version). Returns True if a job was added."""
+        kind = classify(path, role)
+        if not kind:
+            return False
+        try:
+            resolved = path.resolve()
+            st = resolved.stat()
+        except FileNotFoundError:
+            return False
+        if not resolved.is_file() or time.time() - st.st_mtime < settle:
+            # Possibly still being written; its close event or the next scan picks it up
+            return False
+
+        payload = {"path": str(resolved), "role": role, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+        if self.queue.enqueue(kind, f"{kind}:{resolved}:{st.st_size}:{st.st_mtime_ns}", payload, self.max_attempts):
+            print(f"[daemon] Queued {kind}: {path.name}")
+            self._wake.set()
+            return True
+        return False
+
+    def scan(self):
+        """Queues every input already present (files already queued in this version are ignored)."""
+        added = 0
+        for directory, role in self.dirs.items():
+            if directory.is_dir():
+                for f in sorted(directory.iterdir()):
+                    added += self.enqueue_file(f, role, self.settle)
+        return added
+
+    def _claim(self):
+        with self._claim_lock:
+            busy = sum(1 for kind in self._running.values() if kind == "pipeline")
+            job = self.queue.claim(exclude_kinds=("pipeline",) if busy >= self.pipelines else ())
+            if job:
+                self._running[threading.get_ident()] = job.kind
+            return job
+
+    def run_job(self, job):
+        """Runs one job; returns its JSON-serializable result or raises."""
+        path = Path(job.payload["path"])
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            return {"skipped": "input no longer exists"}
+        if (st.st_size, st.st_mtime_ns) != (job.payload["size"], job.payload["mtime_ns"]):
+            # A newer version of the file has its own job
+            return {"skipped": "input changed since it was queued"}
+
+        if job.kind == "pipeline":
+            # Imported here so the watcher starts without the API dependencies
+            from orchestrator import run_pipeline
+            summary = run_pipeline(path, self.pipeline_workers, languages=self.languages, mezzanine=self.mezzanine,
+                                   jobs=self.jobs, streaming=self.streaming, **pipeline_dirs(self.input_dir))
+            if not summary["ok"]:
+                failed = [name for name, r in summary["tasks"].items() if r["status"] == "failed"]
+                raise RuntimeError(f"pipeline tasks failed: {', '.join(failed)}")
+            return summary
+
+        info = media_catalog.probe(path)
+        result = {"duration": info["duration"]}
+        if info["has_video"]:
+            result["keyframes"] = len(media_catalog.keyframes(path))
+        if job.payload["role"] == "clip" and self.mezzanine:
+            from assemble_video import prepare_sources
+            clips = [sorted(f for f in (self.input_dir / "videos" / part).iterdir() if f.suffix.lower() in VIDEO_EXTS)
+                     for part in ("hook", "body", "packshot")]
+            if all(clips):
+                # Mezzanines are sized from the first hook; cached clips are not re-encoded
+                sources, _, _ = prepare_sources(*clips, mezzanine=True, jobs=self.jobs)
+                result["mezzanine"] = str(sources.get(path, ""))
+        return result
+
+    def _worker(self):
+        while not self.stop.is_set():
+            job = self._claim()
+            if job is None:
+                due = self.queue.next_due()
+                self._wake.wait(timeout=min(5.0, due) if due is not None else 5.0)
+                self._wake.clear()
+                continue
+
+            name = Path(job.payload["path"]).name
+            print(f"[daemon] Starting {job.kind}: {name} (attempt {job.attempts}/{job.max_attempts})")
+            start = time.time()
+            try:
+                result = self.run_job(job)
+                self.queue.complete(job.id, result)
+                if "skipped" in result:
+                    print(f"[daemon] SKIPPED: {job.kind} {name} - {result['skipped']}")
+                else:
+                    print(f"[daemon] DONE: {job.kind} {name} ({time.time() - start:.1f}s)")
+            except (Exception, SystemExit) as e:
+                # Execution scripts raise StageError (their CLIs exit); contain them to this job
+                detail = f"exit code {e.code}" if isinstance(e, SystemExit) else f"{type(e).__name__}: {e}"
+                if not isinstance(e, (SystemExit, StageError)):
+                    traceback.print_exc()
+                state = self.queue.fail(job.id, detail)
+                retry = " - will retry" if state == "queued" else ""
+                print(f"[daemon] FAILED: {job.kind} {name} ({time.time() - start:.1f}s) - {detail}{retry}")
+            finally:
+                with self._claim_lock:
+                    self._running.pop(threading.get_ident(), None)
+                # A finished pipeline may unblock a queued one for another worker
+                self._wake.set()
+
+    def idle(self):
+        counts = self.queue.counts()
+        return counts["queued"] == 0 and counts["running"] == 0
+
+    def run(self, once=False):
+        """
+        Resumes interrupted jobs, queues what is already in the input folders, then reacts to
+        new files until stopped. With once=True it returns when the queue has drained.
+        """
+        for directory in self.dirs:
+            directory.mkdir(parents=True, exist_ok=True)
+
+        recovered = self.queue.recover()
+        if recovered:
+            print(f"[daemon] Resuming {recovered} interrupted jobs.")
+
+        inotify = None
+        if not once and not self.poll:
+            try:
+                inotify = Inotify()
+                for directory in self.dirs:
+                    inotify.add_watch(directory)
+            except (OSError, AttributeError) as e:
+                print(f"[daemon] inotify unavailable ({e}); polling every 5s.")
+                inotify = None
+                self.poll = 5
+
+        # Watches are in place before the scan, so nothing written in between is missed
+        print(f"[daemon] {self.scan()} new inputs found; watching {', '.join(str(d) for d in self.dirs)}")
+
+        threads = [threading.Thread(target=self._worker, name=f"worker-{i}", daemon=True) for i in range(self.workers)]
+        for t in threads:
+            t.start()
+
+        last_scan = time.time()
+        try:
+            while not self.stop.is_set():
+                if once:
+                    if self.idle():
+                        break
+                    self.stop.wait(1.0)
+                    continue
+                if inotify:
+                    paths = inotify.read(timeout=1.0)
+                    if None in paths:
+                        print("[daemon] Watch events lost; rescanning.")
+                        for directory in self.dirs:
+                            if directory not in inotify.watches.values():
+                                directory.mkdir(parents=True, exist_ok=True)
+                                inotify.add_watch(directory)
+                        self.scan()
+                    for path in filter(None, paths):
+                        self.enqueue_file(path, self.dirs.get(path.parent))
+                else:
+                    self.stop.wait(self.poll)
+                    self.scan()
+                    last_scan = time.time()
+                if time.time() - last_scan >= self.rescan:
+                    # Safety net for files that settled without an event (e.g. written before start)
+                    self.scan()
+                    last_scan = time.time()
+        finally:
+            self.stop.set()
+            self._wake.set()
+            if self._running:
+                print("[daemon] Stopping; waiting for running jobs to finish (interrupt again to abandon them).")
+            for t in threads:
+                t.join()
+            if inotify:
+                inotify.close()
+
+
+def acquire_lock(queue_path):
+    """Holds an exclusive lock next to the queue so only one daemon works it (and recovers its jobs)."""
+    Path(queue_path).parent.mkdir(parents=True, exist_ok=True)
+    lock_file = open(f"{queue_path}.lock", "w")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        print(f"Error: Another daemon is already using '{queue_path}'.")
+        sys.exit(1)
+    return lock_file
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Watch the input folders and run pipeline jobs from a persistent queue (replaces automation.sh polling).")
+    parser.add_argument("--input_dir", default="input", help="Root of text/, videos/{hook,body,packshot}/ and music/; pipelines also use its voiceovers/, subtitles/ and processed/ (default input)")
+    parser.add_argument("--queue", default=DEFAULT_QUEUE_PATH, help=f"Queue database (default {DEFAULT_QUEUE_PATH})")
+    parser.add_argument("--workers", type=int, default=2, help="Jobs running concurrently (default 2)")
+    parser.add_argument("--pipelines", type=int, default=1, help="Pipeline jobs running concurrently (default 1)")
+    parser.add_argument("--langs", default="es,pl,uk", help="Comma-separated dubbing languages (default es,pl,uk)")
+    parser.add_argument("--pipeline_workers", type=int, default=4, help="Orchestrator tasks per pipeline (default 4)")
+    parser.add_argument("--jobs", type=int, default=1, help="ffmpeg processes per render task (default 1)")
+    parser.add_argument("--mezzanine", action="store_true", help="Normalize new clips on arrival and assemble from mezzanines")
+    parser.add_argument("--streaming", action="store_true", help="Render through streaming chains")
+    parser.add_argument("--max_attempts", type=int, default=3, help="Runs per job before it is marked failed (default 3)")
+    parser.add_argument("--retry_delay", type=float, default=30, help="Seconds before the first retry, doubling after each (default 30)")
+    parser.add_argument("--rescan", type=float, default=300, help="Seconds between full rescans of the input folders (default 300)")
+    parser.add_argument("--poll", type=float, help="Poll every N seconds instead of using inotify")
+    parser.add_argument("--once", action="store_true", help="Process the inputs already present, then exit")
+
+    args = parser.parse_args()
+
+    lock = acquire_lock(args.queue)
+    queue = JobQueue(args.queue, retry_delay=args.retry_delay)
+    daemon = WatchDaemon(
+        queue, args.input_dir, args.workers, args.pipelines,
+        tuple(l.strip() for l in args.langs.split(",") if l.strip()),
+        args.pipeline_workers, args.jobs, args.mezzanine, args.streaming, args.max_attempts,
+        args.rescan, poll=args.poll
+    )
+
+    def request_stop(signum, frame):
+        daemon.stop.set()
+        # A second interrupt kills the process; its running jobs are resumed on the next start
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    daemon.run(once=args.once)
+    print(f"[daemon] Stopped. Queue: {', '.join(f'{n} {state}' for state, n in queue.counts().items())}")
@@ -0,0 +1,79 @@
+"""
+In-process entry point to the execution/ stages.
+
+    python -m ffagent apply_voiceover --batch output/assembled --audio vo.mp3 --output output/voiced
+
+    import ffagent
+    ffagent.apply_voiceover_batch(ffagent.load_batch("output/assembled", "vo.mp3", output_dir="output/voiced"))
+
+Stage modules are imported on first use, so importing ffagent or running one stage does not
+load the others (or `requests`). Stage functions return their results and raise StageError
+instead of exiting, so one long-lived process can drive any number of calls.
+"""
+import importlib
+import sys
+from pathlib import Path
+
+EXECUTION_DIR = Path(__file__).resolve().parent.parent / "execution"
+# The execution scripts import each other by bare module name
+if str(EXECUTION_DIR) not in sys.path:
+    sys.path.insert(0, str(EXECUTION_DIR))
+
+# `ffagent <stage>` runs the command line of execution/<stage>.py
+STAGES = {
+    "text_to_speech": "Text file to voiceover (ElevenLabs) with word timestamps",
+    "transcribe_audio": "SRT/ASS captions from TTS alignment",
+    "dub_voiceover": "Dub a voiceover into other languages (ElevenLabs)",
+    "assemble_video": "Hook x body x packshot assemblies",
+    "apply_voiceover": "Replace audio with a voiceover and burn in subtitles (single, multi-track or batch)",
+    "add_subtitles": "Burn subtitles into videos",
+    "add_music": "Video x music combinations",
+    "resize_video_1x1": "Blur-padded square (or other aspect) versions",
+    "render_pipeline": "Fused single-pass render of the post-assembly stages",
+    "stream_pipeline": "Piped render chain without intermediate files",
+    "orchestrator": "Full pipeline as a task graph",
+    "watch_daemon": "Watch-folder service",
+    "chunked_encode": "Parallel keyframe-aligned chunk encoding of one video",
+    "normalize_clips": "Mezzanine normalization cache",
+    "audio_stems": "Pre-render voiceover + music mixes",
+    "subtitle_overlay": "Pre-render caption overlays",
+    "media_catalog": "Index media in the probe catalog",
+    "encoder_profiles": "Calibrate encoder profiles",
+    "benchmark_suite": "Synthetic-media benchmarks",
+    "job_queue": "Inspect the watch daemon's job queue",
+    "render_farm": "Render farm worker",
+    "api_cache": "Inspect the API response cache",
+}
+
+# Library functions, resolved from their execution module on first access
+API = {
+    "text_to_speech": "text_to_speech",
+    "generate_srt": "transcribe_audio",
+    "dub_voiceover": "dub_voiceover",
+    "dub_voiceover_multi": "dub_voiceover",
+    "assemble_videos": "assemble_video",
+    "apply_voiceover": "apply_voiceover",
+    "apply_voiceover_multi": "apply_voiceover",
+    "apply_voiceover_batch": "apply_voiceover",
+    "load_batch": "apply_voiceover",
+    "add_subtitles": "add_subtitles",
+    "add_music": "add_music",
+    "process_videos": "resize_video_1x1",
+    "render_pipeline": "render_pipeline",
+    "stream_pipeline": "stream_pipeline",
+    "run_pipeline": "orchestrator",
+    "chunked_encode": "chunked_encode",
+    "StageError": "stage_error",
+}
+
+
+def __getattr__(name):
+    if name not in API:
+        raise AttributeError(f"module 'ffagent' has no attribute '{name}'")
+    value = getattr(importlib.import_module(API[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(API))
@@ -0,0 +1,31 @@
+import runpy
+import sys
+
+from ffagent import STAGES
+
+
+def usage():
+    lines = ["usage: python -m ffagent <stage> [options]   (python -m ffagent <stage> --help for a stage's options)", "", "stages:"]
+    lines.extend(f"  {name:18s} {description}" for name, description in STAGES.items())
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    """Runs one stage's command line in this process; only that stage's modules are imported."""
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if not argv or argv[0] in ("-h", "--help"):
+        print(usage())
+        return 0
+
+    stage = argv[0].replace("-", "_")
+    if stage not in STAGES:
+        print(f"Error: Unknown stage '{argv[0]}'.\n\n{usage()}")
+        return 2
+
+    sys.argv = [f"ffagent {stage}", *argv[1:]]
+    runpy.run_module(stage, run_name="__main__")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())